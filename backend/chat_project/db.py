@@ -0,0 +1,69 @@
+"""
+Environment-driven database profile.
+
+DB_ENGINE=sqlite (default)
+    SQLITE_PATH, SQLITE_JOURNAL_MODE (WAL), SQLITE_SYNCHRONOUS (NORMAL),
+    SQLITE_BUSY_TIMEOUT_MS (5000), SQLITE_TRANSACTION_MODE (IMMEDIATE).
+    Served by chat_project.sqlite_backend, which applies the pragmas on every
+    new connection and opens transactions with BEGIN IMMEDIATE. WAL lets
+    readers run alongside the single writer and busy_timeout makes
+    concurrent writers from gunicorn threads queue instead of failing.
+    Connections run PRAGMA optimize when they close (SQLITE_OPTIMIZE_ON_CLOSE,
+    on by default), so the planner has index statistics and picks the index
+    that matches a query's ORDER BY; SQLITE_ANALYSIS_LIMIT (400) bounds the
+    rows that analysis reads per index.
+
+DB_ENGINE=postgres
+    POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST, POSTGRES_PORT.
+    DB_CONN_MAX_AGE (60) keeps one connection per worker thread alive between
+    requests (Django's persistent connections; with gunicorn workers x threads
+    this is the pool) and DB_CONN_HEALTH_CHECKS re-validates it before reuse.
+    For a shared pool across processes point POSTGRES_HOST/PORT at pgbouncer
+    (docker compose --profile postgres) and set DB_DISABLE_SERVER_SIDE_CURSORS=1
+    for its transaction pooling mode.
+"""
+import os
+
+
+def _env_bool(name, default):
+    return os.environ.get(name, "1" if default else "0").lower() in ("1", "true", "yes", "on")
+
+
+def database_config(base_dir):
+    engine = os.environ.get("DB_ENGINE", "sqlite").lower()
+    if engine in ("postgres", "postgresql"):
+        return {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("POSTGRES_DB", "chat"),
+            "USER": os.environ.get("POSTGRES_USER", "chat"),
+            "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+            "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
+            "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+            "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", "60")),
+            "CONN_HEALTH_CHECKS": _env_bool("DB_CONN_HEALTH_CHECKS", True),
+            "DISABLE_SERVER_SIDE_CURSORS": _env_bool("DB_DISABLE_SERVER_SIDE_CURSORS", False),
+            "OPTIONS": {
+                "connect_timeout": int(os.environ.get("POSTGRES_CONNECT_TIMEOUT", "5")),
+            },
+        }
+    return {
+        "ENGINE": "chat_project.sqlite_backend",
+        "NAME": os.environ.get("SQLITE_PATH") or base_dir / "db.sqlite3",
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", "0")),
+        "OPTIONS": {
+            # seconds the sqlite3 driver waits on a locked database
+            "timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000")) / 1000,
+        },
+    }
+
+
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+    "temp_store": "MEMORY",
+    "analysis_limit": os.environ.get("SQLITE_ANALYSIS_LIMIT", "400"),
+}
+SQLITE_TRANSACTION_MODE = os.environ.get("SQLITE_TRANSACTION_MODE", "IMMEDIATE").upper()
+SQLITE_OPTIMIZE_ON_CLOSE = _env_bool("SQLITE_OPTIMIZE_ON_CLOSE", True)
+
@@ -1,6 +1,8 @@
 import os
 from pathlib import Path
 
+from chat_project.db import database_config
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.environ.get("DJANGO_SECRET_KEY", "dev-secret-key-change-me")
@@ -23,6 +25,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "messages_app.middleware.RequestMetricsMiddleware",
+    "messages_app.middleware.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -51,13 +55,46 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "chat_project.wsgi.application"
+ASGI_APPLICATION = "chat_project.asgi.application"
+# async twins of the list/create, mark_viewed and login views (messages_app.views);
+# set by the Dockerfile when serving asgi.py, where sync views cost a thread each
+MESSAGES_ASYNC_VIEWS = os.environ.get("MESSAGES_ASYNC_VIEWS", "0") == "1"
 
+# DB_ENGINE=sqlite|postgres, see chat_project/db.py for the knobs
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+    "default": database_config(BASE_DIR),
+}
+
+# password hashing: PASSWORD_HASHER picks the hasher for new hashes (pbkdf2 |
+# scrypt | argon2 | bcrypt; argon2/bcrypt need argon2-cffi/bcrypt installed).
+# The others stay listed so existing hashes verify; a login with an outdated
+# hash or cost rehashes it (messages_app.passwords)
+_PASSWORD_HASHERS = {
+    "pbkdf2": "messages_app.hashers.PBKDF2PasswordHasher",
+    "scrypt": "messages_app.hashers.ScryptPasswordHasher",
+    "argon2": "messages_app.hashers.Argon2PasswordHasher",
+    "bcrypt": "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
 }
+PASSWORD_HASHER = os.environ.get("PASSWORD_HASHER", "pbkdf2")
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+] + ["django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher"]
+# cost of new hashes; 0 keeps Django's default (see messages_app.hashers)
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get("PASSWORD_PBKDF2_ITERATIONS", "0"))
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get("PASSWORD_SCRYPT_WORK_FACTOR", "0"))
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get("PASSWORD_ARGON2_TIME_COST", "0"))
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get("PASSWORD_ARGON2_MEMORY_COST", "0"))
+
+# hashing pool shared by login/account views; beyond WORKERS + MAX_QUEUE
+# requests get a 503 instead of piling up on the CPU
+MESSAGES_PASSWORD_WORKERS = int(os.environ.get("MESSAGES_PASSWORD_WORKERS", "2"))
+MESSAGES_PASSWORD_MAX_QUEUE = int(os.environ.get("MESSAGES_PASSWORD_MAX_QUEUE", "32"))
+MESSAGES_PASSWORD_TIMEOUT = 10
+
+# session tokens (messages_app.tokens): lifetime in seconds and how many verified
+# tokens each process remembers (skipping the signature check, not the account query)
+MESSAGES_TOKEN_MAX_AGE = int(os.environ.get("MESSAGES_TOKEN_MAX_AGE", str(7 * 24 * 3600)))
+MESSAGES_TOKEN_CACHE_SIZE = 10000
 
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -74,13 +111,108 @@ USE_TZ = True
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# account lookups (messages_app.account_cache): locmem is a per-process LRU,
+# "file" / "db" share entries between gunicorn workers ("db" needs
+# `manage.py createcachetable`)
+ACCOUNT_CACHE_BACKEND = os.environ.get("ACCOUNT_CACHE_BACKEND", "locmem")
+_ACCOUNT_CACHE_BACKENDS = {
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "accounts"),
+    "file": ("django.core.cache.backends.filebased.FileBasedCache", os.environ.get("ACCOUNT_CACHE_LOCATION", "/tmp/4chatting-account-cache")),
+    "db": ("django.core.cache.backends.db.DatabaseCache", "account_cache"),
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "accounts": {
+        "BACKEND": _ACCOUNT_CACHE_BACKENDS[ACCOUNT_CACHE_BACKEND][0],
+        "LOCATION": _ACCOUNT_CACHE_BACKENDS[ACCOUNT_CACHE_BACKEND][1],
+        "TIMEOUT": int(os.environ.get("ACCOUNT_CACHE_TTL", "300")),
+        "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("ACCOUNT_CACHE_MAX_ENTRIES", "5000"))},
+    },
+}
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 10,
+    # bearer tokens from /api/auth/login/ (messages_app.tokens); no BasicAuthentication,
+    # which would run the password hasher on every request
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "messages_app.tokens.TokenAuthentication",
+        "rest_framework.authentication.SessionAuthentication",
+    ],
+    # token buckets for POST /api/messages/, <burst>/<period> (messages_app.throttling)
+    "DEFAULT_THROTTLE_RATES": {
+        "messages.account": os.environ.get("MESSAGES_SEND_RATE_ACCOUNT", "30/min"),
+        "messages.ip": os.environ.get("MESSAGES_SEND_RATE_IP", "120/min"),
+    },
+    # orjson-backed when installed, byte-identical to the stock JSONRenderer
+    "DEFAULT_RENDERER_CLASSES": [
+        "messages_app.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
 }
 
+# push channel (GET /api/messages/stream/); the in-memory broker only reaches
+# streams of the publishing process (clients of other workers still poll with
+# `since`). messages_app.events.DatabaseBroker reaches every process, for one
+# StreamEvent row per event written in the sender's transaction: opt in with
+# MESSAGES_EVENTS_BACKEND=messages_app.events.DatabaseBroker
+MESSAGES_EVENTS_BACKEND = os.environ.get("MESSAGES_EVENTS_BACKEND", "messages_app.events.InMemoryBroker")
+MESSAGES_EVENTS_HEARTBEAT = 15
+MESSAGES_EVENTS_MAX_AGE = 300
+# DatabaseBroker: how often each process polls for new events (seconds) and how long rows are kept
+MESSAGES_EVENTS_POLL_INTERVAL = float(os.environ.get("MESSAGES_EVENTS_POLL_INTERVAL", "0.5"))
+MESSAGES_EVENTS_RETENTION = 60
+
+# auto-reply pipeline (messages_app.replies): 'thread' | 'external' | 'inline'
+MESSAGES_REPLY_MODE = os.environ.get("MESSAGES_REPLY_MODE", "thread")
+MESSAGES_REPLY_WORKERS = int(os.environ.get("MESSAGES_REPLY_WORKERS", "2"))
+MESSAGES_REPLY_TIMEOUT = 10
+MESSAGES_REPLY_MAX_ATTEMPTS = 3
+MESSAGES_REPLY_RESPONDERS = [
+    "messages_app.responders.TemplateResponder",
+]
+
+# send backpressure (messages_app.throttling): bucket store shared by the workers
+# of a host ('sqlite') or per process ('local'); shedding starts when send
+# transactions average more than MESSAGES_SHED_WRITE_LATENCY_MS (0 = off)
+MESSAGES_THROTTLE_BACKEND = os.environ.get("MESSAGES_THROTTLE_BACKEND", "sqlite")
+MESSAGES_THROTTLE_PATH = os.environ.get("MESSAGES_THROTTLE_PATH", "")
+MESSAGES_SHED_WRITE_LATENCY_MS = float(os.environ.get("MESSAGES_SHED_WRITE_LATENCY_MS", "250"))
+MESSAGES_SHED_HALF_LIFE = 1.0
+
+# request metrics (messages_app.metrics): per-process dumps merged by /api/metrics/
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = 1.0
+
+# batched deletion and retention (messages_app.retention, manage.py compact_messages);
+# retention is off unless at least one of the two limits is set
+MESSAGES_DELETE_BATCH_SIZE = int(os.environ.get("MESSAGES_DELETE_BATCH_SIZE", "500"))
+MESSAGES_DELETE_BATCH_PAUSE = float(os.environ.get("MESSAGES_DELETE_BATCH_PAUSE", "0"))
+MESSAGES_RETENTION_KEEP_LAST = int(os.environ.get("MESSAGES_RETENTION_KEEP_LAST", "0")) or None
+MESSAGES_RETENTION_DAYS = int(os.environ.get("MESSAGES_RETENTION_DAYS", "0")) or None
+
+# archive tier (messages_app.archive, manage.py archive_messages): read messages
+# older than this many days move to ArchivedMessage; unset disables it
+MESSAGES_ARCHIVE_AFTER_DAYS = int(os.environ.get("MESSAGES_ARCHIVE_AFTER_DAYS", "0")) or None
+
+# bulk import/export (/api/messages/bulk/, /api/messages/export/)
+MESSAGES_BULK_CHUNK_SIZE = 1000
+MESSAGES_BULK_MAX_CHUNK_SIZE = 10000
+
+# batched sends (/api/messages/batch/, messages_app.sending): messages per request
+MESSAGES_BATCH_MAX_SIZE = int(os.environ.get("MESSAGES_BATCH_MAX_SIZE", "100"))
+
+# response compression (messages_app.middleware.CompressionMiddleware): GET/HEAD
+# bodies from this size up, brotli when the package is installed, else gzip
+MESSAGES_COMPRESS_MIN_BYTES = int(os.environ.get("MESSAGES_COMPRESS_MIN_BYTES", "1024"))
+MESSAGES_COMPRESS_GZIP_LEVEL = 6
+MESSAGES_COMPRESS_BROTLI_QUALITY = 4
+
 CORS_ALLOW_CREDENTIALS = True
 
 CORS_ALLOWED_ORIGINS = [
@@ -94,10 +226,12 @@ CORS_ALLOW_ALL_ORIGINS = False
 from corsheaders.defaults import default_headers, default_methods
 CORS_ALLOW_HEADERS = list(default_headers) + [
     "X-CSRFToken",
+    "If-None-Match",
+    "Idempotency-Key",
 ]
 CORS_ALLOW_METHODS = list(default_methods)
 
-CORS_EXPOSE_HEADERS = ["Content-Type", "X-CSRFToken"]
+CORS_EXPOSE_HEADERS = ["Content-Type", "X-CSRFToken", "ETag", "Last-Modified", "Retry-After", "Idempotent-Replayed"]
 
 CSRF_TRUSTED_ORIGINS = [
     "http://localhost:5173",
@@ -0,0 +1,48 @@
+"""
+Lean profile for serving the JSON API only (DJANGO_SETTINGS_MODULE=chat_project.settings_api,
+the Dockerfile's default).
+
+Same configuration as chat_project.settings minus what no /api/ request
+uses: the admin, sessions, flash messages, static files and templates (and
+with them the browsable API and session authentication; clients send the
+bearer token from /api/auth/login/). Fewer apps and middleware mean less to
+import and check before the first request and a smaller copy-on-write
+footprint per gunicorn worker (see `manage.py importtime_report`).
+
+contrib.auth and contenttypes stay: the password hashers and DRF's
+AnonymousUser come from there. Use chat_project.settings for the admin and
+`collectstatic`.
+"""
+from chat_project.settings import *  # noqa: F401,F403
+from chat_project.settings import REST_FRAMEWORK
+
+INSTALLED_APPS = [
+    "django.contrib.auth",
+    "django.contrib.contenttypes",
+
+    "rest_framework",
+    "corsheaders",
+
+    "messages_app",
+]
+
+MIDDLEWARE = [
+    "messages_app.middleware.RequestMetricsMiddleware",
+    "messages_app.middleware.CompressionMiddleware",
+    "django.middleware.security.SecurityMiddleware",
+    "corsheaders.middleware.CorsMiddleware",
+    "django.middleware.common.CommonMiddleware",
+    "django.middleware.locale.LocaleMiddleware",
+]
+
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "messages_app.tokens.TokenAuthentication",
+    ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "messages_app.renderers.FastJSONRenderer",
+    ],
+}
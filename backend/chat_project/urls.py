@@ -1,5 +1,12 @@
+from django.apps import apps
 from django.urls import path, include
 
 urlpatterns = [
     path('api/', include('messages_app.urls')),
 ]
+
+# chat_project.settings_api leaves the admin out
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns.append(path('admin/', admin.site.urls))
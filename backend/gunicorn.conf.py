@@ -0,0 +1,36 @@
+"""
+gunicorn settings shared by both server modes of the Dockerfile (read from
+the working directory; command line flags still win).
+
+preload_app: the master imports Django, the app and its URLconf once and the
+workers are forked from it, so they start serving without importing
+anything and share those pages copy-on-write. Nothing may hold a database
+connection or a started thread across the fork: the reply pool starts in
+each worker once it is initialized (post_worker_init), the password pool, the
+throttle stores and the event poller lazily, and the master closes its
+connections before forking.
+"""
+import os
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    # views, serializers and DRF are otherwise imported by each worker's first request
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+
+
+def pre_fork(server, worker):
+    if server.cfg.preload_app:
+        from django.db import connections
+        connections.close_all()
+
+
+def post_worker_init(worker):
+    # pending replies (and leases left by a previous run) are picked up at
+    # once instead of on this worker's first send
+    from messages_app import replies
+    replies.start_pool()
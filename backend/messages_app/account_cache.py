@@ -0,0 +1,104 @@
+"""
+Read-through cache for what is shown of an Account (identifier, name,
+created_at), never its credentials.
+
+The send path only needs the display name and account detail shows the same
+fields, so lookups go through the 'accounts' cache alias (settings.CACHES).
+The default locmem backend is already a size-bounded LRU (MAX_ENTRIES) with
+TTL (TIMEOUT); file and database backends can be selected with
+ACCOUNT_CACHE_BACKEND to share entries across workers. Unknown identifiers
+are cached too (briefly) so legacy ids don't hit the DB on every message.
+Writers call invalidate() after commit; with locmem the other processes keep
+the old name until the TTL runs out.
+
+Login and token authentication read the Account row itself (password_hash
+included) from the database: a password change or a deletion must be seen
+by every worker at once.
+"""
+import threading
+from collections import namedtuple
+
+from django.core.cache import InvalidCacheBackendError, caches
+from django.db import transaction
+
+from .models import Account
+
+ALIAS = 'accounts'
+KEY_PREFIX = 'account:'
+MISSING = '__missing__'
+MISSING_TIMEOUT = 30
+
+# the cached fields (AccountSerializer's)
+Profile = namedtuple('Profile', ['identifier', 'name', 'created_at'])
+
+
+def _profile(account):
+    return Profile(account.identifier, account.name, account.created_at)
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def incr(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = self.invalidations = 0
+
+
+stats = _Stats()
+
+
+def _cache():
+    try:
+        return caches[ALIAS]
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def _key(identifier):
+    return KEY_PREFIX + identifier
+
+
+def get_profile(identifier):
+    """Return the Profile of identifier's account or None, going to the DB only on a miss."""
+    if not identifier:
+        return None
+    cache = _cache()
+    key = _key(identifier)
+    cached = cache.get(key)
+    if cached is not None:
+        stats.incr('hits')
+        return None if cached == MISSING else cached
+    stats.incr('misses')
+    try:
+        profile = _profile(Account.objects.get(pk=identifier))
+    except Account.DoesNotExist:
+        cache.set(key, MISSING, MISSING_TIMEOUT)
+        return None
+    cache.set(key, profile)
+    return profile
+
+
+def invalidate(identifier):
+    """Drop the cached row once the surrounding transaction (if any) commits."""
+    def drop():
+        _cache().delete(_key(identifier))
+        stats.incr('invalidations')
+    transaction.on_commit(drop)
@@ -1,10 +1,204 @@
+"""
+Admin for browsing production message tables without a whole-table query per
+page load:
+
+- pages are keyset reads on (created_at, id), newest first (CursorChangeList),
+  instead of OFFSET pages that need an exact COUNT(*);
+- the count shown is the planner's row estimate for the whole table and a
+  COUNT capped at `count_limit` rows once filtered;
+- the account filter lists the accounts of the newest messages instead of
+  a DISTINCT over Message.user;
+- search goes through the full-text index (messages_app.search);
+- the date drill-down probes each candidate year/month/day with an indexed
+  EXISTS (templatetags/messages_admin.py) instead of a DISTINCT over dates.
+
+Edits and deletes made here rebuild the ConversationSummary of every account
+they touched, so the API's counters and ETags follow.
+"""
 from django.contrib import admin
-from .models import Message
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Max, Q
+
+from . import search, summaries
+from .models import ConversationSummary, Message
+from .pagination import decode_cursor, encode_cursor
+
+CURSOR_VAR = 'cursor'
+
+
+def estimated_rows(model, using):
+    """Row count of model's table from the planner statistics, None without them."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # an index's stat starts with its row count (ANALYZE / PRAGMA optimize);
+            # partial indexes hold fewer rows than the table, hence max()
+            try:
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [table])
+            except DatabaseError:  # never analyzed: no sqlite_stat1 at all
+                return None
+            counts = [int(stat.split()[0]) for stat, in cursor.fetchall() if stat]
+            return max(counts) if counts else None
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+    return None
+
+
+class CursorChangeList(ChangeList):
+    """
+    Changelist paged with a (created_at, id) cursor, newest first: every page
+    is one LIMITed range read on an index, whatever its depth. Sorting by
+    other columns is off (MessageAdmin.sortable_by) since it would need a
+    whole-table sort.
+    """
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR) or None
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters(self, request):
+        filter_specs, has_filters, lookup_params, may_have_duplicates, has_active_filters = super().get_filters(request)
+        # the date drill-down's range (created_at__gte/__lt) is applied by
+        # get_queryset() so the probing tag can get the list without it
+        field = self.date_hierarchy
+        self.date_range = (lookup_params.pop(f"{field}__gte", None), lookup_params.pop(f"{field}__lt", None)) \
+            if field else (None, None)
+        return filter_specs, has_filters, lookup_params, may_have_duplicates, has_active_filters
+
+    def get_queryset(self, request, *args, **kwargs):
+        queryset = super().get_queryset(request, *args, **kwargs)
+        self.undated_queryset = queryset
+        lower, upper = self.date_range
+        if lower is not None:
+            queryset = queryset.filter(**{f"{self.date_hierarchy}__gte": lower})
+        if upper is not None:
+            queryset = queryset.filter(**{f"{self.date_hierarchy}__lt": upper})
+        return queryset
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # filter, search and date links start over at the newest page
+        new_params = new_params or {}
+        remove = list(remove or [])
+        if CURSOR_VAR not in new_params:
+            remove.append(CURSOR_VAR)
+        return super().get_query_string(new_params, remove)
+
+    def get_ordering(self, request, queryset):
+        return ['-created_at', '-pk']
+
+    def get_results(self, request):
+        queryset = self.queryset
+        if self.cursor:
+            try:
+                created_at, pk = decode_cursor(self.cursor)
+            except (TypeError, ValueError, UnicodeError):
+                raise IncorrectLookupParameters('invalid cursor')
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+        rows = list(queryset[:self.list_per_page + 1])
+        self.result_list = rows[:self.list_per_page]
+        self.next_cursor = encode_cursor(self.result_list[-1]) if len(rows) > self.list_per_page else None
+
+        self.result_count, self.result_count_label = self.model_admin.estimated_count(self.queryset)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = bool(self.cursor or self.next_cursor)
+        self.paginator = None
+
+    @property
+    def first_page_url(self):
+        return self.get_query_string()
+
+    @property
+    def next_page_url(self):
+        return self.get_query_string({CURSOR_VAR: self.next_cursor}) if self.next_cursor else None
+
+
+class AccountFilter(admin.SimpleListFilter):
+    """
+    The accounts behind the newest `recent_messages` messages (a bounded walk
+    of the (created_at, id) index), with their totals from ConversationSummary.
+    """
+    title = 'conta'
+    parameter_name = 'user'
+    max_accounts = 30
+    recent_messages = 500
+
+    def lookups(self, request, model_admin):
+        recent = Message.objects.order_by('-created_at', '-id').values_list('user', flat=True)
+        users = list(dict.fromkeys(recent[:self.recent_messages]))[:self.max_accounts]
+        totals = dict(ConversationSummary.objects.filter(user__in=users).values_list('user', 'total_count'))
+        choices = [(user, f"{user} ({totals[user]})" if user in totals else user) for user in users]
+        # an account picked from a link or typed into the URL stays selectable
+        if self.value() and self.value() not in {user for user, _ in choices}:
+            choices.insert(0, (self.value(), self.value()))
+        return choices
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(user=self.value())
+        return queryset
+
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "direction", "created_at", "viewed")
-    list_filter = ("user", "direction", "viewed", "created_at")
+    list_filter = (AccountFilter, "direction", "viewed")
+    date_hierarchy = "created_at"
     search_fields = ("text", "response_text")
+    search_help_text = "Busca por palavras (prefixo) no texto e na resposta, pelo índice de texto completo."
     readonly_fields = ("created_at",)
-    ordering = ("-created_at",)
+    ordering = ("-created_at", "-id")
+    sortable_by = ()
+    show_full_result_count = False
+    list_per_page = 100
+    # filtered lists are counted up to this many rows
+    count_limit = 1000
+
+    def get_changelist(self, request, **kwargs):
+        return CursorChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search.matching(queryset, search_term), False
+
+    def estimated_count(self, queryset):
+        """(count, label): the table estimate when unfiltered, else a count capped at count_limit."""
+        if not queryset.query.has_filters():
+            estimate = estimated_rows(queryset.model, queryset.db)
+            if estimate is None:
+                # no statistics yet: the highest id is a cheap upper bound
+                estimate = queryset.aggregate(top=Max('pk'))['top'] or 0
+            return estimate, f"≈ {estimate}"
+        count = queryset.order_by()[:self.count_limit + 1].count()
+        if count > self.count_limit:
+            return self.count_limit, f"{self.count_limit}+"
+        return count, str(count)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # moving a message to another account changes both summaries
+        for user in {obj.user, form.initial.get('user') if change else None} - {None}:
+            summaries.rebuild(user)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        summaries.rebuild(obj.user)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic(using=queryset.db):
+            users = set(queryset.order_by().values_list('user', flat=True).distinct())
+            super().delete_queryset(request, queryset)
+            for user in users:
+                summaries.rebuild(user)
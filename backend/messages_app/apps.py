@@ -1,5 +1,24 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(sender, using, **kwargs):
+    from django.db import connections
+    from . import search
+    search.install(connections[using])
+
 
 class MessagesAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "messages_app"
+
+    def ready(self):
+        post_migrate.connect(ensure_search_index, sender=self)
+        # runserver's autoreloader child serves the requests; gunicorn workers
+        # start their pool from gunicorn.conf.py (post_worker_init)
+        if os.environ.get('RUN_MAIN') == 'true' and 'runserver' in sys.argv:
+            from . import replies
+            replies.start_pool()
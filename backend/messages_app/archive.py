@@ -0,0 +1,236 @@
+"""
+Archive tier for old messages.
+
+`manage.py archive_messages` moves read messages older than
+MESSAGES_ARCHIVE_AFTER_DAYS from Message into ArchivedMessage (same ids and
+columns) in short batches, so the hot table and its indexes stay the size of
+the recent working set. ConversationSummary.archived_count says whether an
+account has anything archived; only those accounts pay for reading the
+second table.
+
+Reads go through TieredQuerySet: the same query applied to each tier and
+merged in order, with just enough of the QuerySet API (filter, order_by,
+count, slicing, values, iterator) for the paginators, search and export.
+Keyset and delta pages stay two LIMITed index range scans, whatever the size
+of the archive; page-number pages count each side of the horizon and pass
+their OFFSET down to the one table that holds the page.
+"""
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateTimeField, F, Max, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from . import summaries
+from .models import ArchivedMessage, ConversationSummary, Message
+
+FIELDS = ['id', 'user', 'user_name', 'text', 'response_text', 'direction', 'viewed', 'created_at']
+
+
+class TieredQuerySet:
+    """
+    Read-only union of one query over several message tables, hot tier first.
+    Rows of every tier must be ordered the same way (all ascending or all
+    descending), which the merge relies on.
+
+    `horizon` is the newest created_at found in the tiers after the first.
+    Newest-first slices that the hot tier fills with newer rows on its own
+    then never query the archive, so recent pages cost what they did before.
+    """
+    def __init__(self, querysets, horizon=None):
+        self.querysets = list(querysets)
+        self.horizon = horizon
+
+    def _apply(self, method, *args, **kwargs):
+        return TieredQuerySet((getattr(qs, method)(*args, **kwargs) for qs in self.querysets), self.horizon)
+
+    def filter(self, *args, **kwargs):
+        return self._apply('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._apply('exclude', *args, **kwargs)
+
+    def order_by(self, *fields):
+        return self._apply('order_by', *fields)
+
+    def values(self, *fields):
+        return self._apply('values', *fields)
+
+    def values_list(self, *fields, **kwargs):
+        return self._apply('values_list', *fields, **kwargs)
+
+    @property
+    def model(self):
+        return self.querysets[0].model
+
+    @property
+    def db(self):
+        return self.querysets[0].db
+
+    @property
+    def ordered(self):
+        return all(qs.ordered for qs in self.querysets)
+
+    def count(self):
+        return sum(qs.count() for qs in self.querysets)
+
+    def exists(self):
+        return any(qs.exists() for qs in self.querysets)
+
+    def _ordering(self):
+        qs = self.querysets[0]
+        fields = list(qs.query.order_by) or list(qs.model._meta.ordering)
+        descending = {f.startswith('-') for f in fields}
+        if len(descending) > 1:
+            raise ValueError(f"mixed ordering directions can't be merged: {fields}")
+        return [f.lstrip('-') for f in fields], descending == {True}
+
+    def _key(self, names):
+        # plain values_list() rows are tuples in the order of the selected fields
+        selected = list(getattr(self.querysets[0], '_fields', None) or ())
+
+        def key(row):
+            if isinstance(row, dict):
+                values = (row[n] for n in names)
+            elif isinstance(row, tuple) and not hasattr(row, '_fields'):
+                values = (row[selected.index(n)] for n in names)
+            else:
+                values = (getattr(row, n) for n in names)
+            # None sorts below everything instead of failing the comparison
+            return tuple((v is not None, v) for v in values)
+        return key
+
+    def _merge(self, iterables):
+        names, reverse = self._ordering()
+        return heapq.merge(*iterables, key=self._key(names), reverse=reverse)
+
+    def iterator(self, chunk_size=None):
+        return self._merge(qs.iterator(chunk_size=chunk_size) for qs in self.querysets)
+
+    def __iter__(self):
+        return self._merge(self.querysets)
+
+    def __getitem__(self, k):
+        if isinstance(k, int):
+            return self[k:k + 1][0]
+        if k.step is not None:
+            raise ValueError('step is not supported')
+        start = k.start or 0
+        if k.stop is None:
+            return list(islice(self, start, None))
+        if k.stop <= start:
+            return []
+        names, reverse = self._ordering()
+        by_date = self.horizon is not None and names[0] == 'created_at' and len(self.querysets) == 2
+        if by_date and start:
+            return self._slice_runs(self._runs(reverse), start, k.stop)
+        # every tier contributes at most `stop` rows to the merged prefix
+        parts = [qs[:k.stop] for qs in self.querysets]
+        if by_date and reverse:
+            hot = parts[0] = list(parts[0])
+            if len(hot) == k.stop and self._key(names[:1])(hot[-1]) > ((True, self.horizon),):
+                return hot[start:]
+        return list(islice(self._merge(parts), start, k.stop))
+
+    def _runs(self, reverse):
+        """
+        The merged order as consecutive (count, querysets) runs: hot rows newer
+        than the horizon come after (before, newest first) every archived row;
+        the older ones, usually none (unread messages stay hot), interleave
+        with the archive. The last run's count is not needed and left None.
+        """
+        hot, archived = self.querysets
+        newer = hot.filter(created_at__gt=self.horizon)
+        older = hot.filter(created_at__lte=self.horizon)
+        older_count = older.count()
+        mixed = [archived, older] if older_count else [archived]
+        if reverse:
+            return [(newer.count(), [newer]), (None, mixed)]
+        return [(older_count + archived.count(), mixed), (None, [newer])]
+
+    def _slice_runs(self, runs, start, stop):
+        """Rows [start:stop) of the merged order; OFFSET goes to the database within a one-table run."""
+        rows = []
+        offset = 0
+        for count, querysets in runs:
+            lo, hi = max(start - offset, 0), stop - offset if count is None else min(stop - offset, count)
+            if lo < hi:
+                if len(querysets) == 1:
+                    rows += querysets[0][lo:hi]
+                else:
+                    rows += islice(self._merge([qs[:hi] for qs in querysets]), lo, hi)
+            if count is None:
+                break
+            offset += count
+            if offset >= stop:
+                break
+        return rows
+
+
+def tiered(build, archived=True, horizon=None):
+    """
+    build(model) -> queryset, applied to Message and, when `archived` (the
+    account(s) involved have archived messages), to ArchivedMessage too.
+    """
+    if not archived:
+        return build(Message)
+    return TieredQuerySet([build(Message), build(ArchivedMessage)], horizon)
+
+
+def for_user(user, summary=None):
+    """Every message of `user` across tiers, as told by its summary row."""
+    if summary is None:
+        summary = ConversationSummary.objects.filter(user=user).first()
+    archived = summary is not None and summary.archived_count > 0
+    return tiered(lambda model: model.objects.filter(user=user), archived,
+                  summary.archived_until if archived else None)
+
+
+# moving rows ------------------------------------------------------------------
+
+def after_days():
+    return getattr(settings, 'MESSAGES_ARCHIVE_AFTER_DAYS', None)
+
+
+def archive_batch(user, cutoff, ceiling, size):
+    """
+    Move up to `size` read messages of `user` created before `cutoff` into
+    the archive, in one transaction. Returns the number moved.
+    """
+    base = Message.objects.filter(user=user, viewed=True, created_at__lt=cutoff, id__lt=ceiling)
+    with transaction.atomic():
+        rows = list(base.order_by('id').values(*FIELDS)[:size])
+        if not rows:
+            return 0
+        ArchivedMessage.objects.bulk_create([ArchivedMessage(**row) for row in rows])
+        # archived_count is bumped in the same transaction: readers switch to
+        # the tiered path exactly when the rows move
+        # (updated_at is left alone: the conversation itself did not change)
+        newest = Value(max(row['created_at'] for row in rows), output_field=DateTimeField())
+        ConversationSummary.objects.filter(user=user).update(
+            archived_count=F('archived_count') + len(rows),
+            archived_until=Greatest(Coalesce('archived_until', newest), newest),
+        )
+        Message.objects.filter(id__in=[row['id'] for row in rows]).delete()
+    return len(rows)
+
+
+def archive_user(user, cutoff, size=500, dry_run=False):
+    """Archive everything of `user` eligible before `cutoff`; returns the number of messages."""
+    # never move the newest row of the table: SQLite hands out max(id) + 1,
+    # so keeping it in place guarantees new ids never collide with archived ones
+    ceiling = Message.objects.aggregate(ceiling=Max('id'))['ceiling']
+    if ceiling is None:
+        return 0
+    if dry_run:
+        return Message.objects.filter(user=user, viewed=True, created_at__lt=cutoff, id__lt=ceiling).count()
+    if not ConversationSummary.objects.filter(user=user).exists():
+        summaries.rebuild(user)
+    moved = 0
+    while True:
+        n = archive_batch(user, cutoff, ceiling, size)
+        if not n:
+            return moved
+        moved += n
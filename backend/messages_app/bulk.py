@@ -0,0 +1,163 @@
+"""
+JSON Lines import/export of message history.
+
+Both directions work row-by-row with bounded buffers: export walks the table
+with QuerySet.iterator(chunk_size) over .values() rows (under ASGI, with
+keyset chunks read in a thread each, see aiter_export_lines), import reads
+the request stream line by line and flushes bulk_create() batches. Imported rows
+never get auto-replies (no ReplyJob is created).
+"""
+import json
+from datetime import timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Message
+from . import summaries
+
+EXPORT_FIELDS = ['id', 'user', 'user_name', 'text', 'response_text', 'direction', 'viewed', 'created_at']
+DIRECTIONS = {'sent', 'received'}
+_BOOLEAN = serializers.BooleanField()
+MAX_REPORTED_ERRORS = 20
+
+
+def chunk_size_from(raw, default=None):
+    default = default or getattr(settings, 'MESSAGES_BULK_CHUNK_SIZE', 1000)
+    limit = getattr(settings, 'MESSAGES_BULK_MAX_CHUNK_SIZE', 10000)
+    try:
+        size = int(raw) if raw else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, limit))
+
+
+def iter_export_lines(queryset, chunk_size):
+    encoder = JSONEncoder(ensure_ascii=False)
+    rows = queryset.order_by('id').values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+async def aiter_export_lines(queryset, chunk_size):
+    """
+    iter_export_lines() as an async iterator, for StreamingHttpResponse under
+    ASGI: Django drains a sync iterator into a list before sending it there.
+    Each chunk is its own `id > last` read, so no cursor stays open between
+    awaits.
+    """
+    encoder = JSONEncoder(ensure_ascii=False)
+    rows = queryset.order_by('id').values(*EXPORT_FIELDS)
+    last = None
+    while True:
+        page = rows if last is None else rows.filter(id__gt=last)
+        # slicing a TieredQuerySet already queries, so it runs in the thread too
+        chunk = await sync_to_async(lambda: list(page[:chunk_size]))()
+        if not chunk:
+            return
+        yield ''.join(encoder.encode(row) + '\n' for row in chunk)
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1]['id']
+
+
+def _build(row):
+    if not isinstance(row, dict):
+        raise ValueError('expected a JSON object')
+    user = str(row.get('user') or '').strip()
+    if not user:
+        raise ValueError('user is required')
+    direction = row.get('direction') or 'sent'
+    if direction not in DIRECTIONS:
+        raise ValueError(f"invalid direction {direction!r}")
+    created_at = timezone.now()
+    if row.get('created_at'):
+        created_at = parse_datetime(str(row['created_at']))
+        if created_at is None:
+            raise ValueError(f"invalid created_at {row['created_at']!r}")
+        if timezone.is_naive(created_at):
+            created_at = timezone.make_aware(created_at, dt_timezone.utc)
+    viewed = row.get('viewed')
+    if viewed in (None, ''):
+        viewed = False
+    else:
+        # same spellings the API accepts ("false", "0", 0, ...); bool("false") is True
+        try:
+            viewed = _BOOLEAN.to_internal_value(viewed)
+        except serializers.ValidationError:
+            raise ValueError(f"invalid viewed {viewed!r}")
+    return Message(
+        user=user,
+        user_name=row.get('user_name') or '',
+        text=row.get('text') or '',
+        response_text=row.get('response_text') or '',
+        direction=direction,
+        viewed=viewed,
+        created_at=created_at,
+    )
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.skipped = 0
+        self.errors = []
+
+    def error(self, line_no, exc):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_no, 'error': str(exc)})
+
+    def as_dict(self):
+        return {'created': self.created, 'skipped': self.skipped, 'errors': self.errors}
+
+
+def import_rows(rows, chunk_size, allowed=None):
+    """
+    rows: iterable of (line_no, dict | raw JSON bytes/str). Invalid rows are
+    skipped and reported, and so are rows of accounts `allowed(user)` refuses
+    (messages_app.permissions); every full batch is committed in its own
+    transaction so a failure late in a huge file keeps the earlier batches.
+    """
+    result = ImportResult()
+    batch = []
+
+    def flush():
+        with transaction.atomic():
+            Message.objects.bulk_create(batch, batch_size=chunk_size)
+            by_user = {}
+            for message in batch:
+                by_user.setdefault(message.user, []).append(message)
+            for user, messages in by_user.items():
+                summaries.record_imported(user, messages)
+        result.created += len(batch)
+        batch.clear()
+
+    for line_no, row in rows:
+        if isinstance(row, (bytes, str)):
+            if not row.strip():
+                continue
+            try:
+                row = json.loads(row)
+            except ValueError as exc:
+                result.error(line_no, exc)
+                continue
+        try:
+            message = _build(row)
+        except ValueError as exc:
+            result.error(line_no, exc)
+            continue
+        if allowed is not None and not allowed(message.user):
+            result.error(line_no, f"account {message.user!r} requires its token")
+            continue
+        batch.append(message)
+        if len(batch) >= chunk_size:
+            flush()
+    if batch:
+        flush()
+    return result
@@ -0,0 +1,245 @@
+"""
+Pub/sub used to push message events to connected clients.
+
+Publishers (sync views, reply workers, any thread) call publish(); the SSE
+stream view subscribes from the event loop. The backend is chosen by the
+MESSAGES_EVENTS_BACKEND setting (dotted path to a BaseBroker subclass):
+
+    InMemoryBroker  -> the publishing process's streams only (the default;
+                       other processes' clients get their updates by
+                       polling with `since`)
+    DatabaseBroker  -> any number of processes sharing the database (gunicorn
+                       workers, `manage.py run_reply_worker`), at the cost of
+                       one row per event
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import StreamEvent
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'messages_app.events.InMemoryBroker'
+
+MESSAGE_CREATED = 'message.created'
+MESSAGES_VIEWED = 'messages.viewed'
+HISTORY_DELETED = 'history.deleted'
+
+
+def user_channel(user):
+    return f"user:{user}"
+
+
+class BaseBroker:
+    # publish() is called inside the publisher's transaction instead of
+    # after its commit (the event is written along with what it announces)
+    transactional = False
+
+    def publish(self, channel, event):
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        """Return a Subscription bound to the running event loop."""
+        raise NotImplementedError
+
+
+class Subscription:
+    """
+    Bounded asyncio queue fed from any thread. When a slow client falls
+    behind, the oldest events are dropped rather than blocking publishers.
+    """
+    def __init__(self, broker, channel, maxsize=100):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.closed = False
+
+    def offer(self, event):
+        if self.closed:
+            return
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.broker.unsubscribe(self)
+
+
+class InMemoryBroker(BaseBroker):
+    """Single-process broker: fine for one ASGI worker and for tests."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, event):
+        return self.deliver(channel, event)
+
+    def deliver(self, channel, event):
+        """Hand event to this process's subscribers of channel."""
+        with self._lock:
+            targets = list(self._subscribers.get(channel, ()))
+        for sub in targets:
+            try:
+                sub.offer(event)
+            except RuntimeError:
+                # loop already closed; the stream is gone
+                sub.close()
+        return len(targets)
+
+    def subscribe(self, channel):
+        sub = Subscription(self, channel)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.channel)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.channel]
+
+
+class DatabaseBroker(InMemoryBroker):
+    """
+    Cross-process broker over the StreamEvent table. publish() inserts a row
+    in the publisher's own transaction, so an event adds an INSERT but no
+    write transaction of its own; in each process with open streams a poller
+    thread reads the rows past its last id every MESSAGES_EVENTS_POLL_INTERVAL
+    seconds and delivers them to the local subscribers, whichever process
+    published them. The poller starts with the first stream, after the fork,
+    and stays off the database while the process has no stream open.
+    """
+    transactional = True
+
+    # ids may become visible out of order (concurrent inserts on Postgres):
+    # the poller only moves past rows older than this
+    settle_seconds = 5
+    batch_size = 500
+
+    def __init__(self):
+        super().__init__()
+        self.poll_interval = getattr(settings, 'MESSAGES_EVENTS_POLL_INTERVAL', 0.5)
+        self.retention = getattr(settings, 'MESSAGES_EVENTS_RETENTION', 60)
+        self._floor = None
+        self._delivered = set()
+        self._poller = None
+        self._last_prune = 0.0
+
+    def publish(self, channel, event):
+        try:
+            # savepoint: a failed insert must not undo the publisher's writes;
+            # clients catch up through their `since` polling
+            with transaction.atomic():
+                StreamEvent.objects.create(channel=channel, payload=json.dumps(event, cls=JSONEncoder))
+        except DatabaseError:
+            logger.exception("could not publish %s on %s", event.get('type'), channel)
+        transaction.on_commit(self.maybe_prune)
+
+    def maybe_prune(self):
+        now = time.monotonic()
+        if now - self._last_prune < self.retention:
+            return
+        self._last_prune = now
+        StreamEvent.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=self.retention)).delete()
+
+    def subscribe(self, channel):
+        sub = super().subscribe(channel)
+        with self._lock:
+            if self._poller is None:
+                self._poller = threading.Thread(target=self.run, name='events-poller', daemon=True)
+                self._poller.start()
+        return sub
+
+    def run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("event poll failed")
+            finally:
+                close_old_connections()
+            time.sleep(self.poll_interval)
+
+    def poll(self):
+        """Deliver the rows published since the last poll; returns how many."""
+        with self._lock:
+            idle = not self._subscribers
+        if idle:
+            # nobody to deliver to: no query; the next stream starts from the newest row
+            self._floor = None
+            return 0
+        if self._floor is None:
+            self._floor = StreamEvent.objects.aggregate(top=Max('pk'))['top'] or 0
+            self._delivered.clear()
+            return 0
+        rows = (StreamEvent.objects.filter(pk__gt=self._floor).order_by('pk')
+                .values_list('pk', 'channel', 'payload', 'created_at')[:self.batch_size])
+        settled = timezone.now() - timedelta(seconds=self.settle_seconds)
+        delivered = 0
+        moving = True
+        for pk, channel, payload, created_at in rows:
+            if pk not in self._delivered:
+                self._delivered.add(pk)
+                self.deliver(channel, json.loads(payload))
+                delivered += 1
+            if moving and created_at < settled:
+                self._floor = pk
+            else:
+                moving = False
+        self._delivered = {pk for pk in self._delivered if pk > self._floor}
+        return delivered
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'MESSAGES_EVENTS_BACKEND', DEFAULT_BACKEND)
+                _broker = import_string(path)()
+    return _broker
+
+
+def reset_broker():
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def publish(user, event_type, **payload):
+    """
+    Publish an event for user once the current transaction commits; a
+    transactional broker writes it in that transaction instead.
+    """
+    event = {'type': event_type, 'user': user, **payload}
+    broker = get_broker()
+    if broker.transactional:
+        broker.publish(user_channel(user), event)
+    else:
+        transaction.on_commit(lambda: broker.publish(user_channel(user), event))
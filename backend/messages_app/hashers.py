@@ -0,0 +1,43 @@
+"""
+Password hashers whose cost comes from the settings.
+
+Same algorithm names and encodings as Django's own hashers, so existing
+hashes keep verifying; only the work factor for new hashes (and the
+must_update() check that drives rehash-on-login) follows the settings:
+
+PASSWORD_PBKDF2_ITERATIONS     pbkdf2_sha256 iterations
+PASSWORD_SCRYPT_WORK_FACTOR    scrypt N (power of two)
+PASSWORD_ARGON2_TIME_COST      argon2id passes
+PASSWORD_ARGON2_MEMORY_COST    argon2id memory in KiB
+
+Unset (0) keeps Django's default for that hasher.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+def _cost(name, default):
+    return getattr(settings, f"PASSWORD_{name}", None) or default
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return _cost('PBKDF2_ITERATIONS', hashers.PBKDF2PasswordHasher.iterations)
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return _cost('SCRYPT_WORK_FACTOR', hashers.ScryptPasswordHasher.work_factor)
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Needs argon2-cffi (optional dependency)."""
+    @property
+    def time_cost(self):
+        return _cost('ARGON2_TIME_COST', hashers.Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return _cost('ARGON2_MEMORY_COST', hashers.Argon2PasswordHasher.memory_cost)
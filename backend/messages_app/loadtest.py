@@ -0,0 +1,79 @@
+"""
+Small helpers shared by the load-test / benchmark management commands:
+run a callable from N threads and summarize the latencies.
+"""
+import threading
+import time
+
+# settings overrides that turn send throttling and load shedding off, which
+# would otherwise answer most of a synthetic load with 429/503
+NO_BACKPRESSURE = {'MESSAGES_THROTTLE_BACKEND': 'off', 'MESSAGES_SHED_WRITE_LATENCY_MS': 0}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies_ms, elapsed_s, errors=0):
+    values = sorted(latencies_ms)
+    count = len(values)
+    return {
+        'requests': count,
+        'errors': errors,
+        'elapsed_s': round(elapsed_s, 4),
+        'throughput_rps': round(count / elapsed_s, 2) if elapsed_s else 0.0,
+        'mean_ms': round(sum(values) / count, 3) if count else 0.0,
+        'p50_ms': round(percentile(values, 50), 3),
+        'p95_ms': round(percentile(values, 95), 3),
+        'p99_ms': round(percentile(values, 99), 3),
+        'max_ms': round(values[-1], 3) if values else 0.0,
+    }
+
+
+def run_threads(threads, iterations, make_worker):
+    """
+    Start `threads` threads; each calls make_worker(thread_index) once to get
+    a callable and then invokes it `iterations` times with the iteration
+    index. The callable returns True on success. Returns (latencies_ms,
+    errors, elapsed_s) over all threads.
+    """
+    from django.db import connections
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    start_gate = threading.Barrier(threads + 1)
+
+    def body(index):
+        fn = make_worker(index)
+        local, failed = [], 0
+        start_gate.wait()
+        try:
+            for i in range(iterations):
+                t0 = time.perf_counter()
+                try:
+                    ok = fn(i)
+                except Exception:
+                    ok = False
+                local.append((time.perf_counter() - t0) * 1000)
+                if not ok:
+                    failed += 1
+        finally:
+            connections.close_all()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    pool = [threading.Thread(target=body, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    start_gate.wait()
+    t0 = time.perf_counter()
+    for t in pool:
+        t.join()
+    return latencies, errors[0], time.perf_counter() - t0
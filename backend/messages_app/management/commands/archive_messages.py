@@ -0,0 +1,43 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from messages_app import archive, retention
+from messages_app.models import Message
+
+
+class Command(BaseCommand):
+    help = ("Move read messages older than MESSAGES_ARCHIVE_AFTER_DAYS into the archive tier "
+            "in short batches, keeping the hot Message table small. Meant for cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='override MESSAGES_ARCHIVE_AFTER_DAYS')
+        parser.add_argument('--users', help='comma separated accounts (default: every account with messages)')
+        parser.add_argument('--batch-size', type=int, default=None, help='override MESSAGES_DELETE_BATCH_SIZE')
+        parser.add_argument('--dry-run', action='store_true', help='only count what would move')
+
+    def handle(self, *args, **opts):
+        days = opts['days'] if opts['days'] is not None else archive.after_days()
+        if not days:
+            raise CommandError('archiving is disabled: set MESSAGES_ARCHIVE_AFTER_DAYS or pass --days')
+        cutoff = timezone.now() - timedelta(days=days)
+        if opts['users']:
+            users = [u.strip() for u in opts['users'].split(',') if u.strip()]
+        else:
+            users = list(Message.objects.order_by('user').values_list('user', flat=True).distinct())
+        size = opts['batch_size'] or retention.batch_size()
+
+        moved = {}
+        for user in users:
+            n = archive.archive_user(user, cutoff, size=size, dry_run=opts['dry_run'])
+            if n:
+                moved[user] = n
+        self.stdout.write(json.dumps({
+            'days': days,
+            'cutoff': cutoff.isoformat(),
+            'dry_run': opts['dry_run'],
+            'archivable' if opts['dry_run'] else 'archived': moved,
+            'total': sum(moved.values()),
+        }, indent=2))
@@ -0,0 +1,226 @@
+import json
+import random
+import subprocess
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from messages_app import loadtest, summaries
+from messages_app.models import Account, ConversationSummary, Message
+
+USER_PREFIX = 'bench-'
+PASSWORD = 'bench-password'
+DEFAULT_MIX = 'list:50,send:20,mark_viewed:15,login:10,delete_history:5'
+
+
+class Command(BaseCommand):
+    help = ("Seed N accounts x M messages and drive a mixed workload through the API in-process. "
+            "Reports p50/p95/p99 latency, throughput and DB queries per endpoint as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=10)
+        parser.add_argument('--messages', type=int, default=1000, help='seeded messages per account')
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=200, help='requests per thread')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help='weighted operations, e.g. "list:50,send:20"')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--reply-mode', default='external',
+                            help="MESSAGES_REPLY_MODE during the run ('external' keeps reply writes out of the numbers)")
+        parser.add_argument('--output', help='write the JSON report here')
+        parser.add_argument('--compare', help='previous JSON report to diff against')
+        parser.add_argument('--keep', action='store_true', help='keep the seeded data')
+        parser.add_argument('--backpressure', action='store_true',
+                            help='keep send throttling and load shedding on during the run')
+
+    def handle(self, *args, **opts):
+        mix = self.parse_mix(opts['mix'])
+        caches['accounts'].clear()
+        self.cleanup()
+        seed_s = self.seed(opts['accounts'], opts['messages'])
+        try:
+            backpressure = {} if opts['backpressure'] else loadtest.NO_BACKPRESSURE
+            with override_settings(MESSAGES_REPLY_MODE=opts['reply_mode'], **backpressure):
+                report = self.run(mix, opts)
+        finally:
+            if not opts['keep']:
+                self.cleanup()
+        report['meta']['seed_s'] = round(seed_s, 3)
+
+        text = json.dumps(report, indent=2)
+        if opts['output']:
+            with open(opts['output'], 'w') as fh:
+                fh.write(text + '\n')
+        self.stdout.write(text)
+        if opts['compare']:
+            with open(opts['compare']) as fh:
+                self.stdout.write(self.compare(json.load(fh), report))
+
+    def parse_mix(self, raw):
+        mix = []
+        for part in raw.split(','):
+            name, _, weight = part.partition(':')
+            name = name.strip()
+            if name not in self.operations():
+                raise CommandError(f"unknown operation {name!r}; choose from {sorted(self.operations())}")
+            mix.append((name, int(weight or 1)))
+        return mix
+
+    def operations(self):
+        return {
+            'list': self.op_list,
+            'send': self.op_send,
+            'mark_viewed': self.op_mark_viewed,
+            'login': self.op_login,
+            'delete_history': self.op_delete_history,
+        }
+
+    def seed(self, accounts, per_account):
+        t0 = time.perf_counter()
+        now = timezone.now()
+        pwd_hash = make_password(PASSWORD)
+        Account.objects.bulk_create([
+            # every other account has a password so login exercises both paths
+            Account(identifier=f"{USER_PREFIX}{n}", name=f"Bench {n}",
+                    password_hash=pwd_hash if n % 2 else '')
+            for n in range(accounts)
+        ])
+        for n in range(accounts):
+            user = f"{USER_PREFIX}{n}"
+            batch = [
+                Message(user=user, user_name=f"Bench {n}", text=f"seed message {i} about order {i % 97}",
+                        direction='sent' if i % 2 == 0 else 'received', viewed=i < per_account - 10,
+                        created_at=now - timedelta(seconds=per_account - i))
+                for i in range(per_account)
+            ]
+            with transaction.atomic():
+                Message.objects.bulk_create(batch, batch_size=1000)
+                summaries.rebuild(user)
+        return time.perf_counter() - t0
+
+    def run(self, mix, opts):
+        ops = self.operations()
+        names = [name for name, _ in mix]
+        weights = [w for _, w in mix]
+        samples = []
+
+        def make_worker(index):
+            client = Client()
+            rng = random.Random(opts['seed'] * 1000 + index)
+            local = []
+            samples.append(local)
+
+            def step(i):
+                name = rng.choices(names, weights)[0]
+                user = f"{USER_PREFIX}{rng.randrange(opts['accounts'])}"
+                queries = [0]
+
+                def count(execute, sql, params, many, context):
+                    queries[0] += 1
+                    return execute(sql, params, many, context)
+
+                with connection.execute_wrapper(count):
+                    t0 = time.perf_counter()
+                    resp = ops[name](client, user, rng, opts)
+                    elapsed = (time.perf_counter() - t0) * 1000
+                ok = resp.status_code < 400
+                local.append((name, elapsed, queries[0], ok, len(resp.content)))
+                return ok
+            return step
+
+        latencies, errors, elapsed = loadtest.run_threads(opts['threads'], opts['requests'], make_worker)
+
+        endpoints = {}
+        rows = [row for local in samples for row in local]
+        for name in names:
+            picked = [r for r in rows if r[0] == name]
+            if not picked:
+                continue
+            queries = [r[2] for r in picked]
+            stats = loadtest.summarize([r[1] for r in picked], elapsed, sum(1 for r in picked if not r[3]))
+            stats['queries_mean'] = round(sum(queries) / len(queries), 2)
+            stats['queries_max'] = max(queries)
+            stats['response_bytes_mean'] = round(sum(r[4] for r in picked) / len(picked), 1)
+            endpoints[name] = stats
+
+        return {
+            'meta': {
+                'commit': self.git_commit(),
+                'timestamp': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'accounts': opts['accounts'],
+                'messages_per_account': opts['messages'],
+                'threads': opts['threads'],
+                'requests_per_thread': opts['requests'],
+                'mix': opts['mix'],
+                'debug': settings.DEBUG,
+            },
+            'overall': loadtest.summarize(latencies, elapsed, errors),
+            'endpoints': endpoints,
+        }
+
+    # operations -------------------------------------------------------------
+
+    def op_list(self, client, user, rng, opts):
+        params = {'user': user, 'page_size': opts['page_size']}
+        if rng.random() < 0.5:
+            params['before'] = ''
+        return client.get('/api/messages/', params)
+
+    def op_send(self, client, user, rng, opts):
+        return client.post('/api/messages/', {'user': user, 'text': f"bench {rng.random():.6f}"},
+                           content_type='application/json')
+
+    def op_mark_viewed(self, client, user, rng, opts):
+        return client.post(f'/api/messages/mark_viewed/?user={user}')
+
+    def op_login(self, client, user, rng, opts):
+        return client.post('/api/auth/login/', {'identifier': user, 'password': PASSWORD},
+                           content_type='application/json')
+
+    def op_delete_history(self, client, user, rng, opts):
+        # scratch account per thread so seeded histories stay intact
+        scratch = f"{USER_PREFIX}scratch-{rng.randrange(1000)}"
+        client.post('/api/messages/', {'user': scratch, 'text': 'to be deleted'}, content_type='application/json')
+        return client.post('/api/messages/delete_history/', {'user': scratch}, content_type='application/json')
+
+    # reporting --------------------------------------------------------------
+
+    def compare(self, before, after):
+        lines = ['', f"{'endpoint':<16}{'p50 ms':>18}{'p95 ms':>18}{'queries':>14}"]
+
+        def cell(old, new):
+            if not old:
+                return f"{new:>18}"
+            return f"{new:>9} ({(new - old) / old * 100:+.0f}%)".rjust(18)
+
+        for name, new in after['endpoints'].items():
+            old = before.get('endpoints', {}).get(name, {})
+            lines.append(f"{name:<16}{cell(old.get('p50_ms'), new['p50_ms'])}"
+                         f"{cell(old.get('p95_ms'), new['p95_ms'])}"
+                         f"{old.get('queries_mean', '-')!s:>6} -> {new['queries_mean']:<5}")
+        lines.append(f"commit {before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+        return '\n'.join(lines) + '\n'
+
+    def git_commit(self):
+        try:
+            out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                 cwd=settings.BASE_DIR, timeout=5)
+            return out.stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    def cleanup(self):
+        with transaction.atomic():
+            Message.objects.filter(user__startswith=USER_PREFIX).delete()
+            ConversationSummary.objects.filter(user__startswith=USER_PREFIX).delete()
+            Account.objects.filter(identifier__startswith=USER_PREFIX).delete()
+        caches['accounts'].clear()
@@ -0,0 +1,81 @@
+import json
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from messages_app import renderers, summaries
+from messages_app.models import ConversationSummary, Message
+from messages_app.renderers import FastJSONRenderer
+from messages_app.serializers import MESSAGE_FIELDS, MessageSerializer, message_rows
+
+USER = 'bench-serialization'
+
+
+class Command(BaseCommand):
+    help = ("Microbenchmark of the message list encode path: MessageSerializer + JSONRenderer "
+            "vs values_list + message_rows + FastJSONRenderer (with and without orjson). Reports rows/sec.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200, help='rows per list (like page_size)')
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--output', help='write the JSON report here')
+
+    def handle(self, *args, **opts):
+        rows, repeat = opts['rows'], opts['repeat']
+        self.seed(rows)
+        try:
+            qs = Message.objects.filter(user=USER).order_by('created_at')
+            reference = JSONRenderer().render(MessageSerializer(qs, many=True).data)
+            paths = {
+                'modelserializer': lambda: JSONRenderer().render(MessageSerializer(qs.all(), many=True).data),
+                'values_list+stdlib': lambda: self.fast(qs, use_orjson=False),
+            }
+            if renderers.orjson is not None:
+                paths['values_list+orjson'] = lambda: self.fast(qs, use_orjson=True)
+
+            results = {}
+            for name, fn in paths.items():
+                if fn() != reference:
+                    raise AssertionError(f"{name} output differs from MessageSerializer")
+                best = min(self.timed(fn) for _ in range(repeat))
+                results[name] = {'best_ms': round(best * 1000, 3), 'rows_per_s': round(rows / best)}
+            base = results['modelserializer']['rows_per_s']
+            for stats in results.values():
+                stats['speedup'] = round(stats['rows_per_s'] / base, 2)
+        finally:
+            Message.objects.filter(user=USER).delete()
+            ConversationSummary.objects.filter(user=USER).delete()
+
+        report = {'rows': rows, 'repeat': repeat, 'results': results}
+        text = json.dumps(report, indent=2)
+        if opts['output']:
+            with open(opts['output'], 'w') as fh:
+                fh.write(text + '\n')
+        self.stdout.write(text)
+
+    def fast(self, qs, use_orjson):
+        data = message_rows(qs.values_list(*MESSAGE_FIELDS, named=True))
+        if use_orjson:
+            return FastJSONRenderer().render(data)
+        return JSONRenderer().render(data)
+
+    def timed(self, fn):
+        t0 = time.perf_counter()
+        fn()
+        return time.perf_counter() - t0
+
+    def seed(self, rows):
+        now = timezone.now()
+        with transaction.atomic():
+            Message.objects.filter(user=USER).delete()
+            Message.objects.bulk_create([
+                Message(user=USER, user_name='Bench', text=f"mensagem de teste número {i} " * 3,
+                        response_text='', direction='sent' if i % 2 else 'received',
+                        viewed=i % 3 == 0, created_at=now - timedelta(seconds=rows - i))
+                for i in range(rows)
+            ])
+            summaries.rebuild(USER)
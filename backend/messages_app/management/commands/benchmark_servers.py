@@ -0,0 +1,272 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from messages_app import loadtest, summaries
+from messages_app.models import ConversationSummary, Message
+
+USER = 'bench-servers'
+SERVERS = {
+    # the Dockerfile's two modes (SERVER=wsgi | SERVER=asgi)
+    'wsgi': ['chat_project.wsgi:application', '--worker-class', 'gthread'],
+    'asgi': ['chat_project.asgi:application', '--worker-class', 'uvicorn_worker.UvicornWorker'],
+}
+
+
+class Command(BaseCommand):
+    help = ("Serve the app with gunicorn as threaded WSGI (chat_project.wsgi) and as ASGI "
+            "(chat_project.asgi + async views) and drive C concurrent keep-alive connections at each. "
+            "Reports throughput, latency percentiles, errors and server RSS per connection as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', default='wsgi,asgi')
+        parser.add_argument('--connections', default='12,50,200', help='comma separated concurrency levels')
+        parser.add_argument('--duration', type=float, default=5.0, help='seconds per level')
+        parser.add_argument('--workers', type=int, default=3)
+        parser.add_argument('--threads', type=int, default=4, help='threads per WSGI worker')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--path', default=f'/api/messages/?user={USER}&since=0&page_size=20',
+                            help='GET target (default: a delta page, the polling hot path)')
+        parser.add_argument('--timeout', type=float, default=10.0, help='per request, seconds')
+        parser.add_argument('--streams', type=int, default=100,
+                            help='open SSE streams (GET /api/messages/stream/) held during a last run at the '
+                                 'lowest concurrency, asgi only; 0 skips it')
+        parser.add_argument('--output', help='write the JSON report here')
+
+    def handle(self, *args, **opts):
+        if not sys.platform.startswith('linux'):
+            raise CommandError('RSS is read from /proc; run this on Linux')
+        levels = [int(x) for x in opts['connections'].split(',') if x.strip()]
+        self.seed()
+        report = {'path': opts['path'], 'workers': opts['workers'], 'threads': opts['threads'],
+                  'duration_s': opts['duration'], 'servers': {}}
+        try:
+            for name in opts['servers'].split(','):
+                name = name.strip()
+                if name not in SERVERS:
+                    raise CommandError(f"unknown server {name!r}; choose from {sorted(SERVERS)}")
+                report['servers'][name] = self.run_server(name, levels, opts)
+        finally:
+            Message.objects.filter(user=USER).delete()
+            ConversationSummary.objects.filter(user=USER).delete()
+
+        text = json.dumps(report, indent=2)
+        if opts['output']:
+            with open(opts['output'], 'w') as fh:
+                fh.write(text + '\n')
+        self.stdout.write(text)
+
+    def seed(self):
+        now = timezone.now()
+        with transaction.atomic():
+            Message.objects.filter(user=USER).delete()
+            Message.objects.bulk_create([
+                Message(user=USER, user_name='Bench', text=f"mensagem {i}", direction='sent' if i % 2 else 'received',
+                        viewed=True, created_at=now - timedelta(seconds=100 - i))
+                for i in range(100)
+            ])
+            summaries.rebuild(USER)
+
+    # server process ----------------------------------------------------------------
+
+    def run_server(self, name, levels, opts):
+        cmd = [sys.executable, '-m', 'gunicorn', *SERVERS[name], '--bind', f"127.0.0.1:{opts['port']}",
+               '--workers', str(opts['workers']), '--log-level', 'warning']
+        if name == 'wsgi':
+            cmd += ['--threads', str(opts['threads'])]
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE),
+                   MESSAGES_ASYNC_VIEWS='1' if name == 'asgi' else '0',
+                   MESSAGES_REPLY_MODE='external', MESSAGES_THROTTLE_BACKEND='off',
+                   MESSAGES_SHED_WRITE_LATENCY_MS='0')
+        # the previous server's workers may take a moment to release the port
+        deadline = time.monotonic() + 10
+        while port_open(opts['port']):
+            if time.monotonic() > deadline:
+                raise CommandError(f"port {opts['port']} is already in use")
+            time.sleep(0.2)
+        # own process group: workers stuck in a stream must go down with the master
+        proc = subprocess.Popen(cmd, cwd=settings.BASE_DIR, env=env, start_new_session=True)
+        try:
+            self.wait_ready(opts['port'], proc)
+            # one pass so every worker has imported and connected before the baseline
+            asyncio.run(self.load(opts['port'], opts['path'], opts['workers'] * 2, 0.5, opts['timeout']))
+            idle_kb = rss_kb(proc.pid)
+            runs = []
+            for connections in levels:
+                row = asyncio.run(self.measure(proc.pid, opts['port'], opts['path'], connections,
+                                               opts['duration'], opts['timeout']))
+                row['idle_rss_mb'] = round(idle_kb / 1024, 1)
+                row['rss_per_connection_kb'] = round(max(0, row.pop('peak_rss_kb') - idle_kb) / connections, 1)
+                runs.append(row)
+                self.stderr.write(f"{name} c={connections:>4} rps={row['throughput_rps']:>8} "
+                                  f"p50={row['p50_ms']}ms p99={row['p99_ms']}ms errors={row['errors']} "
+                                  f"rss/conn={row['rss_per_connection_kb']}KB")
+            result = {'runs': runs}
+            # the WSGI profile answers the stream with 204 (MessageStreamView): nothing to hold open
+            if opts['streams'] and name == 'asgi':
+                row = asyncio.run(self.measure_with_streams(proc.pid, opts, min(levels)))
+                row['rss_per_stream_kb'] = round(max(0, row.pop('streams_rss_kb') - idle_kb) / opts['streams'], 1)
+                row.pop('peak_rss_kb')
+                result['with_streams'] = row
+                self.stderr.write(f"{name} streams={row['streams_open']}/{opts['streams']} c={row['connections']} "
+                                  f"rps={row['throughput_rps']} p99={row['p99_ms']}ms errors={row['errors']} "
+                                  f"rss/stream={row['rss_per_stream_kb']}KB")
+            return result
+        finally:
+            os.killpg(proc.pid, signal.SIGTERM)
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                pass
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            proc.wait()
+
+    def wait_ready(self, port, proc, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise CommandError(f"server exited with {proc.returncode}")
+            if port_open(port):
+                return
+            time.sleep(0.2)
+        raise CommandError('server did not start listening')
+
+    # load ------------------------------------------------------------------------------
+
+    async def measure(self, pid, port, path, connections, duration, timeout):
+        peak = [rss_kb(pid)]
+
+        async def sample():
+            while True:
+                peak[0] = max(peak[0], rss_kb(pid))
+                await asyncio.sleep(0.2)
+
+        sampler = asyncio.create_task(sample())
+        try:
+            latencies, errors, elapsed = await self.load(port, path, connections, duration, timeout)
+        finally:
+            sampler.cancel()
+        return {'connections': connections, **loadtest.summarize(latencies, elapsed, errors), 'peak_rss_kb': peak[0]}
+
+    async def measure_with_streams(self, pid, opts, connections):
+        """Same load while `streams` event streams stay open (ASGI only, one coroutine each)."""
+        port = opts['port']
+        request = (f"GET /api/messages/stream/?user={USER} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
+                   "Accept: text/event-stream\r\n\r\n").encode()
+        writers = []
+        opened = [0]
+
+        async def open_stream():
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), 5)
+                writers.append(writer)
+                writer.write(request)
+                await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 5)
+                opened[0] += 1
+                while await reader.read(4096):
+                    pass
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                pass
+
+        streams = [asyncio.create_task(open_stream()) for _ in range(opts['streams'])]
+        await asyncio.sleep(5)
+        streams_kb = rss_kb(pid)
+        try:
+            row = await self.measure(pid, port, opts['path'], connections, opts['duration'], opts['timeout'])
+        finally:
+            for writer in writers:
+                writer.close()
+            for task in streams:
+                task.cancel()
+        return {**row, 'streams': opts['streams'], 'streams_open': opened[0], 'streams_rss_kb': streams_kb}
+
+    async def load(self, port, path, connections, duration, timeout):
+        request = (f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
+                   "Accept: application/json\r\n\r\n").encode()
+        latencies = []
+        errors = [0]
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(self.client(port, request, deadline, timeout, latencies, errors)
+                               for _ in range(connections)))
+        return latencies, errors[0], time.perf_counter() - start
+
+    async def client(self, port, request, deadline, timeout, latencies, errors):
+        """One keep-alive connection sending requests back to back until the deadline."""
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+            while time.perf_counter() < deadline:
+                t0 = time.perf_counter()
+                writer.write(request)
+                status = await asyncio.wait_for(read_response(reader), timeout)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                if status != 200:
+                    errors[0] += 1
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            errors[0] += 1
+        finally:
+            if writer is not None:
+                writer.close()
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = dict(line.split(':', 1) for line in lines[1:] if ':' in line)
+    length = {k.strip().lower(): v.strip() for k, v in headers.items()}.get('content-length')
+    if length is None:
+        raise ValueError('response without Content-Length')
+    await reader.readexactly(int(length))
+    return status
+
+
+def port_open(port):
+    try:
+        socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+        return True
+    except OSError:
+        return False
+
+
+def rss_kb(pid):
+    """Resident set size of pid and all its descendants, in KiB."""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as fh:
+                # the command name may contain spaces; ppid follows the closing paren
+                ppid = int(fh.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, ()))
+        try:
+            with open(f'/proc/{current}/status') as fh:
+                for line in fh:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total
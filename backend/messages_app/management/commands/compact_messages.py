@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from messages_app import retention
+from messages_app.models import ArchivedMessage, Message
+
+
+class Command(BaseCommand):
+    help = ("Resume interrupted history deletions and enforce the message retention policy "
+            "(MESSAGES_RETENTION_KEEP_LAST / MESSAGES_RETENTION_DAYS) in short batches. Meant for cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-last', type=int, default=None, help='override MESSAGES_RETENTION_KEEP_LAST')
+        parser.add_argument('--days', type=int, default=None, help='override MESSAGES_RETENTION_DAYS')
+        parser.add_argument('--users', help='comma separated accounts (default: every account with messages)')
+        parser.add_argument('--batch-size', type=int, default=None, help='override MESSAGES_DELETE_BATCH_SIZE')
+        parser.add_argument('--pause', type=float, default=None, help='seconds to sleep between batches')
+        parser.add_argument('--dry-run', action='store_true', help='only count what would expire')
+
+    def handle(self, *args, **opts):
+        resumed = {}
+        if not opts['dry_run']:
+            for pk in retention.resumable_deletion_ids():
+                resumed[pk] = retention.run_history_deletion(pk)
+
+        keep_last, days = retention.policy(opts['keep_last'], opts['days'])
+        if opts['users']:
+            users = [u.strip() for u in opts['users'].split(',') if u.strip()]
+        else:
+            # DISTINCT over the (user, ...) indexes, no table scan
+            users = sorted({user for model in (Message, ArchivedMessage)
+                            for user in model.objects.order_by('user').values_list('user', flat=True).distinct()})
+        expired = retention.compact(users, keep_last, days, dry_run=opts['dry_run'],
+                                    size=opts['batch_size'], pause=opts['pause'])
+
+        self.stdout.write(json.dumps({
+            'policy': {'keep_last': keep_last, 'days': days},
+            'dry_run': opts['dry_run'],
+            'resumed_deletions': resumed,
+            'expired' if opts['dry_run'] else 'deleted': expired,
+            'total': sum(expired.values()),
+        }, indent=2))
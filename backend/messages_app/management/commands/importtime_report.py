@@ -0,0 +1,139 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# runs in a fresh interpreter per measurement; prints one JSON line
+PROBE = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import chat_project.wsgi
+t1 = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+t2 = time.perf_counter()
+from wsgiref.util import setup_testing_defaults
+
+def request(path):
+    environ = {'PATH_INFO': path.partition('?')[0], 'QUERY_STRING': path.partition('?')[2],
+               'HTTP_HOST': 'localhost', 'HTTP_ACCEPT': 'application/json'}
+    setup_testing_defaults(environ)
+    status = []
+    body = chat_project.wsgi.application(environ, lambda s, h, exc_info=None: status.append(s))
+    b''.join(body)
+    getattr(body, 'close', lambda: None)()
+    return int(status[0].split()[0])
+
+code = request(sys.argv[1])
+t3 = time.perf_counter()
+first_done = time.time()
+request(sys.argv[1])
+t4 = time.perf_counter()
+print(json.dumps({'import_ms': (t1 - t0) * 1000, 'urlconf_ms': (t2 - t1) * 1000,
+                  'first_request_ms': (t3 - t2) * 1000, 'second_request_ms': (t4 - t3) * 1000,
+                  'first_done': first_done, 'status': code, 'modules': len(sys.modules)}))
+'''
+
+
+class Command(BaseCommand):
+    help = ("Cold start of the backend per settings profile: interpreter + `import chat_project.wsgi`, "
+            "URLconf import (what gunicorn preload does once in the master), first and second request, "
+            "and a `python -X importtime` breakdown by package. Reports JSON; --budget-ms fails when "
+            "time to first request is over budget.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default='chat_project.settings,chat_project.settings_api',
+                            help='comma separated DJANGO_SETTINGS_MODULEs')
+        parser.add_argument('--path', default='/api/messages/?user=importtime-probe&since=0',
+                            help='request sent twice after the imports')
+        parser.add_argument('--runs', type=int, default=5, help='timed runs per profile (best is reported)')
+        parser.add_argument('--top', type=int, default=15, help='packages/modules listed in the breakdown')
+        parser.add_argument('--budget-ms', type=float, help='fail when time to first request exceeds this')
+        parser.add_argument('--output', help='write the JSON report here')
+        parser.add_argument('--compare', help='previous JSON report to diff against')
+
+    def handle(self, *args, **opts):
+        report = {'path': opts['path'], 'runs': opts['runs'], 'python': sys.version.split()[0], 'profiles': {}}
+        for profile in [p.strip() for p in opts['profiles'].split(',') if p.strip()]:
+            runs = [self.probe(profile, opts['path']) for _ in range(max(1, opts['runs']))]
+            best = {key: round(min(run[key] for run in runs), 1)
+                    for key in ('startup_ms', 'import_ms', 'urlconf_ms', 'first_request_ms',
+                                'second_request_ms', 'time_to_first_request_ms')}
+            best['status'] = runs[0]['status']
+            best['modules'] = runs[0]['modules']
+            best['breakdown'] = self.breakdown(profile, opts['path'], opts['top'])
+            report['profiles'][profile] = best
+            self.stderr.write(f"{profile:<28} first request after {best['time_to_first_request_ms']}ms "
+                              f"(import {best['import_ms']}ms, urlconf {best['urlconf_ms']}ms, "
+                              f"request {best['first_request_ms']}ms, {best['modules']} modules)")
+
+        text = json.dumps(report, indent=2)
+        if opts['output']:
+            with open(opts['output'], 'w') as fh:
+                fh.write(text + '\n')
+        self.stdout.write(text)
+        if opts['compare']:
+            with open(opts['compare']) as fh:
+                self.stdout.write(self.compare(json.load(fh), report))
+        if opts['budget_ms'] is not None:
+            over = {name: p['time_to_first_request_ms'] for name, p in report['profiles'].items()
+                    if p['time_to_first_request_ms'] > opts['budget_ms']}
+            if over:
+                raise CommandError(f"time to first request over {opts['budget_ms']}ms: {over}")
+
+    def env(self, profile):
+        return dict(os.environ, DJANGO_SETTINGS_MODULE=profile, PYTHONDONTWRITEBYTECODE='1')
+
+    def probe(self, profile, path):
+        started = time.time()
+        out = subprocess.run([sys.executable, '-c', PROBE, path], cwd=settings.BASE_DIR, env=self.env(profile),
+                             capture_output=True, text=True, timeout=120)
+        if out.returncode != 0:
+            raise CommandError(f"{profile}: probe failed\n{out.stderr[-2000:]}")
+        row = json.loads(out.stdout.strip().splitlines()[-1])
+        row['time_to_first_request_ms'] = (row.pop('first_done') - started) * 1000
+        row['startup_ms'] = row['time_to_first_request_ms'] - row['import_ms'] - row['urlconf_ms'] \
+            - row['first_request_ms']
+        return row
+
+    def breakdown(self, profile, path, top):
+        """Self time of every imported module (-X importtime), summed per top-level package."""
+        out = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE, path], cwd=settings.BASE_DIR,
+                             env=self.env(profile), capture_output=True, text=True, timeout=120)
+        modules = []
+        for line in out.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            modules.append((name.strip(), int(self_us), int(cumulative_us)))
+        packages = defaultdict(int)
+        for name, self_us, _ in modules:
+            packages[name.split('.')[0]] += self_us
+        total = sum(packages.values())
+        return {
+            'total_ms': round(total / 1000, 1),
+            'packages': [{'package': name, 'self_ms': round(us / 1000, 1), 'share': round(us / total, 3)}
+                         for name, us in sorted(packages.items(), key=lambda kv: -kv[1])[:top]],
+            'slowest_modules': [{'module': name, 'self_ms': round(us / 1000, 1)}
+                                for name, us, _ in sorted(modules, key=lambda m: -m[1])[:top]],
+        }
+
+    def compare(self, before, after):
+        lines = ['', f"{'profile':<28}{'first request ms':>24}{'import ms':>22}{'modules':>16}"]
+
+        def cell(old, new, width):
+            if not old:
+                return f"{new:>{width}}"
+            return f"{new:>9} ({(new - old) / old * 100:+.0f}%)".rjust(width)
+
+        for name, new in after['profiles'].items():
+            old = before.get('profiles', {}).get(name, {})
+            lines.append(f"{name:<28}{cell(old.get('time_to_first_request_ms'), new['time_to_first_request_ms'], 24)}"
+                         f"{cell(old.get('import_ms'), new['import_ms'], 22)}"
+                         f"{old.get('modules', '-')!s:>8} -> {new['modules']:<5}")
+        return '\n'.join(lines) + '\n'
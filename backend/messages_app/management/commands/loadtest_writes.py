@@ -0,0 +1,80 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+
+from messages_app import loadtest
+from messages_app.models import ConversationSummary, Message
+
+USER_PREFIX = 'loadtest-'
+
+
+class Command(BaseCommand):
+    help = ("Concurrent write load test: N threads POST /api/messages/ against the configured "
+            "database profile (DB_ENGINE) and report throughput, latency percentiles and errors.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', default='1,4,12', help='comma separated concurrency levels')
+        parser.add_argument('--requests', type=int, default=100, help='POSTs per thread')
+        parser.add_argument('--accounts', type=int, default=4, help='distinct accounts written to')
+        parser.add_argument('--with-replies', action='store_true',
+                            help='let the in-process reply pool write replies during the run')
+        parser.add_argument('--keep', action='store_true', help='keep the generated rows')
+        parser.add_argument('--backpressure', action='store_true',
+                            help='keep send throttling and load shedding on (off by default, they would '
+                                 'turn most of the load into 429/503)')
+        parser.add_argument('--json', dest='json_path', help='also write the report to this file')
+
+    def handle(self, *args, **opts):
+        levels = [int(x) for x in opts['threads'].split(',') if x.strip()]
+        report = {'database': self.describe_database(), 'requests_per_thread': opts['requests'], 'runs': []}
+        mode = 'thread' if opts['with_replies'] else 'external'
+        backpressure = {} if opts['backpressure'] else loadtest.NO_BACKPRESSURE
+        try:
+            with override_settings(MESSAGES_REPLY_MODE=mode, **backpressure):
+                for threads in levels:
+                    report['runs'].append(self.run_level(threads, opts['requests'], opts['accounts']))
+        finally:
+            if not opts['keep']:
+                self.cleanup()
+
+        text = json.dumps(report, indent=2)
+        self.stdout.write(text)
+        if opts['json_path']:
+            with open(opts['json_path'], 'w') as fh:
+                fh.write(text + '\n')
+
+    def run_level(self, threads, requests, accounts):
+        def make_worker(index):
+            client = Client()
+            user = f"{USER_PREFIX}{index % accounts}"
+
+            def send(i):
+                resp = client.post('/api/messages/', {'user': user, 'text': f'load {index}-{i}'},
+                                   content_type='application/json')
+                return resp.status_code == 201
+            return send
+
+        latencies, errors, elapsed = loadtest.run_threads(threads, requests, make_worker)
+        row = {'threads': threads, **loadtest.summarize(latencies, elapsed, errors)}
+        self.stderr.write(f"threads={threads:>3} rps={row['throughput_rps']:>8} "
+                          f"p50={row['p50_ms']}ms p99={row['p99_ms']}ms errors={errors}")
+        return row
+
+    def describe_database(self):
+        info = {'vendor': connection.vendor, 'name': str(connection.settings_dict['NAME'])}
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                    cursor.execute(f"PRAGMA {pragma}")
+                    info[pragma] = cursor.fetchone()[0]
+        else:
+            info['conn_max_age'] = connection.settings_dict.get('CONN_MAX_AGE')
+        return info
+
+    def cleanup(self):
+        with transaction.atomic():
+            Message.objects.filter(user__startswith=USER_PREFIX).delete()
+            ConversationSummary.objects.filter(user__startswith=USER_PREFIX).delete()
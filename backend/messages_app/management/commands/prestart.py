@@ -0,0 +1,72 @@
+import hashlib
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+STAMP = '.collectstatic-stamp'
+
+
+class Command(BaseCommand):
+    help = ("Container start step: `migrate` only when there are unapplied migrations and "
+            "`collectstatic` only when the static sources changed since the last run "
+            "(skipped entirely without django.contrib.staticfiles, e.g. chat_project.settings_api).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--force', action='store_true', help='run both steps unconditionally')
+
+    def handle(self, *args, **opts):
+        self.migrate(opts['database'], opts['force'])
+        self.collectstatic(opts['force'])
+
+    def migrate(self, database, force):
+        connection = connections[database]
+        executor = MigrationExecutor(connection)
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+        # the post_migrate handlers (permissions, content types, search index)
+        # are what make a no-op `migrate` slow, so an empty plan skips it
+        if not plan and not force:
+            self.stdout.write('migrate: up to date, skipped')
+            return
+        self.stdout.write(f"migrate: {len(plan)} migration(s) to apply")
+        call_command('migrate', database=database, interactive=False, verbosity=1)
+
+    def collectstatic(self, force):
+        if not apps.is_installed('django.contrib.staticfiles'):
+            self.stdout.write('collectstatic: staticfiles not installed, skipped')
+            return
+        fingerprint = self.static_fingerprint()
+        stamp = os.path.join(settings.STATIC_ROOT, STAMP)
+        try:
+            with open(stamp) as fh:
+                previous = fh.read().strip()
+        except OSError:
+            previous = None
+        if previous == fingerprint and not force:
+            self.stdout.write('collectstatic: sources unchanged, skipped')
+            return
+        call_command('collectstatic', interactive=False, verbosity=1)
+        os.makedirs(settings.STATIC_ROOT, exist_ok=True)
+        with open(stamp, 'w') as fh:
+            fh.write(fingerprint + '\n')
+
+    @staticmethod
+    def static_fingerprint():
+        """Digest of every file the finders would collect: path, size and mtime."""
+        from django.contrib.staticfiles.finders import get_finders
+
+        digest = hashlib.sha256()
+        entries = []
+        for finder in get_finders():
+            for path, storage in finder.list(['CVS', '.*', '*~']):
+                stat = os.stat(storage.path(path))
+                entries.append(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}")
+        for entry in sorted(entries):
+            digest.update(entry.encode())
+            digest.update(b'\n')
+        return digest.hexdigest()
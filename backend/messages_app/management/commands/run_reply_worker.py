@@ -0,0 +1,35 @@
+import json
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from messages_app import replies
+
+
+class Command(BaseCommand):
+    help = "Process queued auto-reply jobs (use with MESSAGES_REPLY_MODE='external', or to add capacity)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='worker threads (default MESSAGES_REPLY_WORKERS)')
+        parser.add_argument('--poll-interval', type=float, default=None, help='seconds between queue polls')
+        parser.add_argument('--once', action='store_true', help='drain the currently due jobs and exit')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            done = {}
+            for pk in replies.due_job_ids(limit=10000):
+                status = replies.process_job(pk)
+                done[status] = done.get(status, 0) + 1
+            self.stdout.write(json.dumps({'processed': done, 'responders': replies.metrics.snapshot()}, indent=2))
+            return
+
+        pool = replies.ReplyWorkerPool(workers=options['workers'], poll_interval=options['poll_interval'])
+        stopped = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *a: stopped.set())
+        pool.start()
+        self.stdout.write(f"reply worker running with {pool.workers} threads")
+        stopped.wait()
+        pool.stop()
+        self.stdout.write(json.dumps(replies.metrics.snapshot(), indent=2))
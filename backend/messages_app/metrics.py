@@ -0,0 +1,259 @@
+"""
+Request / DB instrumentation shared across gunicorn workers without external
+services.
+
+Each process keeps counters and histograms in memory (RequestMetricsMiddleware
+records into `registry`) and dumps them to METRICS_DIR/<pid>-<start>.json at
+most once per METRICS_FLUSH_INTERVAL seconds; <start> is the process start time,
+so a recycled worker whose pid is reused gets a new file instead of overwriting
+(and shrinking) the old one. GET /api/metrics/ merges every process file (its
+own state taken live) and renders the Prometheus text format. Files of exited
+workers are folded into METRICS_DIR/totals.json and deleted, so counters stay
+monotonic without one file per worker ever started.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: dead workers' files are kept instead of folded
+    fcntl = None
+
+from django.conf import settings
+
+PREFIX = 'chat_'
+# milliseconds
+DURATION_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50)
+
+
+TOTALS = 'totals.json'
+_process_keys = {}
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None) or os.path.join(tempfile.gettempdir(), 'chat-metrics')
+
+
+def _start_time(pid):
+    """Kernel start time of `pid` (clock ticks since boot), None if unknown/gone."""
+    try:
+        with open(f"/proc/{pid}/stat") as fh:
+            stat = fh.read()
+    except OSError:
+        return None
+    # fields after "(comm)", which may itself contain spaces; starttime is field 22
+    return stat.rsplit(')', 1)[1].split()[19]
+
+
+def process_key():
+    """'<pid>-<start>' of this process, computed once per pid (workers fork after import)."""
+    pid = os.getpid()
+    key = _process_keys.get(pid)
+    if key is None:
+        start = _start_time(pid) or str(time.time_ns())
+        key = _process_keys[pid] = f"{pid}-{start}"
+    return key
+
+
+def _alive(key):
+    pid, _, start = key.partition('-')
+    try:
+        pid = int(pid)
+    except ValueError:
+        return True
+    current = _start_time(pid)
+    if current is not None:
+        return current == start
+    if os.path.isdir('/proc'):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._last_flush = 0.0
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = {'buckets': list(buckets), 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist['counts'][i] += 1
+                    break
+            hist['sum'] += value
+            hist['count'] += 1
+
+    def dump(self):
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), dict(h, counts=list(h['counts']))]
+                               for (name, labels), h in self._histograms.items()],
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def maybe_flush(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+        now = time.monotonic()
+        if now - self._last_flush < interval:
+            return
+        self._last_flush = now
+        try:
+            self.flush()
+        except OSError:
+            # metrics must never fail a request; the next flush retries
+            pass
+
+    def flush(self):
+        path = metrics_dir()
+        os.makedirs(path, exist_ok=True)
+        _write(os.path.join(path, f"{process_key()}.json"), self.dump())
+
+
+registry = Registry()
+
+
+def _write(target, dump):
+    tmp = f"{target}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as fh:
+        json.dump(dump, fh)
+    os.replace(tmp, target)
+
+
+def _read(target):
+    try:
+        with open(target) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _fold_dead(path, names):
+    """Add the files of exited processes to totals.json and delete them."""
+    dead = [name for name in names if name != TOTALS and not _alive(name[:-len('.json')])]
+    totals_path = os.path.join(path, TOTALS)
+    dumps = [_read(totals_path) or {'counters': [], 'histograms': []}]
+    folded = []
+    for name in dead:
+        dump = _read(os.path.join(path, name))
+        if dump is not None:
+            dumps.append(dump)
+            folded.append(name)
+    if not folded:
+        return
+    counters, histograms = merge(dumps)
+    _write(totals_path, {
+        'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, list(labels), hist] for (name, labels), hist in histograms.items()],
+    })
+    for name in folded:
+        try:
+            os.unlink(os.path.join(path, name))
+        except FileNotFoundError:
+            pass
+
+
+def _read_all(path, own):
+    names = [name for name in os.listdir(path) if name.endswith('.json') and name != own]
+    if fcntl is not None:
+        try:
+            _fold_dead(path, names)
+        except OSError:
+            # a failed fold leaves the files in place; they are read below
+            pass
+        names = [name for name in os.listdir(path) if name.endswith('.json') and name != own]
+    return [dump for dump in (_read(os.path.join(path, name)) for name in names) if dump is not None]
+
+
+def collect():
+    """
+    Merge this process (live) with the files written by the other workers.
+    Scrapes hold an flock on METRICS_DIR/.lock, so a file is never folded twice
+    or counted both in totals.json and on its own.
+    """
+    dumps = [registry.dump()]
+    path = metrics_dir()
+    if os.path.isdir(path):
+        own = f"{process_key()}.json"
+        if fcntl is None:
+            dumps.extend(_read_all(path, own))
+        else:
+            with open(os.path.join(path, '.lock'), 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                dumps.extend(_read_all(path, own))
+    return merge(dumps)
+
+
+def merge(dumps):
+    counters = {}
+    histograms = {}
+    for dump in dumps:
+        for name, labels, value in dump['counters']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, hist in dump['histograms']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = dict(hist, counts=list(hist['counts']))
+            else:
+                merged['counts'] = [a + b for a, b in zip(merged['counts'], hist['counts'])]
+                merged['sum'] += hist['sum']
+                merged['count'] += hist['count']
+    return counters, histograms
+
+
+def _labels(pairs, extra=()):
+    items = list(pairs) + list(extra)
+    if not items:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in items)
+    return '{' + body + '}'
+
+
+def render_prometheus():
+    counters, histograms = collect()
+    lines = []
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+        lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+    for (name, labels), hist in sorted(histograms.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+        cumulative = 0
+        for bound, count in zip(hist['buckets'], hist['counts']):
+            cumulative += count
+            lines.append(f"{PREFIX}{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{PREFIX}{name}_bucket{_labels(labels, [('le', '+Inf')])} {hist['count']}")
+        lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {hist['sum']}")
+        lines.append(f"{PREFIX}{name}_count{_labels(labels)} {hist['count']}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,201 @@
+import gzip
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional dependency: only gzip is offered without it
+    brotli = None
+
+from .metrics import DURATION_BUCKETS, QUERY_BUCKETS, registry
+
+
+class _QueryTimer:
+    """connection.execute_wrapper that counts queries and their wall time."""
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+# timer of the async request being handled; contextvars follow the request
+# into the sync_to_async threads that run its ORM work
+_async_timer = ContextVar('async_query_timer', default=None)
+
+
+def _time_async_request(execute, sql, params, many, context):
+    timer = _async_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def _install_async_timer(sender, connection, **kwargs):
+    # connections are per thread: every one that may run an async request's
+    # queries gets the wrapper (once; connection_created fires on reconnects)
+    if _time_async_request not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_async_request)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records per-view latency histograms, DB query count/time and response
+    size into messages_app.metrics, and adds a Server-Timing header
+    (app;dur=..., db;dur=...). Keep it first in MIDDLEWARE so it times the
+    whole stack. Async requests run their queries in sync_to_async threads,
+    with other connections than the event loop's: those are timed by a
+    wrapper installed on every new connection that records into the
+    request's timer (_async_timer).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+            connection_created.connect(_install_async_timer, dispatch_uid='messages_app.async_query_timer')
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = _QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, timer)
+        return response
+
+    async def __acall__(self, request):
+        timer = _QueryTimer()
+        token = _async_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _async_timer.reset(token)
+        self.record(request, response, time.perf_counter() - start, timer)
+        return response
+
+    def record(self, request, response, elapsed, timer):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unmatched'
+        labels = (('view', view), ('method', request.method))
+        elapsed_ms = elapsed * 1000
+
+        registry.inc('http_requests_total', labels + (('status', response.status_code),))
+        registry.observe('http_request_duration_ms', labels, elapsed_ms, DURATION_BUCKETS)
+        if not response.streaming:
+            registry.inc('http_response_bytes_total', labels, len(response.content))
+
+        db_ms = timer.duration * 1000
+        registry.inc('db_queries_total', labels, timer.count)
+        registry.inc('db_query_duration_ms_total', labels, db_ms)
+        registry.observe('db_queries_per_request', labels, timer.count, QUERY_BUCKETS)
+        response['Server-Timing'] = f'app;dur={elapsed_ms:.2f}, db;dur={db_ms:.2f};desc="{timer.count} queries"'
+        registry.maybe_flush()
+
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+
+def accepted_encodings(header):
+    """{coding: q} from an Accept-Encoding header; `*` stands for anything not listed."""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header):
+    """br when the client takes it (and brotli is installed), else gzip, else None."""
+    accepted = accepted_encodings(header or '')
+    offered = (['br'] if brotli is not None else []) + ['gzip']
+    best, best_q = None, 0.0
+    for coding in offered:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compresses GET/HEAD responses of at least MESSAGES_COMPRESS_MIN_BYTES with
+    brotli (when installed) or gzip, whichever the client's Accept-Encoding
+    prefers. Goes right after RequestMetricsMiddleware, so the byte counters
+    and Server-Timing see the compressed response.
+
+    Only JSON/text bodies are touched, never streaming ones (export, events)
+    and never POST responses: those carry login tokens, and compressing a
+    secret next to attacker-influenced text is what BREACH exploits. A strong
+    ETag becomes weak (the bytes differ per encoding); Django compares
+    If-None-Match weakly, so 304s keep working.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if request.method not in ('GET', 'HEAD'):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if (response.streaming or response.has_header('Content-Encoding')
+                or len(response.content) < settings.MESSAGES_COMPRESS_MIN_BYTES
+                or not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES)
+                or 'no-transform' in response.get('Cache-Control', '')):
+            return response
+        coding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if coding is None:
+            return response
+
+        if coding == 'br':
+            body = brotli.compress(response.content, quality=settings.MESSAGES_COMPRESS_BROTLI_QUALITY)
+        else:
+            body = gzip.compress(response.content, compresslevel=settings.MESSAGES_COMPRESS_GZIP_LEVEL, mtime=0)
+        if len(body) >= len(response.content):
+            return response
+        response.content = body
+        response['Content-Encoding'] = coding
+        response['Content-Length'] = str(len(body))
+        etag = response.get('ETag')
+        if etag and not etag.startswith('W/'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:14
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messages_app', '0003_alter_message_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Account',
+            fields=[
+                ('identifier', models.CharField(max_length=48, primary_key=True, serialize=False)),
+                ('name', models.CharField(blank=True, max_length=150)),
+                ('password_hash', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='direction',
+            field=models.CharField(choices=[('sent', 'sent'), ('received', 'received')], max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='id',
+            field=models.AutoField(primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='response_text',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='text',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='user',
+            field=models.CharField(db_index=True, max_length=48),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='user_name',
+            field=models.CharField(blank=True, max_length=150),
+        ),
+    ]
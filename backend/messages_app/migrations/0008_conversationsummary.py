@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:21
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def backfill_summaries(apps, schema_editor):
+    Message = apps.get_model('messages_app', 'Message')
+    ConversationSummary = apps.get_model('messages_app', 'ConversationSummary')
+    rows = (Message.objects.order_by().values('user')
+            .annotate(total=Count('id'), unread=Count('id', filter=Q(viewed=False)),
+                      last_at=Max('created_at'), last_id=Max('id')))
+    ConversationSummary.objects.bulk_create([
+        ConversationSummary(user=r['user'], total_count=r['total'], unread_count=r['unread'],
+                            last_message_id=r['last_id'], last_message_at=r['last_at'])
+        for r in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messages_app', '0007_replyjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationSummary',
+            fields=[
+                ('user', models.CharField(max_length=48, primary_key=True, serialize=False)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('total_count', models.PositiveIntegerField(default=0)),
+                ('last_message_id', models.IntegerField(blank=True, null=True)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:35
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def install_search_index(apps, schema_editor):
+    from messages_app import search
+    search.install(schema_editor.connection)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from messages_app import search
+    search.uninstall(schema_editor.connection, tables=['messages_app_archivedmessage'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messages_app', '0009_historydeletion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMessage',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('user', models.CharField(max_length=48)),
+                ('user_name', models.CharField(blank=True, max_length=150)),
+                ('text', models.TextField(blank=True)),
+                ('response_text', models.TextField(blank=True)),
+                ('direction', models.CharField(choices=[('sent', 'sent'), ('received', 'received')], max_length=16)),
+                ('viewed', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['user', 'created_at', 'id'], name='archmsg_user_created_id_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='conversationsummary',
+            name='archived_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversationsummary',
+            name='archived_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
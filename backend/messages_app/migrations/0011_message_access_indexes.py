@@ -0,0 +1,65 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:07
+
+from django.db import migrations, models
+
+
+# the names Django generated for `user = CharField(db_index=True)` in 0001;
+# PostgreSQL also got a varchar_pattern_ops twin for LIKE lookups
+USER_INDEX = 'messages_app_message_user_ac14f083'
+USER_LIKE_INDEX = 'messages_app_message_user_d160a765_like'
+
+
+def drop_like_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{USER_LIKE_INDEX}"')
+
+
+def create_like_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX "{USER_LIKE_INDEX}" ON "messages_app_message" ("user" varchar_pattern_ops)'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messages_app', '0010_archivedmessage'),
+    ]
+
+    operations = [
+        # the plain index on `user` is a prefix of the composite ones below.
+        # AlterField(db_index=False) would rebuild the table on SQLite (and drop
+        # the full-text triggers with it), so the state trades db_index for the
+        # equivalent named Index, which RemoveIndex then drops on its own
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='message',
+                    name='user',
+                    field=models.CharField(max_length=48),
+                ),
+                migrations.AddIndex(
+                    model_name='message',
+                    index=models.Index(fields=['user'], name=USER_INDEX),
+                ),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='message',
+            name=USER_INDEX,
+        ),
+        migrations.RunPython(drop_like_index, create_like_index),
+        migrations.AddIndex(
+            model_name='archivedmessage',
+            index=models.Index(fields=['user', 'id'], name='archmsg_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['user', 'id'], name='msg_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('viewed', False)), fields=['user'], name='msg_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messages_app', '0014_streamevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='replyjob',
+            index=models.Index(fields=['status', 'started_at'], name='replyjob_status_started_idx'),
+        ),
+    ]
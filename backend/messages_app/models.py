@@ -15,6 +15,10 @@ class Account(models.Model):
     password_hash = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
 
+    # request.user for token-authenticated requests (messages_app.tokens)
+    is_authenticated = True
+    is_anonymous = False
+
     def __str__(self):
         return f"{self.identifier} — {self.name or 'Usuário'}"
 
@@ -26,16 +30,163 @@ class Message(models.Model):
     We keep 'user' as the account identifier string to be robust with legacy data.
     """
     id = models.AutoField(primary_key=True)
-    user = models.CharField(max_length=48, db_index=True)
+    user = models.CharField(max_length=48)
     user_name = models.CharField(max_length=150, blank=True) 
     text = models.TextField(blank=True)
     response_text = models.TextField(blank=True)
     direction = models.CharField(max_length=16, choices=(("sent","sent"),("received","received")))
     viewed = models.BooleanField(default=False)
     created_at = models.DateTimeField(default=timezone.now)
+    # Idempotency-Key of the send that created it (messages_app.sending)
+    client_key = models.CharField(max_length=64, null=True, blank=True)
 
     class Meta:
         ordering = ["created_at"]
+        constraints = [
+            # a retried send finds its message instead of creating a second one
+            models.UniqueConstraint(fields=["user", "client_key"], condition=models.Q(client_key__isnull=False),
+                                    name="msg_user_client_key_uniq"),
+        ]
+        indexes = [
+            # every list of one account: WHERE user=? [AND (created_at, id) < (?, ?)]
+            # ORDER BY created_at, id (page-number, keyset, direction filter)
+            models.Index(fields=["user", "created_at", "id"], name="msg_user_created_id_idx"),
+            # id order within an account: delta sync (id > since), export, and the
+            # batched archive/retention/deletion walks
+            models.Index(fields=["user", "id"], name="msg_user_id_idx"),
+            # only the unread rows: mark_viewed touches these and nothing else
+            models.Index(fields=["user"], condition=models.Q(viewed=False), name="msg_unread_idx"),
+            # across accounts, newest first: the admin changelist pages and its
+            # date drill-down (messages_app.admin)
+            models.Index(fields=["created_at", "id"], name="msg_created_id_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user} {self.direction} {self.created_at.isoformat()}"
+
+
+class ArchivedMessage(models.Model):
+    """
+    Cold tier of Message (messages_app.archive): read messages older than
+    MESSAGES_ARCHIVE_AFTER_DAYS are moved here with their original id, so the
+    hot table and its indexes only hold the recent working set. Same columns
+    as Message; list/search/export read both tables.
+    """
+    id = models.IntegerField(primary_key=True)
+    user = models.CharField(max_length=48)
+    user_name = models.CharField(max_length=150, blank=True)
+    text = models.TextField(blank=True)
+    response_text = models.TextField(blank=True)
+    direction = models.CharField(max_length=16, choices=(("sent","sent"),("received","received")))
+    viewed = models.BooleanField(default=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["user", "created_at", "id"], name="archmsg_user_created_id_idx"),
+            models.Index(fields=["user", "id"], name="archmsg_user_id_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.direction} {self.created_at.isoformat()} (archived)"
+
+
+class ReplyJob(models.Model):
+    """
+    Pending automated reply for a 'sent' message. Rows are the queue for the
+    reply worker pool (messages_app.replies): POST only inserts the job, the
+    worker claims it, asks the configured responders for a text and stores
+    the 'received' message.
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = ((PENDING, "pending"), (RUNNING, "running"), (DONE, "done"), (FAILED, "failed"))
+
+    message = models.OneToOneField(Message, on_delete=models.CASCADE, related_name="reply_job")
+    reply = models.OneToOneField(Message, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    responder = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    latency_ms = models.FloatField(null=True, blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="replyjob_status_run_after_idx"),
+            # RUNNING jobs whose lease expired (messages_app.replies.due_job_ids)
+            models.Index(fields=["status", "started_at"], name="replyjob_status_started_idx"),
+        ]
+
+    def __str__(self):
+        return f"reply for #{self.message_id} ({self.status})"
+
+
+class ConversationSummary(models.Model):
+    """
+    Per-account counters maintained by the write paths (messages_app.summaries)
+    so badges and sidebars never have to scan Message.
+    """
+    user = models.CharField(max_length=48, primary_key=True)
+    unread_count = models.PositiveIntegerField(default=0)
+    total_count = models.PositiveIntegerField(default=0)
+    # how many of total_count live in the archive tier (ArchivedMessage)
+    archived_count = models.PositiveIntegerField(default=0)
+    # newest created_at in the archive tier (may lag behind deletions, never ahead)
+    archived_until = models.DateTimeField(null=True, blank=True)
+    last_message_id = models.IntegerField(null=True, blank=True)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user}: {self.unread_count}/{self.total_count}"
+
+
+
+class HistoryDeletion(models.Model):
+    """
+    Batched removal of one account's messages (messages_app.retention).
+    Messages with id <= upto_id are deleted in short primary-key-range
+    transactions; the row records progress so an interrupted run can be
+    resumed by `manage.py compact_messages`.
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = ((PENDING, "pending"), (RUNNING, "running"), (DONE, "done"), (FAILED, "failed"))
+
+    user = models.CharField(max_length=48, db_index=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    upto_id = models.IntegerField()
+    total = models.PositiveIntegerField(default=0)
+    deleted_count = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"delete history of {self.user} ({self.status}, {self.deleted_count}/{self.total})"
+
+
+class StreamEvent(models.Model):
+    """
+    Outbox of messages_app.events.DatabaseBroker: every published event is a
+    row, and each web process with open streams polls for new ids. Rows are
+    pruned after MESSAGES_EVENTS_RETENTION seconds.
+    """
+    id = models.BigAutoField(primary_key=True)
+    channel = models.CharField(max_length=64)
+    payload = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"#{self.id} {self.channel}"
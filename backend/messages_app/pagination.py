@@ -0,0 +1,211 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+def encode_cursor(obj):
+    """Opaque token for the (created_at, id) position of obj."""
+    raw = f"{obj.created_at.isoformat()}|{obj.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """(created_at, id) of a token from encode_cursor(); ValueError when it isn't one."""
+    padded = token + '=' * (-len(token) % 4)
+    raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+    stamp, pk = raw.rsplit('|', 1)
+    return datetime.fromisoformat(stamp), int(pk)
+
+
+class StandardPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+
+
+class ClampedPageSizeMixin:
+    """page_size query param, ignored when invalid and capped at max_page_size."""
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        raw = request.query_params.get(self.page_size_query_param)
+        if raw:
+            try:
+                size = int(raw)
+            except ValueError:
+                size = 0
+            if size > 0:
+                return min(size, self.max_page_size)
+        return self.page_size
+
+
+class KeysetPagination(ClampedPageSizeMixin, BasePagination):
+    """
+    Cursor (keyset) pagination over (created_at, id) for a single user's history.
+
+    GET /api/messages/?user=A&before=          -> latest page
+    GET /api/messages/?user=A&before=<cursor>  -> page of messages older than cursor
+    GET /api/messages/?user=A&after=<cursor>   -> page of messages newer than cursor
+
+    Cursors are opaque tokens. No COUNT(*) and no OFFSET: every page is a
+    range scan on the (user, created_at, id) index, so page N costs the same
+    as page 1. Results are always returned oldest -> newest, like the
+    page-number mode.
+
+    `has_more` says whether another page exists in the direction requested
+    (older for `before`, newer for `after`); `has_more_before` and
+    `has_more_after` give both sides. The side a page was not fetched towards
+    is inferred from the cursor rather than queried.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    before_query_param = 'before'
+    after_query_param = 'after'
+    invalid_cursor_message = 'Invalid cursor'
+
+    @classmethod
+    def requested(cls, request):
+        params = request.query_params
+        return cls.before_query_param in params or cls.after_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.take_rows(list(self.page_query(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Same page through the async ORM (plain QuerySets only, not archive tiers)."""
+        return self.take_rows([row async for row in self.page_query(queryset, request)])
+
+    def page_query(self, queryset, request):
+        """The LIMITed range query for the requested page (one row extra to detect more)."""
+        self.page_size = self.get_page_size(request)
+        params = request.query_params
+        self.forward = self.after_query_param in params
+        if self.forward:
+            created_at, pk = self.decode_cursor(params.get(self.after_query_param))
+            qs = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+            return qs.order_by('created_at', 'id')[:self.page_size + 1]
+        self.cursor = params.get(self.before_query_param)
+        qs = queryset
+        if self.cursor:
+            created_at, pk = self.decode_cursor(self.cursor)
+            qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        return qs.order_by('-created_at', '-id')[:self.page_size + 1]
+
+    def take_rows(self, rows):
+        if self.forward:
+            self.has_more_after = len(rows) > self.page_size
+            rows = rows[:self.page_size]
+            self.has_more_before = True
+        else:
+            self.has_more_before = len(rows) > self.page_size
+            rows = rows[:self.page_size]
+            rows.reverse()
+            self.has_more_after = bool(self.cursor)
+
+        self.rows = rows
+        return rows
+
+    def get_before_cursor(self):
+        if not self.rows or not self.has_more_before:
+            return None
+        return self.encode_cursor(self.rows[0])
+
+    def get_after_cursor(self):
+        if not self.rows:
+            return None
+        return self.encode_cursor(self.rows[-1])
+
+    def get_paginated_response(self, data):
+        return Response({
+            'before': self.get_before_cursor(),
+            'after': self.get_after_cursor(),
+            'has_more': self.has_more_after if self.forward else self.has_more_before,
+            'has_more_before': self.has_more_before,
+            'has_more_after': self.has_more_after,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'before': {'type': 'string', 'nullable': True},
+                'after': {'type': 'string', 'nullable': True},
+                'has_more': {'type': 'boolean'},
+                'has_more_before': {'type': 'boolean'},
+                'has_more_after': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+    def encode_cursor(self, obj):
+        return encode_cursor(obj)
+
+    def decode_cursor(self, token):
+        try:
+            return decode_cursor(token)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class DeltaPagination(ClampedPageSizeMixin, BasePagination):
+    """
+    Delta sync: only the messages a client does not hold yet.
+
+    GET /api/messages/?user=A&since=<id>  -> messages with id > since, oldest first
+
+    `latest` is the id to send as `since` next time; when `has_more` is true
+    the client keeps asking with it until it is caught up.
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    since_query_param = 'since'
+    invalid_since_message = 'Invalid since'
+
+    @classmethod
+    def requested(cls, request):
+        return cls.since_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.take_rows(list(self.page_query(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Same page through the async ORM (plain QuerySets only, not archive tiers)."""
+        return self.take_rows([row async for row in self.page_query(queryset, request)])
+
+    def page_query(self, queryset, request):
+        self.page_size = self.get_page_size(request)
+        try:
+            self.since = int(request.query_params.get(self.since_query_param))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_since_message)
+        return queryset.filter(id__gt=self.since).order_by('id')[:self.page_size + 1]
+
+    def take_rows(self, rows):
+        self.has_more = len(rows) > self.page_size
+        self.rows = rows[:self.page_size]
+        return self.rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'since': self.since,
+            'latest': self.rows[-1].id if self.rows else self.since,
+            'has_more': self.has_more,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'since': {'type': 'integer'},
+                'latest': {'type': 'integer'},
+                'has_more': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
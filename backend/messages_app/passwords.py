@@ -0,0 +1,204 @@
+"""
+Password hashing off the request threads' CPU budget.
+
+make_password / check_password are deliberately slow (PBKDF2, scrypt or
+Argon2, see PASSWORD_HASHER and messages_app.hashers). Done inline, a burst
+of logins keeps every gunicorn thread busy hashing and message traffic
+queues behind it. Here every hash runs on a small per-process pool:
+
+MESSAGES_PASSWORD_WORKERS    hashes computed at once (hashlib and argon2
+                             release the GIL, so this is real parallelism)
+MESSAGES_PASSWORD_MAX_QUEUE  hashes allowed to wait for a worker; beyond
+                             that HashPoolBusy is raised right away (503)
+MESSAGES_PASSWORD_TIMEOUT    seconds a request waits for its result
+
+Queue depth, wait time and hash time go to the metrics registry
+(/api/metrics/) and to GET /api/auth/hash-pool/.
+
+verify() rehashes on a successful login when the stored hash was made with
+another hasher or another cost, so changing the settings upgrades accounts
+as their owners log in.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.db import close_old_connections
+
+from . import metrics
+from .models import Account
+
+
+class HashPoolBusy(Exception):
+    """The pool is saturated (queue full or result not ready in time)."""
+
+
+def _setting(name, default):
+    return getattr(settings, f"MESSAGES_PASSWORD_{name}", default)
+
+
+class PoolStats:
+    """Queueing counters of this process, same shape as the other snapshot views."""
+    def __init__(self, window=512):
+        self._lock = threading.Lock()
+        self._window = window
+        self._clear()
+
+    def _clear(self):
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.wait_ms = deque(maxlen=self._window)
+        self.hash_ms = deque(maxlen=self._window)
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+
+    def incr(self, field, value=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + value)
+
+    def started(self, wait_ms):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_ms.append(wait_ms)
+
+    def finished(self, hash_ms):
+        with self._lock:
+            self.running -= 1
+            self.completed += 1
+            self.hash_ms.append(hash_ms)
+
+    def snapshot(self):
+        with self._lock:
+            out = {k: getattr(self, k) for k in ('queued', 'running', 'completed', 'rejected', 'timeouts')}
+            for name in ('wait_ms', 'hash_ms'):
+                recent = sorted(getattr(self, name))
+                for p in (50, 95, 99):
+                    out[f"{name[:-3]}_p{p}_ms"] = recent[min(len(recent) - 1, len(recent) * p // 100)] if recent else 0.0
+        out['workers'] = _setting('WORKERS', 2)
+        out['max_queue'] = _setting('MAX_QUEUE', 32)
+        return out
+
+
+stats = PoolStats()
+
+_executor = None
+_slots = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor, _slots
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = max(1, _setting('WORKERS', 2))
+                _slots = threading.BoundedSemaphore(workers + max(0, _setting('MAX_QUEUE', 32)))
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+    return _executor, _slots
+
+
+def submit(op, fn, *args):
+    """Queue fn(*args) on the pool; raises HashPoolBusy right away when it is full."""
+    executor, slots = _pool()
+    labels = (('op', op),)
+    if not slots.acquire(blocking=False):
+        stats.incr('rejected')
+        metrics.registry.inc('password_hash_total', labels + (('outcome', 'rejected'),))
+        raise HashPoolBusy('password hashing queue is full')
+    stats.incr('queued')
+    submitted = time.perf_counter()
+
+    def task():
+        started = time.perf_counter()
+        wait_ms = (started - submitted) * 1000
+        stats.started(wait_ms)
+        metrics.registry.observe('password_hash_wait_ms', labels, wait_ms, metrics.DURATION_BUCKETS)
+        try:
+            return fn(*args)
+        finally:
+            hash_ms = (time.perf_counter() - started) * 1000
+            stats.finished(hash_ms)
+            metrics.registry.observe('password_hash_duration_ms', labels, hash_ms, metrics.DURATION_BUCKETS)
+            slots.release()
+
+    try:
+        return executor.submit(task)
+    except BaseException:
+        stats.incr('queued', -1)
+        slots.release()
+        raise
+
+
+def _timed_out(op):
+    # the hash still finishes in the background and frees its slot then
+    stats.incr('timeouts')
+    metrics.registry.inc('password_hash_total', (('op', op), ('outcome', 'timeout')))
+    return HashPoolBusy('password hashing timed out')
+
+
+def run(op, fn, *args):
+    """Run fn(*args) on the pool and wait for it; raises HashPoolBusy when saturated."""
+    future = submit(op, fn, *args)
+    try:
+        result = future.result(timeout=_setting('TIMEOUT', 10))
+    except FutureTimeout:
+        raise _timed_out(op)
+    metrics.registry.inc('password_hash_total', (('op', op), ('outcome', 'ok')))
+    return result
+
+
+async def arun(op, fn, *args):
+    """run() for async views: the event loop awaits the pool, no thread waits on it."""
+    future = submit(op, fn, *args)
+    try:
+        # shielded: cancelling a queued task would skip the slot release in task()
+        result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), _setting('TIMEOUT', 10))
+    except asyncio.TimeoutError:
+        raise _timed_out(op)
+    metrics.registry.inc('password_hash_total', (('op', op), ('outcome', 'ok')))
+    return result
+
+
+def hash_password(password):
+    """Encoded hash for a new password, or '' for "no password"."""
+    if not password:
+        return ''
+    return run('hash', make_password, password)
+
+
+def _rehash_setter(account):
+    encoded = account.password_hash
+
+    def setter(raw):
+        upgraded = make_password(raw)
+        try:
+            # conditional on the old hash, so a concurrent password change wins
+            if Account.objects.filter(pk=account.pk, password_hash=encoded).update(password_hash=upgraded):
+                account.password_hash = upgraded
+                metrics.registry.inc('password_rehash_total', ())
+        finally:
+            # pool threads live outside the request cycle
+            close_old_connections()
+    return setter
+
+
+def verify(account, password):
+    """
+    check_password() against the account's stored hash. A correct password
+    stored with an outdated hasher/cost is rehashed in the same pool task.
+    """
+    return run('verify', check_password, password, account.password_hash, _rehash_setter(account))
+
+
+async def averify(account, password):
+    return await arun('verify', check_password, password, account.password_hash, _rehash_setter(account))
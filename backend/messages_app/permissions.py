@@ -0,0 +1,50 @@
+"""
+Who may write an account's messages.
+
+An account with a password only accepts writes (sends, mark viewed, history
+deletion, imports, account updates) from requests carrying its own bearer
+token (messages_app.tokens). Accounts without a password, like the builtin A
+and B, have no credential to check and stay open to anyone, as before.
+
+Reads (lists, export, summary, the event stream) are not checked: the stream
+is opened by EventSource, which cannot send an Authorization header.
+
+The check runs in the write handlers rather than as a DRF permission class:
+AsyncAPIView runs initial() on the event loop for anonymous requests, where
+the accounts table can't be queried.
+"""
+from rest_framework import exceptions
+
+from .models import Account
+
+
+def owns(request, identifier):
+    """True when the request is authenticated as `identifier`."""
+    user = getattr(request, 'user', None)
+    return isinstance(user, Account) and user.pk == identifier
+
+
+def may_write(request, identifier):
+    if owns(request, identifier):
+        return True
+    return not Account.objects.filter(pk=identifier).exclude(password_hash='').exists()
+
+
+def check_writer(request, identifier):
+    """Raise NotAuthenticated (401) / PermissionDenied (403) unless may_write()."""
+    if may_write(request, identifier):
+        return
+    if isinstance(getattr(request, 'user', None), Account):
+        raise exceptions.PermissionDenied('this token belongs to another account')
+    raise exceptions.NotAuthenticated('this account requires its token')
+
+
+def writer_check(request):
+    """may_write() for many accounts of one request (an import), one query per account."""
+    seen = {}
+
+    def allowed(identifier):
+        if identifier not in seen:
+            seen[identifier] = may_write(request, identifier)
+        return seen[identifier]
+    return allowed
@@ -0,0 +1,346 @@
+"""
+Background auto-reply pipeline.
+
+POST /api/messages/ (and /api/messages/batch/) stores the user message plus a
+ReplyJob row and returns.
+A ReplyWorkerPool drains due jobs: it claims a row with a conditional UPDATE
+(safe with several gunicorn workers or `manage.py run_reply_worker`
+processes sharing the table), runs the responders with a timeout, stores the
+'received' message and publishes it on the event stream. Failures are
+retried with exponential backoff up to MESSAGES_REPLY_MAX_ATTEMPTS.
+
+MESSAGES_REPLY_MODE:
+    'thread'   -> pool of threads inside each web process (default)
+    'external' -> jobs are only processed by `manage.py run_reply_worker`
+    'inline'   -> processed synchronously right after commit (tests/dev)
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import events, summaries
+from .models import Message, ReplyJob
+from .serializers import MessageSerializer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESPONDERS = ['messages_app.responders.TemplateResponder']
+
+
+def _setting(name, default):
+    return getattr(settings, f"MESSAGES_REPLY_{name}", default)
+
+
+def mode():
+    return _setting('MODE', 'thread')
+
+
+def get_responders():
+    return [import_string(path)() for path in _setting('RESPONDERS', DEFAULT_RESPONDERS)]
+
+
+class ResponderMetrics:
+    """Per-responder latency/outcome counters, kept in process memory."""
+    def __init__(self, window=512):
+        self._lock = threading.Lock()
+        self._window = window
+        self._stats = {}
+
+    def record(self, name, elapsed_ms, outcome):
+        with self._lock:
+            st = self._stats.get(name)
+            if st is None:
+                st = self._stats[name] = {
+                    'count': 0, 'ok': 0, 'empty': 0, 'error': 0, 'timeout': 0,
+                    'total_ms': 0.0, 'max_ms': 0.0, 'recent': deque(maxlen=self._window),
+                }
+            st['count'] += 1
+            st[outcome] += 1
+            st['total_ms'] += elapsed_ms
+            st['max_ms'] = max(st['max_ms'], elapsed_ms)
+            st['recent'].append(elapsed_ms)
+
+    def snapshot(self):
+        out = {}
+        with self._lock:
+            for name, st in self._stats.items():
+                recent = sorted(st['recent'])
+                row = {k: v for k, v in st.items() if k != 'recent'}
+                row['avg_ms'] = st['total_ms'] / st['count'] if st['count'] else 0.0
+                for p in (50, 95, 99):
+                    row[f'p{p}_ms'] = recent[min(len(recent) - 1, len(recent) * p // 100)] if recent else 0.0
+                out[name] = row
+        return out
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+metrics = ResponderMetrics()
+
+
+def enqueue(message):
+    """Create the reply job for message; must run inside the caller's transaction."""
+    return enqueue_many([message])[0]
+
+
+def enqueue_many(messages):
+    """Reply jobs for several saved messages with one INSERT (same rules as enqueue)."""
+    jobs = ReplyJob.objects.bulk_create([ReplyJob(message=message) for message in messages])
+    current = mode()
+    if current == 'inline':
+        for job in jobs:
+            transaction.on_commit(lambda pk=job.pk: process_job(pk))
+    elif current == 'thread' and jobs:
+        transaction.on_commit(lambda: get_pool().wake())
+    return jobs
+
+
+def _lease():
+    return timedelta(seconds=_setting('TIMEOUT', 10) * 3)
+
+
+def _due_filter(now):
+    # RUNNING rows whose lease expired belong to a worker that died mid-job
+    return (Q(status=ReplyJob.PENDING, run_after__lte=now)
+            | Q(status=ReplyJob.RUNNING, started_at__lt=now - _lease()))
+
+
+def due_job_ids(limit=50):
+    now = timezone.now()
+    # one ordered range read per half of _due_filter(): as a single OR the
+    # two index ranges had to be merged and sorted. Expired leases go first.
+    expired = ReplyJob.objects.filter(status=ReplyJob.RUNNING, started_at__lt=now - _lease()).order_by('started_at')
+    ids = list(expired.values_list('pk', flat=True)[:limit])
+    if len(ids) < limit:
+        pending = ReplyJob.objects.filter(status=ReplyJob.PENDING, run_after__lte=now).order_by('run_after')
+        ids += pending.values_list('pk', flat=True)[:limit - len(ids)]
+    return ids
+
+
+def claim(job_id):
+    """Take job_id if it is due. Returns the claim's started_at, the proof of ownership, or None."""
+    now = timezone.now()
+    taken = ReplyJob.objects.filter(_due_filter(now), pk=job_id).update(
+        status=ReplyJob.RUNNING, attempts=F('attempts') + 1, started_at=now,
+    )
+    return now if taken == 1 else None
+
+
+def _owned(job_id, claimed_at):
+    # a run can outlive its lease (responders run one after another, each up
+    # to its timeout) and the job be claimed again: whatever this run writes
+    # is conditional on the claim still being the one it made
+    return ReplyJob.objects.filter(pk=job_id, status=ReplyJob.RUNNING, started_at=claimed_at)
+
+
+_responder_executor = None
+_responder_executor_lock = threading.Lock()
+
+
+def _run_with_timeout(responder, message, timeout):
+    global _responder_executor
+    if _responder_executor is None:
+        with _responder_executor_lock:
+            if _responder_executor is None:
+                _responder_executor = ThreadPoolExecutor(
+                    max_workers=_setting('WORKERS', 2) * 2, thread_name_prefix='responder')
+    # a timed-out responder thread can't be killed; it finishes in the
+    # background and its result is discarded
+    return _responder_executor.submit(responder.reply, message).result(timeout=timeout)
+
+
+def generate_reply(message):
+    """Try responders in order; return (responder_name, text, errors)."""
+    default_timeout = _setting('TIMEOUT', 10)
+    errors = []
+    for responder in get_responders():
+        name = responder.get_name()
+        timeout = responder.timeout or default_timeout
+        start = time.perf_counter()
+        try:
+            text = _run_with_timeout(responder, message, timeout)
+        except FutureTimeout:
+            metrics.record(name, (time.perf_counter() - start) * 1000, 'timeout')
+            errors.append(f"{name}: timed out after {timeout}s")
+            continue
+        except Exception as exc:
+            metrics.record(name, (time.perf_counter() - start) * 1000, 'error')
+            logger.exception("responder %s failed for message %s", name, message.pk)
+            errors.append(f"{name}: {exc!r}")
+            continue
+        metrics.record(name, (time.perf_counter() - start) * 1000, 'ok' if text else 'empty')
+        if text:
+            return name, text, errors
+    return None, None, errors
+
+
+def process_job(job_id):
+    """Claim and run one job. Returns the final status, or None if someone else owns it."""
+    claimed_at = claim(job_id)
+    if claimed_at is None:
+        return None
+    try:
+        return _run_job(job_id, claimed_at)
+    except Exception as exc:
+        # e.g. the database was busy; give the job back instead of letting it
+        # sit in RUNNING until the lease expires
+        logger.exception("reply job %s crashed", job_id)
+        return _reschedule(job_id, claimed_at, [repr(exc)], None)
+
+
+def _run_job(job_id, claimed_at):
+    job = ReplyJob.objects.select_related('message').get(pk=job_id)
+    start = time.perf_counter()
+    name, text, errors = generate_reply(job.message)
+    latency_ms = (time.perf_counter() - start) * 1000
+
+    if not text:
+        return _reschedule(job.pk, claimed_at, errors, latency_ms)
+
+    msg = job.message
+    with transaction.atomic():
+        # marking the job done first takes its row lock: of two runs racing
+        # to finish, only the one still holding the claim stores a reply
+        if not _owned(job.pk, claimed_at).update(
+                status=ReplyJob.DONE, responder=name, latency_ms=latency_ms, last_error='\n'.join(errors)):
+            logger.warning("reply job %s was reclaimed while running; reply discarded", job.pk)
+            return None
+        reply = Message.objects.create(
+            user=msg.user,
+            user_name=msg.user_name,
+            text=text,
+            response_text='',
+            direction='received',
+            viewed=False,
+            created_at=timezone.now()
+        )
+        ReplyJob.objects.filter(pk=job.pk).update(reply=reply)
+        summaries.record_new(msg.user, [reply])
+        events.publish(msg.user, events.MESSAGE_CREATED,
+                       messages=MessageSerializer([reply], many=True).data)
+    return ReplyJob.DONE
+
+
+def _reschedule(job_id, claimed_at, errors, latency_ms):
+    owned = _owned(job_id, claimed_at)
+    attempts = owned.values_list('attempts', flat=True).first()
+    if attempts is None:
+        # reclaimed, or deleted along with its message (history deletion)
+        return None
+    changes = {'latency_ms': latency_ms, 'last_error': '\n'.join(errors) or 'no responder produced a reply'}
+    if attempts >= _setting('MAX_ATTEMPTS', 3):
+        changes['status'] = ReplyJob.FAILED
+    else:
+        changes['status'] = ReplyJob.PENDING
+        changes['run_after'] = timezone.now() + timedelta(seconds=_setting('RETRY_BACKOFF', 2) ** attempts)
+    if not owned.update(**changes):
+        return None
+    return changes['status']
+
+
+def job_counts():
+    rows = ReplyJob.objects.values('status').annotate(n=Count('pk')).order_by()
+    return {row['status']: row['n'] for row in rows}
+
+
+class ReplyWorkerPool:
+    """
+    A dispatcher thread polls for due jobs (or is woken by enqueue) and hands
+    them to a fixed pool of worker threads.
+    """
+    def __init__(self, workers=None, poll_interval=None):
+        self.workers = workers or _setting('WORKERS', 2)
+        self.poll_interval = poll_interval or _setting('POLL_INTERVAL', 1.0)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='reply-worker')
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='reply-dispatcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self, wait=True):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None and wait:
+            self._thread.join()
+        self._executor.shutdown(wait=wait)
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.dispatch()
+            except Exception:
+                logger.exception("reply dispatcher iteration failed")
+            finally:
+                close_old_connections()
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def dispatch(self):
+        with self._lock:
+            free = self.workers - len(self._inflight)
+            busy = set(self._inflight)
+        if free <= 0:
+            return 0
+        ids = [pk for pk in due_job_ids(limit=free + len(busy)) if pk not in busy][:free]
+        for pk in ids:
+            with self._lock:
+                self._inflight.add(pk)
+            self._executor.submit(self._work, pk)
+        return len(ids)
+
+    def _work(self, job_id):
+        try:
+            process_job(job_id)
+        except Exception:
+            logger.exception("reply job %s crashed", job_id)
+        finally:
+            close_old_connections()
+            with self._lock:
+                self._inflight.discard(job_id)
+            # pick up anything that queued up while all workers were busy
+            self._wakeup.set()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ReplyWorkerPool().start()
+    return _pool
+
+
+def start_pool():
+    """
+    Start this process's pool in 'thread' mode without waiting for a send, so
+    jobs left pending or with an expired lease by a previous run get their
+    reply. Called once a serving process exists: gunicorn's post_worker_init
+    (after the fork when the app is preloaded) and runserver's child process.
+    """
+    if mode() == 'thread':
+        get_pool()
@@ -0,0 +1,40 @@
+"""
+Automated reply generators.
+
+A responder turns a stored 'sent' Message into reply text. The worker pool
+(messages_app.replies) tries the responders listed in MESSAGES_REPLY_RESPONDERS
+in order; the first one that returns a non-empty string wins. Slow responders
+(rules engines, retrieval, a local model) only need to subclass BaseResponder.
+"""
+
+
+class BaseResponder:
+    # shown in metrics and stored on ReplyJob.responder
+    name = None
+    # seconds; None uses MESSAGES_REPLY_TIMEOUT
+    timeout = None
+
+    def get_name(self):
+        return self.name or type(self).__name__
+
+    def reply(self, message):
+        """Return the reply text for message, or '' / None to defer to the next responder."""
+        raise NotImplementedError
+
+
+class TemplateResponder(BaseResponder):
+    """The original canned replies, picked by the message timestamp."""
+    name = 'template'
+
+    templates = [
+        "Obrigado, {name}. Em breve nossa equipe retornará.",
+        "Recebemos sua mensagem, {name} — já encaminhamos para o time.",
+        "Perfeito, {name}! Em instantes alguém irá falar com você.",
+        "Sua solicitação foi registrada, {name}. Acompanhe por aqui.",
+        "Obrigado! Um especialista entrará em contato em breve, {name}.",
+    ]
+
+    def reply(self, message):
+        name = message.user_name or f"Usuário {message.user}"
+        idx = message.created_at.microsecond % len(self.templates)
+        return self.templates[idx].format(name=name)
@@ -0,0 +1,205 @@
+"""
+Batched deletion and retention of messages.
+
+Deleting a whole history with one QuerySet.delete() makes Django's collector
+load every row (plus their ReplyJobs) and holds the SQLite write lock for the
+entire statement. Here rows go in batches of MESSAGES_DELETE_BATCH_SIZE by
+primary-key range, one short transaction each, with an optional pause
+between batches so other writers get the lock.
+
+History deletions are recorded as HistoryDeletion rows: they report progress,
+may run in a background thread, and are resumed by `manage.py
+compact_messages` if the process died mid-way. The same command enforces the
+retention policy:
+
+MESSAGES_RETENTION_KEEP_LAST  keep at least the newest N messages per account
+MESSAGES_RETENTION_DAYS       keep everything newer than D days
+Both set: a message goes only when it is outside the newest N *and* older
+than D days. Neither set: nothing expires.
+Both apply to the hot table and the archive tier (messages_app.archive).
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import archive, events, summaries
+from .models import ArchivedMessage, HistoryDeletion, Message
+
+# archive tier first, so a partial run never leaves archived rows without
+# their newer hot ones
+TIERS = (ArchivedMessage, Message)
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, f"MESSAGES_{name}", default)
+
+
+def batch_size():
+    return max(1, _setting('DELETE_BATCH_SIZE', 500))
+
+
+def delete_batch(queryset, user, size=None):
+    """
+    Delete up to `size` messages of `queryset` (all of one user), lowest ids
+    first, in one transaction. Returns the number of messages removed.
+    """
+    size = size or batch_size()
+    with transaction.atomic():
+        rows = list(queryset.order_by('id').values_list('id', 'viewed')[:size])
+        if not rows:
+            return 0
+        # the range is bounded by the ids just read, so the collector only
+        # ever sees one batch of messages and their reply jobs
+        batch = queryset.filter(id__gte=rows[0][0], id__lte=rows[-1][0])
+        batch.delete()
+        summaries.record_deleted(user, len(rows), sum(1 for _, viewed in rows if not viewed))
+    return len(rows)
+
+
+def delete_in_batches(queryset, user, size=None, pause=None, on_batch=None):
+    """Drain `queryset` batch by batch; on_batch(deleted_so_far) after each one."""
+    pause = _setting('DELETE_BATCH_PAUSE', 0.0) if pause is None else pause
+    deleted = 0
+    while True:
+        n = delete_batch(queryset, user, size)
+        if not n:
+            break
+        deleted += n
+        if on_batch is not None:
+            on_batch(deleted)
+        if pause:
+            time.sleep(pause)
+    if deleted:
+        summaries.rebuild(user)
+    return deleted
+
+
+# history deletion jobs ---------------------------------------------------------
+
+def start_history_deletion(user, background=False):
+    """
+    Record a deletion of everything `user` has right now; messages that
+    arrive afterwards are kept. Runs it inline, or in a thread after commit.
+    """
+    upto = max((model.objects.filter(user=user).order_by('-id').values_list('id', flat=True).first() or 0)
+               for model in TIERS)
+    total = sum(model.objects.filter(user=user, id__lte=upto).count() for model in TIERS) if upto else 0
+    job = HistoryDeletion.objects.create(user=user, upto_id=upto, total=total)
+    if background:
+        transaction.on_commit(lambda: threading.Thread(
+            target=_run_in_thread, args=(job.pk,), name=f"history-deletion-{job.pk}", daemon=True).start())
+    else:
+        run_history_deletion(job.pk)
+        job.refresh_from_db()
+    return job
+
+
+def _lease():
+    return timedelta(seconds=_setting('DELETE_LEASE', 60))
+
+
+def claim(job_id):
+    # RUNNING rows that stopped reporting progress belong to a dead process
+    now = timezone.now()
+    return HistoryDeletion.objects.filter(
+        Q(status=HistoryDeletion.PENDING) | Q(status=HistoryDeletion.RUNNING, updated_at__lt=now - _lease()),
+        pk=job_id,
+    ).update(status=HistoryDeletion.RUNNING, updated_at=now) == 1
+
+
+def run_history_deletion(job_id):
+    """Claim and run one deletion. Returns the final status, or None if someone else owns it."""
+    if not claim(job_id):
+        return None
+    job = HistoryDeletion.objects.get(pk=job_id)
+    base = job.deleted_count
+    deleted = 0
+
+    def progress(n):
+        HistoryDeletion.objects.filter(pk=job_id).update(deleted_count=base + deleted + n, updated_at=timezone.now())
+
+    try:
+        for model in TIERS:
+            queryset = model.objects.filter(user=job.user, id__lte=job.upto_id)
+            deleted += delete_in_batches(queryset, job.user, on_batch=progress)
+    except Exception as exc:
+        logger.exception("history deletion %s failed", job_id)
+        HistoryDeletion.objects.filter(pk=job_id).update(
+            status=HistoryDeletion.FAILED, last_error=repr(exc), updated_at=timezone.now())
+        return HistoryDeletion.FAILED
+    with transaction.atomic():
+        HistoryDeletion.objects.filter(pk=job_id).update(
+            status=HistoryDeletion.DONE, finished_at=timezone.now(), updated_at=timezone.now())
+        if base + deleted:
+            events.publish(job.user, events.HISTORY_DELETED, deleted_count=base + deleted)
+    return HistoryDeletion.DONE
+
+
+def _run_in_thread(job_id):
+    try:
+        run_history_deletion(job_id)
+    finally:
+        close_old_connections()
+
+
+def resumable_deletion_ids():
+    now = timezone.now()
+    return list(HistoryDeletion.objects.filter(
+        Q(status=HistoryDeletion.PENDING) | Q(status=HistoryDeletion.RUNNING, updated_at__lt=now - _lease())
+    ).order_by('created_at').values_list('pk', flat=True))
+
+
+# retention ---------------------------------------------------------------------
+
+def policy(keep_last=None, days=None):
+    """(keep_last, days) from the arguments, falling back to the settings."""
+    if keep_last is None:
+        keep_last = _setting('RETENTION_KEEP_LAST', None)
+    if days is None:
+        days = _setting('RETENTION_DAYS', None)
+    return keep_last or None, days or None
+
+
+def expired(user, keep_last=None, days=None, now=None):
+    """
+    Messages of `user` outside the retention policy, one queryset per tier
+    (empty list when nothing expires).
+    """
+    if keep_last is None and days is None:
+        return []
+    condition = Q()
+    if keep_last is not None:
+        # newest message that still has to stay, via the (user, created_at, id)
+        # index of each tier
+        newest = archive.for_user(user).order_by('-created_at', '-id').values_list('created_at', 'id')
+        boundary = newest[keep_last - 1:keep_last]
+        if not boundary:
+            return []
+        created_at, pk = boundary[0]
+        condition &= Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+    if days is not None:
+        condition &= Q(created_at__lt=(now or timezone.now()) - timedelta(days=days))
+    return [model.objects.filter(condition, user=user) for model in TIERS]
+
+
+def compact(users, keep_last=None, days=None, dry_run=False, size=None, pause=None):
+    """Apply the retention policy to `users`; returns {user: expired/deleted count}."""
+    now = timezone.now()
+    report = {}
+    for user in users:
+        querysets = expired(user, keep_last, days, now)
+        if dry_run:
+            count = sum(qs.count() for qs in querysets)
+        else:
+            count = sum(delete_in_batches(qs, user, size=size, pause=pause) for qs in querysets)
+        if count:
+            report[user] = count
+    return report
@@ -0,0 +1,198 @@
+"""
+Full-text search over Message.text / Message.response_text, in both the hot
+table and the archive tier (ArchivedMessage). Each table has its own index, so
+bm25 ranks from the two tiers are only roughly comparable.
+
+SQLite  -> external-content FTS5 table kept in sync by triggers (bm25 + snippet()).
+Postgres -> GIN index on a to_tsvector() expression (ts_rank + ts_headline).
+Anything else falls back to icontains without ranking.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, CharField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from .models import ArchivedMessage, Message
+
+# hot table first; the archive tier (messages_app.archive) gets its own index
+TABLES = (Message._meta.db_table, ArchivedMessage._meta.db_table)
+PG_INDEXES = {TABLES[0]: "msg_search_gin_idx", TABLES[1]: "archmsg_search_gin_idx"}
+PG_DOCUMENT = "to_tsvector('simple', coalesce(text, '') || ' ' || coalesce(response_text, ''))"
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+# snippet() / ts_headline() copy the stored text as is: they delimit matches
+# with these private-use characters and highlight() escapes the text before
+# turning them into HIGHLIGHT_START / HIGHLIGHT_END
+MATCH_START = '\ue000'
+MATCH_END = '\ue001'
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_table(table):
+    return f"{table}_fts"
+
+
+def _sqlite_triggers(table):
+    fts = fts_table(table)
+    return {
+        f"{fts}_ai": f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts}(rowid, text, response_text)
+                VALUES (new.id, new.text, new.response_text);
+            END""",
+        f"{fts}_ad": f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, text, response_text)
+                VALUES ('delete', old.id, old.text, old.response_text);
+            END""",
+        # only text columns: mark_viewed updates must not touch the index
+        f"{fts}_au": f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF text, response_text ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, text, response_text)
+                VALUES ('delete', old.id, old.text, old.response_text);
+                INSERT INTO {fts}(rowid, text, response_text)
+                VALUES (new.id, new.text, new.response_text);
+            END""",
+    }
+
+
+def install(connection):
+    """
+    Create the search index of every message table for this connection's
+    backend. Idempotent; tables that don't exist yet are skipped.
+
+    On SQLite, table rebuilds done by later AlterField migrations drop the
+    triggers; this is also wired to post_migrate so they are restored and the
+    FTS table is rebuilt whenever that happens.
+    """
+    existing_tables = connection.introspection.table_names()
+    with connection.cursor() as cursor:
+        for table in TABLES:
+            if table not in existing_tables:
+                continue
+            fts = fts_table(table)
+            if connection.vendor == 'sqlite':
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                    f"text, response_text, content='{table}', content_rowid='id', "
+                    f"tokenize='unicode61 remove_diacritics 2')"
+                )
+                cursor.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+                    [table],
+                )
+                existing = {row[0] for row in cursor.fetchall()}
+                triggers = _sqlite_triggers(table)
+                missing = [name for name in triggers if name not in existing]
+                for name in missing:
+                    cursor.execute(triggers[name])
+                if missing:
+                    cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+            elif connection.vendor == 'postgresql':
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {PG_INDEXES[table]} ON {table} USING GIN ({PG_DOCUMENT})")
+
+
+def uninstall(connection, tables=TABLES):
+    with connection.cursor() as cursor:
+        for table in tables:
+            if connection.vendor == 'sqlite':
+                for name in _sqlite_triggers(table):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+                cursor.execute(f"DROP TABLE IF EXISTS {fts_table(table)}")
+            elif connection.vendor == 'postgresql':
+                cursor.execute(f"DROP INDEX IF EXISTS {PG_INDEXES[table]}")
+
+
+def tokenize(term):
+    return _TOKEN_RE.findall(term or '')
+
+
+def _match(vendor, tokens):
+    """The full-text query for tokens: every word, prefix match."""
+    if vendor == 'sqlite':
+        return ' '.join(f'"{t}"*' for t in tokens)
+    return ' & '.join(f"{t}:*" for t in tokens)
+
+
+def matching(queryset, term):
+    """
+    Filter queryset to messages matching term through the full-text index,
+    without search()'s rank/snippet annotations (e.g. the admin changelist).
+    """
+    tokens = tokenize(term)
+    vendor = connections[queryset.db].vendor
+    table = queryset.model._meta.db_table
+
+    if not tokens or vendor not in ('sqlite', 'postgresql'):
+        term = (term or '').strip()
+        return queryset.filter(Q(text__icontains=term) | Q(response_text__icontains=term))
+    if vendor == 'sqlite':
+        fts = fts_table(table)
+        return queryset.filter(RawSQL(
+            f"{table}.id IN (SELECT rowid FROM {fts} WHERE {fts} MATCH %s)",
+            [_match(vendor, tokens)], output_field=BooleanField(),
+        ))
+    return queryset.filter(RawSQL(
+        f"{PG_DOCUMENT} @@ to_tsquery('simple', %s)",
+        [_match(vendor, tokens)], output_field=BooleanField(),
+    ))
+
+
+def search(queryset, term, ranked=False):
+    """
+    Filter queryset to messages matching term (every word, prefix match) and
+    annotate `rank` (higher is better) and `snippet` (matched text with the
+    matches between MATCH_START and MATCH_END, see highlight()). With
+    ranked=True the result is ordered by rank.
+    """
+    tokens = tokenize(term)
+    vendor = connections[queryset.db].vendor
+    table = queryset.model._meta.db_table
+    fts = fts_table(table)
+    qs = matching(queryset, term)
+
+    if not tokens or vendor not in ('sqlite', 'postgresql'):
+        return qs.annotate(
+            rank=Value(None, output_field=FloatField()),
+            snippet=Value(None, output_field=CharField()),
+        )
+
+    if vendor == 'sqlite':
+        match = _match(vendor, tokens)
+        correlated = f"FROM {fts} WHERE {fts} MATCH %s AND rowid = {table}.id"
+        qs = qs.annotate(
+            rank=RawSQL(f"(SELECT -bm25({fts}) {correlated})", [match], output_field=FloatField()),
+            snippet=RawSQL(
+                f"(SELECT snippet({fts}, -1, %s, %s, '…', 12) {correlated})",
+                [MATCH_START, MATCH_END, match], output_field=CharField(),
+            ),
+        )
+    else:
+        tsquery = _match(vendor, tokens)
+        qs = qs.annotate(
+            rank=RawSQL(
+                f"ts_rank({PG_DOCUMENT}, to_tsquery('simple', %s))",
+                [tsquery], output_field=FloatField(),
+            ),
+            snippet=RawSQL(
+                "ts_headline('simple', coalesce(text, '') || ' ' || coalesce(response_text, ''), "
+                "to_tsquery('simple', %s), %s)",
+                [tsquery, f"StartSel={MATCH_START}, StopSel={MATCH_END}, MaxWords=24, MinWords=8"],
+                output_field=CharField(),
+            ),
+        )
+
+    if ranked:
+        qs = qs.order_by('-rank', '-created_at', '-id')
+    return qs
+
+
+def highlight(snippet):
+    """HTML for a search() snippet: the text escaped, the matches in <mark>."""
+    if snippet is None:
+        return None
+    return escape(snippet).replace(MATCH_START, HIGHLIGHT_START).replace(MATCH_END, HIGHLIGHT_END)
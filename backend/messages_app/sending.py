@@ -0,0 +1,150 @@
+"""
+Message sends: POST /api/messages/ (one message) and POST /api/messages/batch/
+(the queue an offline client built up).
+
+Idempotency: a send may carry a key (the Idempotency-Key header, or `key` on
+each batch item). It is stored in Message.client_key under a unique
+(user, client_key) index, and a send whose key the account already used
+creates nothing: the answer describes the message stored the first time and
+its reply as it is now. A client that never got a response can therefore
+retry with the same key. Reusing a key for another text is refused (422).
+Keys live as long as their message (deleted or archived messages no longer
+deduplicate).
+
+Every send, one message or a batch, is one write transaction: the messages
+and their reply jobs are inserted with one bulk_create() each, followed by
+one summary update and one event.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.exceptions import APIException, ValidationError
+
+from . import account_cache, events, replies, summaries, throttling
+from .models import Message, ReplyJob
+from .serializers import MessageSerializer
+
+MAX_KEY_LENGTH = Message._meta.get_field('client_key').max_length
+
+
+class KeyReused(APIException):
+    status_code = 422
+    default_detail = 'Idempotency-Key já usada para outra mensagem'
+    default_code = 'idempotency_key_reused'
+
+
+def clean_key(raw, field='key'):
+    """The key as stored, None when absent."""
+    if raw is None:
+        return None
+    if not isinstance(raw, str):
+        raise ValidationError({field: 'expected a string'})
+    key = raw.strip()
+    if len(key) > MAX_KEY_LENGTH:
+        raise ValidationError({field: f"at most {MAX_KEY_LENGTH} characters"})
+    return key or None
+
+
+def batch_items(raw):
+    """[{'text', 'key'}] from the `messages` list of a batch request."""
+    limit = getattr(settings, 'MESSAGES_BATCH_MAX_SIZE', 100)
+    if not isinstance(raw, list) or not raw:
+        raise ValidationError({'messages': 'expected a non-empty list'})
+    if len(raw) > limit:
+        raise ValidationError({'messages': f"at most {limit} messages per batch"})
+    items = []
+    for index, item in enumerate(raw):
+        if not isinstance(item, dict):
+            raise ValidationError({'messages': f"item {index}: expected an object"})
+        text = item.get('text') or ''
+        if not isinstance(text, str):
+            raise ValidationError({'messages': f"item {index}: text must be a string"})
+        items.append({'text': text, 'key': clean_key(item.get('key'), f"messages[{index}].key")})
+    return items
+
+
+def display_name(user_id, given=None):
+    """The current account name if available, else what the client sent."""
+    profile = account_cache.get_profile(user_id)
+    if profile is not None:
+        return profile.name or (f"Usuário {user_id}")
+    return given or (f"Usuário {user_id}")
+
+
+class Sent:
+    """One sent message and its reply job; `replayed` when an earlier send had its key."""
+    def __init__(self, message, job, replayed):
+        self.message = message
+        self.job = job
+        self.replayed = replayed
+
+    def as_dict(self):
+        msg, job = self.message, self.job
+        reply = job.reply if job is not None else None
+        return {
+            'id': msg.id,
+            'user': msg.user,
+            'user_name': msg.user_name,
+            'text': msg.text,
+            'response_text': reply.text if reply else '',
+            'created_at': msg.created_at,
+            'response_id': reply.id if reply else None,
+            'reply_status': job.status if job is not None else None,
+        }
+
+
+def send(user_id, items, user_name=None):
+    """
+    Store items ([{'text', 'key'}], oldest first) as messages sent by user_id.
+    Returns one Sent per item, in order. Raises KeyReused when a key already
+    belongs to a message with a different text.
+    """
+    try:
+        return _send(user_id, items, user_name)
+    except IntegrityError:
+        # a concurrent send with the same key committed first (only possible
+        # on databases with concurrent writers); this time it is found
+        return _send(user_id, items, user_name)
+
+
+def _send(user_id, items, user_name):
+    name = display_name(user_id, user_name)
+    keys = [item['key'] for item in items if item['key']]
+    with throttling.timed_write(), transaction.atomic():
+        by_key = {}
+        if keys:
+            earlier = Message.objects.filter(user=user_id, client_key__in=keys).order_by()
+            by_key = {m.client_key: m for m in earlier}
+        now = timezone.now()
+        new, plan = [], []
+        for item in items:
+            known = by_key.get(item['key']) if item['key'] else None
+            if known is not None:
+                if known.text != item['text']:
+                    raise KeyReused()
+                plan.append((known, True))
+                continue
+            msg = Message(user=user_id, user_name=name, text=item['text'], response_text='',
+                          direction='sent', viewed=False, created_at=now, client_key=item['key'])
+            if item['key']:
+                by_key[item['key']] = msg
+            new.append(msg)
+            plan.append((msg, False))
+        if new:
+            Message.objects.bulk_create(new)
+            # published before enqueueing: in 'inline' mode the replies' events
+            # are sent from the jobs' on_commit callbacks and must come after
+            events.publish(user_id, events.MESSAGE_CREATED,
+                           messages=MessageSerializer(new, many=True).data)
+            jobs = {job.message_id: job for job in replies.enqueue_many(new)}
+            summaries.record_new(user_id, new)
+        else:
+            jobs = {}
+
+    # the reply exists by now only in 'inline' mode; replayed sends report
+    # whatever their job has done since
+    stale = {msg.id for msg, replayed in plan if replayed or replies.mode() == 'inline'}
+    if stale:
+        jobs.update({job.message_id: job for job in
+                     ReplyJob.objects.select_related('reply').filter(message_id__in=stale)})
+    return [Sent(msg, jobs.get(msg.id), replayed) for msg, replayed in plan]
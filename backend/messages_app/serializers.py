@@ -1,5 +1,7 @@
-from rest_framework import serializers
-from .models import Message, Account
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from . import search
+from .models import Message, Account, ConversationSummary, HistoryDeletion
 
 class AccountSerializer(serializers.ModelSerializer):
     class Meta:
@@ -20,3 +22,77 @@ class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = ['id','user','user_name','text','response_text','direction','viewed','created_at']
+
+
+MESSAGE_FIELDS = tuple(MessageSerializer.Meta.fields)
+
+
+def message_rows(rows):
+    """
+    Same output as MessageSerializer(rows, many=True).data for rows fetched with
+    .values_list(*MESSAGE_FIELDS): no model instances and no per-field
+    to_representation, only created_at needs formatting.
+    """
+    created_at = MESSAGE_FIELDS.index('created_at')
+    field = serializers.DateTimeField()
+    tz = field.default_timezone()
+    if tz is None or api_settings.DATETIME_FORMAT.lower() != ISO_8601:
+        to_datetime = field.to_representation
+    else:
+        def to_datetime(value):
+            value = value.astimezone(tz).isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+    out = []
+    for row in rows:
+        item = dict(zip(MESSAGE_FIELDS, row))
+        item['created_at'] = to_datetime(row[created_at])
+        out.append(item)
+    return out
+
+
+# columns that are usually the same on every row of one conversation's page
+SHARED_FIELDS = ('user', 'user_name', 'direction', 'viewed', 'response_text')
+
+
+def hoist_shared(rows, candidates=SHARED_FIELDS):
+    """
+    Compact list shape: fields with one value across all `rows` move out of
+    the rows into a `shared` dict (rows read as {**shared, **row}).
+    Returns (rows, shared).
+    """
+    if not rows:
+        return rows, {}
+    first = rows[0]
+    shared = {name: first[name] for name in candidates
+              if name in first and all(name in row and row[name] == first[name] for row in rows)}
+    if not shared:
+        return rows, shared
+    return [{k: v for k, v in row.items() if k not in shared} for row in rows], shared
+
+
+class ConversationSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ConversationSummary
+        fields = ['user', 'unread_count', 'total_count', 'archived_count', 'last_message_id', 'last_message_at']
+
+
+class HighlightField(serializers.CharField):
+    """A search.search() snippet as HTML: escaped text, matches in <mark>."""
+    def to_representation(self, value):
+        return search.highlight(value)
+
+
+class MessageSearchSerializer(MessageSerializer):
+    rank = serializers.FloatField(read_only=True, allow_null=True)
+    snippet = HighlightField(read_only=True, allow_null=True)
+
+    class Meta(MessageSerializer.Meta):
+        fields = MessageSerializer.Meta.fields + ['rank', 'snippet']
+
+
+class HistoryDeletionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = HistoryDeletion
+        fields = ['id', 'user', 'status', 'total', 'deleted_count', 'last_error', 'created_at', 'finished_at']
@@ -0,0 +1,144 @@
+"""
+Maintenance of ConversationSummary rows.
+
+Every writer of Message calls into here inside its own transaction, so the
+counters commit (or roll back) together with the messages they describe;
+the admin, which edits arbitrary rows, rebuilds the accounts it touched.
+Accounts without a row yet (legacy data) are rebuilt from Message once.
+QuerySet.update() skips auto_now, so updated_at is set explicitly: it is the
+Last-Modified of the account's message list.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import events
+from .models import ArchivedMessage, ConversationSummary, Message
+
+
+def _aggregate(user):
+    values = {'total_count': 0, 'unread_count': 0, 'archived_count': 0, 'archived_until': None,
+              'last_message_id': None, 'last_message_at': None}
+    newest = None
+    for model in (Message, ArchivedMessage):
+        qs = model.objects.filter(user=user)
+        agg = qs.aggregate(total=Count('id'), unread=Count('id', filter=Q(viewed=False)))
+        values['total_count'] += agg['total']
+        values['unread_count'] += agg['unread']
+        last = qs.order_by('-created_at', '-id').values_list('created_at', 'id').first()
+        if model is ArchivedMessage:
+            values['archived_count'] = agg['total']
+            values['archived_until'] = last[0] if last else None
+        if last is not None and (newest is None or last > newest):
+            newest = last
+    if newest is not None:
+        values['last_message_at'], values['last_message_id'] = newest
+    return values
+
+
+def rebuild(user):
+    """Recompute the summary for user from the Message table."""
+    values = _aggregate(user)
+    try:
+        with transaction.atomic():
+            ConversationSummary.objects.update_or_create(user=user, defaults=values)
+    except IntegrityError:
+        # a concurrent writer inserted the row first; it now exists
+        ConversationSummary.objects.filter(user=user).update(updated_at=timezone.now(), **values)
+
+
+def record_new(user, messages):
+    """Account for freshly created messages (newest last) of one user."""
+    if not messages:
+        return
+    last = messages[-1]
+    unread = sum(1 for m in messages if not m.viewed)
+    updated = ConversationSummary.objects.filter(user=user).update(
+        total_count=F('total_count') + len(messages),
+        unread_count=F('unread_count') + unread,
+        last_message_id=last.id,
+        last_message_at=last.created_at,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        rebuild(user)
+
+
+def record_imported(user, messages):
+    """
+    Account for imported messages of one user. Unlike record_new() they may be
+    older than what the account holds, so last_message_* only moves forward.
+    """
+    if not messages:
+        return
+    newest = max(messages, key=lambda m: (m.created_at, m.id))
+    now = timezone.now()
+    summary = ConversationSummary.objects.filter(user=user)
+    updated = summary.update(
+        total_count=F('total_count') + len(messages),
+        unread_count=F('unread_count') + sum(1 for m in messages if not m.viewed),
+        updated_at=now,
+    )
+    if not updated:
+        rebuild(user)
+        return
+    summary.filter(
+        Q(last_message_at__isnull=True) | Q(last_message_at__lt=newest.created_at)
+        | Q(last_message_at=newest.created_at, last_message_id__lt=newest.id)
+    ).update(last_message_id=newest.id, last_message_at=newest.created_at, updated_at=now)
+
+
+def record_deleted(user, total, unread):
+    """
+    Account for one batch of deleted messages. last_message_* may now point at
+    a deleted row; batched deleters call rebuild() once they are done.
+    """
+    ConversationSummary.objects.filter(user=user).update(
+        total_count=Greatest(F('total_count') - total, Value(0)),
+        unread_count=Greatest(F('unread_count') - unread, Value(0)),
+        updated_at=timezone.now(),
+    )
+
+
+def mark_viewed(user):
+    """
+    Mark every unread message of user as viewed. The summary is checked first
+    so the common nothing-to-do case never touches Message. unread_count goes
+    down by the rows actually changed rather than to 0, so a reply recorded
+    after the UPDATE still counts as unread. Publishes messages.viewed when
+    anything changed. Returns the number of rows changed.
+    """
+    with transaction.atomic():
+        summary = ConversationSummary.objects.filter(user=user).values_list('unread_count', flat=True).first()
+        if summary == 0:
+            return 0
+        changed = Message.objects.filter(user=user, viewed=False).update(viewed=True)
+        if summary is None:
+            rebuild(user)
+        elif changed:
+            ConversationSummary.objects.filter(user=user).update(
+                unread_count=Greatest(F('unread_count') - changed, Value(0)),
+                updated_at=timezone.now(),
+            )
+        if changed:
+            events.publish(user, events.MESSAGES_VIEWED, changed=changed)
+    return changed
+
+
+def version(summary):
+    """
+    (etag, last_modified) validators for the message list a summary row
+    describes; (None, None) when the account has no summary yet.
+    """
+    if summary is None:
+        return None, None
+    row = (summary.total_count, summary.unread_count, summary.last_message_id,
+           summary.last_message_at, summary.updated_at)
+    return '-'.join(str(v.timestamp()) if hasattr(v, 'timestamp') else str(v) for v in row), summary.updated_at
+
+
+def for_users(users):
+    """Summaries for many accounts in one query; missing accounts read as empty."""
+    found = {s.user: s for s in ConversationSummary.objects.filter(user__in=users)}
+    return [found.get(u) or ConversationSummary(user=u) for u in users]
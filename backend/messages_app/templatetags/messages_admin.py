@@ -0,0 +1,119 @@
+"""
+Date drill-down of the message changelist (MessageAdmin.date_hierarchy).
+
+Django's {% date_hierarchy %} finds the years/months/days that have rows with
+a DISTINCT over the truncated date of every row in the list. Here each period
+between the list's first and last date is probed with an EXISTS on a
+created_at range instead: a few index lookups on (created_at, id), or on
+(user, created_at, id) once the list is filtered by account.
+"""
+from datetime import datetime, timedelta
+
+from django import template
+from django.conf import settings
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+from django.contrib.admin.templatetags.base import InclusionAdminNode
+from django.db.models import Max, Min
+from django.utils import timezone
+
+register = template.Library()
+
+
+def _local_date(moment):
+    return (timezone.localtime(moment) if timezone.is_aware(moment) else moment).date()
+
+
+def _midnight(day):
+    moment = datetime.combine(day, datetime.min.time())
+    return timezone.make_aware(moment) if settings.USE_TZ else moment
+
+
+def _periods(first, last, kind):
+    """(start, end) dates of every year/month/day from first to last."""
+    if kind == 'year':
+        start = first.replace(month=1, day=1)
+    elif kind == 'month':
+        start = first.replace(day=1)
+    else:
+        start = first
+    while start <= last:
+        if kind == 'year':
+            end = start.replace(year=start.year + 1)
+        elif kind == 'month':
+            end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+        else:
+            end = start + timedelta(days=1)
+        yield start, end
+        start = end
+
+
+class ProbedDates:
+    """
+    Stands in for cl.queryset in Django's date_hierarchy(). Probes run on the
+    list without the drill-down's own range (cl.undated_queryset) and clip to
+    it instead: a second range on created_at in the same WHERE would leave
+    SQLite seeking by the outer one and walking to the probed period.
+    """
+    def __init__(self, queryset, field_name, lower=None, upper=None):
+        self.queryset = queryset
+        self.field_name = field_name
+        self.lower = lower
+        self.upper = upper
+        self._ends = {}
+
+    def within(self, start=None, end=None):
+        """The list restricted to [start, end) and to the drill-down range."""
+        if self.lower is not None:
+            start = max(start, self.lower) if start is not None else self.lower
+        if self.upper is not None:
+            end = min(end, self.upper) if end is not None else self.upper
+        lookups = {}
+        if start is not None:
+            lookups[f"{self.field_name}__gte"] = start
+        if end is not None:
+            lookups[f"{self.field_name}__lt"] = end
+        return self.queryset.filter(**lookups)
+
+    def aggregate(self, **kwargs):
+        # MIN and MAX in one SELECT defeat SQLite's min/max optimization (a
+        # whole-index scan); as two ORDER BY ... LIMIT 1 reads each is one seek
+        out = {}
+        for name, expr in kwargs.items():
+            order = expr.source_expressions[0].name
+            if not isinstance(expr, Min):
+                order = f"-{order}"
+            if order not in self._ends:
+                self._ends[order] = self.within().order_by(order).values_list(order.lstrip('-'), flat=True).first()
+            out[name] = self._ends[order]
+        return out
+
+    def datetimes(self, field_name, kind, **kwargs):
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+        return [
+            _midnight(start)
+            for start, end in _periods(_local_date(bounds['first']), _local_date(bounds['last']), kind)
+            if self.within(_midnight(start), _midnight(end)).exists()
+        ]
+
+    dates = datetimes
+
+
+class _ProbingChangeList:
+    def __init__(self, cl):
+        self._cl = cl
+        self.queryset = ProbedDates(cl.undated_queryset, cl.date_hierarchy, *cl.date_range)
+
+    def __getattr__(self, name):
+        return getattr(self._cl, name)
+
+
+def probed_date_hierarchy(cl):
+    return date_hierarchy(_ProbingChangeList(cl))
+
+
+@register.tag(name='probed_date_hierarchy')
+def probed_date_hierarchy_tag(parser, token):
+    return InclusionAdminNode(parser, token, func=probed_date_hierarchy,
+                              template_name='date_hierarchy.html', takes_context=False)
@@ -0,0 +1,81 @@
+"""
+Reads across the archive horizon: TieredQuerySet slices and the list
+endpoints must give the same rows whether or not old messages were moved
+to ArchivedMessage.
+"""
+from datetime import timedelta
+
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from messages_app import archive, summaries
+from messages_app.loadtest import NO_BACKPRESSURE
+from messages_app.models import ArchivedMessage, Message
+
+USER = 'tiers'
+
+
+@override_settings(MESSAGES_REPLY_MODE='external', **NO_BACKPRESSURE)
+class TieredSliceTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        rows = []
+        for i in range(12):
+            # old and read: archived; every third one stays unread, so it stays
+            # hot and interleaves with the archive below the horizon
+            rows.append(Message(user=USER, text=f"antiga {i}", direction='sent', viewed=i % 3 != 0,
+                                created_at=now - timedelta(days=100, minutes=12 - i)))
+        for i in range(9):
+            rows.append(Message(user=USER, text=f"recente {i}", direction='sent', viewed=True,
+                                created_at=now - timedelta(minutes=9 - i)))
+        rows.append(Message(user='outro', text='x', direction='sent', viewed=True, created_at=now))
+        Message.objects.bulk_create(rows)
+        summaries.rebuild(USER)
+        cls.ascending = list(Message.objects.filter(user=USER).order_by('created_at', 'id').values_list('id', flat=True))
+        cls.pages = cls.list_pages()
+        archive.archive_user(USER, now - timedelta(days=30), size=3)
+
+    @classmethod
+    def list_pages(cls):
+        from rest_framework.test import APIClient
+        client = APIClient()
+        params = [{'page': 1}, {'page': 2}, {'page_size': 4, 'page': 3}, {'page_size': 5, 'page': 2},
+                  {'before': '', 'page_size': 5}, {'since': 0, 'page_size': 50}]
+        return [(p, client.get('/api/messages/', dict(p, user=USER)).json()) for p in params]
+
+    def tiered(self, *ordering):
+        queryset = archive.for_user(USER)
+        self.assertIsInstance(queryset, archive.TieredQuerySet)
+        # the merge compares the ordering columns, so they have to be selected
+        return queryset.order_by(*ordering).values_list('id', 'created_at')
+
+    def ids(self, rows):
+        return [row[0] for row in rows]
+
+    def test_rows_were_split(self):
+        self.assertEqual(ArchivedMessage.objects.filter(user=USER).count(), 8)
+        self.assertEqual(Message.objects.filter(user=USER).count(), 13)
+
+    def test_every_slice(self):
+        descending = self.ascending[::-1]
+        asc, desc = self.tiered('created_at', 'id'), self.tiered('-created_at', '-id')
+        total = len(self.ascending)
+        self.assertEqual(self.ids(asc), self.ascending)
+        self.assertEqual(asc.count(), total)
+        for start in range(total + 1):
+            for stop in range(start, total + 2):
+                self.assertEqual(self.ids(asc[start:stop]), self.ascending[start:stop], (start, stop))
+                self.assertEqual(self.ids(desc[start:stop]), descending[start:stop], (start, stop))
+        self.assertEqual(desc[0][0], descending[0])
+        self.assertEqual(self.ids(asc[5:]), self.ascending[5:])
+
+    def test_recent_slice_stays_in_the_hot_table(self):
+        desc = self.tiered('-created_at', '-id')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.ids(desc[:5]), self.ascending[::-1][:5])
+
+    def test_endpoints_unchanged_by_archiving(self):
+        self.assertEqual(self.list_pages(), self.pages)
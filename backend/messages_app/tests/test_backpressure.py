@@ -0,0 +1,86 @@
+"""
+Send backpressure: token bucket throttling (429) and load shedding (503),
+both with the wait in Retry-After.
+"""
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from messages_app import throttling
+from messages_app.models import Message
+
+
+@override_settings(MESSAGES_REPLY_MODE='external', MESSAGES_THROTTLE_BACKEND='local',
+                   MESSAGES_SHED_WRITE_LATENCY_MS=0)
+class ThrottleTests(APITestCase):
+    # messages.account is 30/min: a full bucket, then one token every 2 s
+
+    def setUp(self):
+        throttling.get_store().clear()
+
+    def send(self, user='balde'):
+        return self.client.post('/api/messages/', {'user': user, 'text': 'x'}, format='json')
+
+    def drain(self, user='balde'):
+        response = self.client.post('/api/messages/batch/', {'user': user, 'messages': [{'text': 'x'}] * 30},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_empty_bucket(self):
+        self.drain()
+        response = self.send()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertEqual(Message.objects.filter(user='balde').count(), 30)
+
+    def test_batch_costs_one_token_per_message(self):
+        self.assertEqual(self.client.post('/api/messages/batch/', {'user': 'balde', 'messages': [{'text': 'x'}] * 29},
+                                          format='json').status_code, 201)
+        response = self.client.post('/api/messages/batch/', {'user': 'balde', 'messages': [{'text': 'x'}] * 2},
+                                    format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertEqual(self.send().status_code, 201)
+
+    def test_buckets_are_per_account(self):
+        self.drain()
+        self.assertEqual(self.send('outro').status_code, 201)
+
+    def test_reads_are_not_throttled(self):
+        self.drain()
+        self.assertEqual(self.client.get('/api/messages/', {'user': 'balde'}).status_code, 200)
+
+    @override_settings(MESSAGES_THROTTLE_BACKEND='off')
+    def test_off(self):
+        for _ in range(35):
+            self.assertEqual(self.send().status_code, 201)
+
+
+@override_settings(MESSAGES_REPLY_MODE='external', MESSAGES_THROTTLE_BACKEND='off',
+                   MESSAGES_SHED_WRITE_LATENCY_MS=50, MESSAGES_SHED_HALF_LIFE=3.0)
+class LoadSheddingTests(APITestCase):
+
+    def setUp(self):
+        throttling.write_latency.reset()
+        self.addCleanup(throttling.write_latency.reset)
+
+    def send(self):
+        return self.client.post('/api/messages/', {'user': 'carga', 'text': 'x'}, format='json')
+
+    def test_fast_writer_is_not_shed(self):
+        self.assertEqual(self.send().status_code, 201)
+
+    def test_slow_writer_sheds_writes(self):
+        # an average far above the threshold sheds (nearly) every write
+        throttling.write_latency.observe(10 ** 9)
+        response = self.send()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '3')
+        self.assertEqual(response.json()['detail'], throttling.Overloaded.default_detail)
+        self.assertFalse(Message.objects.exists())
+
+        throttling.write_latency.reset()
+        self.assertEqual(self.send().status_code, 201)
+
+    def test_reads_are_not_shed(self):
+        throttling.write_latency.observe(10 ** 9)
+        self.assertEqual(self.client.get('/api/messages/', {'user': 'carga'}).status_code, 200)
@@ -0,0 +1,96 @@
+"""
+Conditional GETs (ETag / 304) and `since` delta sync of GET /api/messages/.
+"""
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from messages_app.loadtest import NO_BACKPRESSURE
+from messages_app.models import Message
+
+USER = 'etag'
+
+
+@override_settings(MESSAGES_REPLY_MODE='external', **NO_BACKPRESSURE)
+class ConditionalListTests(APITestCase):
+
+    def setUp(self):
+        for i in range(5):
+            self.client.post('/api/messages/', {'user': USER, 'text': f"m{i}"}, format='json')
+
+    def get(self, etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get('/api/messages/', dict({'user': USER}, **params), **headers)
+
+    def test_not_modified(self):
+        first = self.get()
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first['Cache-Control'])
+        etag = first['ETag']
+
+        again = self.get(etag)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b'')
+        self.assertEqual(again['ETag'], etag)
+
+    def test_tag_is_per_url(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(etag, page_size=2).status_code, 200)
+
+    def test_writes_change_the_tag(self):
+        etag = self.get()['ETag']
+        marked = self.client.post(f"/api/messages/mark_viewed/?user={USER}")
+        self.assertEqual(marked.json()['changed'], 5)
+        after_viewed = self.get(etag)
+        self.assertEqual(after_viewed.status_code, 200)
+
+        etag = after_viewed['ETag']
+        self.client.post('/api/messages/', {'user': USER, 'text': 'novo'}, format='json')
+        self.assertEqual(self.get(etag).status_code, 200)
+
+        etag = self.get()['ETag']
+        self.client.post('/api/messages/delete_history/', {'user': USER}, format='json')
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_other_accounts_keep_the_tag(self):
+        etag = self.get()['ETag']
+        self.client.post('/api/messages/', {'user': 'outro', 'text': 'oi'}, format='json')
+        self.assertEqual(self.get(etag).status_code, 304)
+
+
+@override_settings(MESSAGES_REPLY_MODE='external', **NO_BACKPRESSURE)
+class DeltaSyncTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Message.objects.bulk_create([Message(user=USER, text=f"m{i}", direction='sent') for i in range(5)])
+        cls.ids = list(Message.objects.filter(user=USER).order_by('id').values_list('id', flat=True))
+
+    def delta(self, since, **params):
+        return self.client.get('/api/messages/', dict({'user': USER, 'since': since}, **params))
+
+    def test_only_newer_messages(self):
+        body = self.delta(self.ids[2]).json()
+        self.assertEqual([m['id'] for m in body['results']], self.ids[3:])
+        self.assertEqual(body['since'], self.ids[2])
+        self.assertEqual(body['latest'], self.ids[-1])
+        self.assertFalse(body['has_more'])
+
+    def test_catching_up_in_pages(self):
+        seen, since = [], 0
+        while True:
+            body = self.delta(since, page_size=2).json()
+            seen += [m['id'] for m in body['results']]
+            since = body['latest']
+            if not body['has_more']:
+                break
+        self.assertEqual(seen, self.ids)
+
+    def test_up_to_date(self):
+        body = self.delta(self.ids[-1]).json()
+        self.assertEqual(body['results'], [])
+        self.assertEqual(body['latest'], self.ids[-1])
+
+    def test_invalid_since(self):
+        self.assertEqual(self.delta('x').status_code, 404)
@@ -0,0 +1,79 @@
+"""
+Keyset (before/after cursor) pages of GET /api/messages/.
+"""
+from datetime import timedelta
+
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from messages_app.loadtest import NO_BACKPRESSURE
+from messages_app.models import Message
+from messages_app.pagination import encode_cursor
+
+USER = 'keyset'
+
+
+@override_settings(MESSAGES_REPLY_MODE='external', **NO_BACKPRESSURE)
+class KeysetPaginationTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        # pairs share a created_at, so the id has to break the ties
+        Message.objects.bulk_create([
+            Message(user=USER, text=f"m{i}", direction='sent', created_at=now - timedelta(minutes=25 - i // 2))
+            for i in range(25)
+        ] + [Message(user='outro', text='x', direction='sent', created_at=now)])
+        cls.ids = list(Message.objects.filter(user=USER).order_by('created_at', 'id').values_list('id', flat=True))
+
+    def page(self, **params):
+        response = self.client.get('/api/messages/', dict({'user': USER, 'page_size': 10}, **params))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids_of(self, body):
+        return [m['id'] for m in body['results']]
+
+    def test_latest_page(self):
+        body = self.page(before='')
+        self.assertEqual(self.ids_of(body), self.ids[-10:])
+        self.assertTrue(body['has_more'])
+        self.assertTrue(body['has_more_before'])
+        self.assertFalse(body['has_more_after'])
+        self.assertNotIn('count', body)
+
+    def test_walk_back_and_forth(self):
+        pages, cursor = [], ''
+        while True:
+            body = self.page(before=cursor)
+            pages.append(self.ids_of(body))
+            if not body['has_more']:
+                break
+            cursor = body['before']
+        self.assertEqual(pages, [self.ids[15:], self.ids[5:15], self.ids[:5]])
+        self.assertIsNone(body['before'])
+
+        # forward again from the oldest page
+        body = self.page(after=body['after'])
+        self.assertEqual(self.ids_of(body), self.ids[5:15])
+        self.assertTrue(body['has_more'])
+        body = self.page(after=body['after'])
+        self.assertEqual(self.ids_of(body), self.ids[15:])
+        self.assertFalse(body['has_more'])
+
+    def test_cursor_of_a_message(self):
+        middle = Message.objects.get(id=self.ids[12])
+        self.assertEqual(self.ids_of(self.page(before=encode_cursor(middle), page_size=3)), self.ids[9:12])
+        self.assertEqual(self.ids_of(self.page(after=encode_cursor(middle), page_size=3)), self.ids[13:16])
+
+    def test_bad_cursor(self):
+        for cursor in ('nao-e-cursor', '!!!', encode_cursor(Message(id=1, created_at=timezone.now()))[:-3]):
+            for param in ('before', 'after'):
+                response = self.client.get('/api/messages/', {'user': USER, param: cursor})
+                self.assertEqual(response.status_code, 404, (param, cursor))
+
+    def test_page_numbers_without_cursor(self):
+        body = self.page(page=3)
+        self.assertEqual(body['count'], 25)
+        self.assertEqual(self.ids_of(body), self.ids[20:])
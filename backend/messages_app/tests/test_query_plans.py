@@ -0,0 +1,220 @@
+"""
+EXPLAIN QUERY PLAN audit of every message access pattern.
+
+Each test drives an endpoint (or a reply/archive/retention job) against a
+fixed data set in the test database, runs EXPLAIN QUERY PLAN on every
+statement it issued and fails when one scans a whole table or index or
+sorts through a temp B-tree, unless ALLOWED says why that step is expected.
+The statistics are those of the fixture (ANALYZE in setUpTestData), so the
+verdict doesn't depend on what a live database happens to hold.
+"""
+import re
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from messages_app import archive, replies, retention, summaries, tokens
+from messages_app.loadtest import NO_BACKPRESSURE
+from messages_app.models import Account, Message, ReplyJob
+from messages_app.pagination import encode_cursor
+
+USER = 'plan-audit'
+ARCHIVED_USER = 'plan-audit-archived'
+STAFF = 'plan-audit-staff'
+OTHER_PREFIX = 'plan-other-'
+MESSAGES = 2000
+OTHERS = 250
+OTHER_MESSAGES = 40
+
+# plan steps that are expected: (scenario pattern, plan step pattern, SQL pattern, why)
+ALLOWED = [
+    (re.compile(r'^(admin )?search'), re.compile(r'^USE TEMP B-TREE FOR ORDER BY$'), re.compile(r'_fts MATCH'),
+     'full-text matches come out of the FTS index in rowid order: the sort is over the matches, '
+     'not the history (and ranked order only exists per match)'),
+    (re.compile(r'^admin'), re.compile(r'^SCAN messages_app_message USING (COVERING )?INDEX msg_created_id_idx$'),
+     re.compile(r'ORDER BY "messages_app_message"\."created_at" (ASC|DESC)(, "messages_app_message"\."id" DESC)? '
+                r'LIMIT \d+$'),
+     'walk of the (created_at, id) index from one end that stops at its LIMIT (one page, the recent '
+     'messages whose accounts the account filter lists, or the first/last date of the drill-down)'),
+    (re.compile(r'^admin'), re.compile(r'^SCAN sqlite_stat1$'), re.compile(r'FROM sqlite_stat1 WHERE tbl = '),
+     'row estimate for the changelist count: sqlite_stat1 has one row per index'),
+    (re.compile(r'^admin'), re.compile(r'^SCAN subquery( \d+)?$'),
+     re.compile(r'^SELECT COUNT\(\*\) FROM \(.* LIMIT \d+\) subquery$'),
+     'capped count of a filtered changelist: the derived table holds at most count_limit + 1 rows'),
+]
+
+# `SCAN t` / `SCAN t USING [COVERING] INDEX i` walk the whole table or index;
+# full-text lookups show up as `SCAN t_fts VIRTUAL TABLE INDEX n:M...` and are fine
+SCAN = re.compile(r'^SCAN (\S+)(?: (VIRTUAL TABLE))?')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE')
+PLANNABLE = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def problem(detail):
+    scan = SCAN.match(detail)
+    # CONSTANT ROW and (subquery-N) are not tables
+    if scan and not scan.group(2) and scan.group(1) != 'CONSTANT' and not scan.group(1).startswith('('):
+        return True
+    return bool(TEMP_SORT.search(detail))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'reads SQLite EXPLAIN QUERY PLAN output')
+@override_settings(MESSAGES_REPLY_MODE='external', **NO_BACKPRESSURE)
+class QueryPlanTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        rows = []
+        for user, count in [(USER, MESSAGES), (ARCHIVED_USER, MESSAGES)] + [
+                (f"{OTHER_PREFIX}{i}", OTHER_MESSAGES) for i in range(OTHERS)]:
+            rows += [Message(user=user, user_name='Audit', text=f"mensagem {i} sobre o pedido",
+                             direction='received' if i % 2 else 'sent', viewed=i < count - 10,
+                             created_at=now - timedelta(minutes=count - i))
+                     for i in range(count)]
+        Message.objects.bulk_create(rows, batch_size=1000)
+        # every sent message had its reply job: done (reply is the next
+        # message), plus a few still pending and one whose worker died
+        jobs = [ReplyJob(message=sent, reply=reply, status=ReplyJob.DONE, attempts=1, started_at=sent.created_at)
+                for sent, reply in zip(rows[::2], rows[1::2])]
+        for job in jobs[-5:]:
+            job.status, job.reply, job.attempts = ReplyJob.PENDING, None, 0
+        jobs[-6].status, jobs[-6].reply = ReplyJob.RUNNING, None
+        ReplyJob.objects.bulk_create(jobs, batch_size=1000)
+        Account.objects.create(identifier=USER, name='Audit')
+        if apps.is_installed('django.contrib.admin'):
+            from django.contrib.auth import get_user_model
+            cls.staff = get_user_model().objects.create_superuser(STAFF, f"{STAFF}@example.com", None)
+        for user in {row.user for row in rows}:
+            summaries.rebuild(user)
+        # older half of the second account goes to the archive tier
+        archive.archive_user(ARCHIVED_USER, now - timedelta(minutes=MESSAGES // 2))
+        # the statistics PRAGMA optimize keeps in a live database (chat_project.sqlite_backend)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        # cold caches: the audit wants the queries a miss costs
+        caches['accounts'].clear()
+        tokens.verified.clear()
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexed(self, scenario, action):
+        """Run action; every plan step of every statement must be indexed or ALLOWED."""
+        with CaptureQueriesContext(connection) as captured:
+            response = action()
+            if getattr(response, 'streaming', False):
+                # streamed bodies run their queries while being consumed
+                b''.join(response.streaming_content)
+        status = getattr(response, 'status_code', None)
+        self.assertLess(status or 0, 400, f"{scenario}: HTTP {status}")
+        problems = []
+        for query in captured.captured_queries:
+            sql = query['sql']
+            if sql.lstrip().split(' ', 1)[0].upper() not in PLANNABLE:
+                continue
+            for detail in self.explain(sql):
+                if problem(detail) and not any(name.search(scenario) and step.search(detail) and statement.search(sql)
+                                               for name, step, statement, _ in ALLOWED):
+                    problems.append(f"{detail}\n      {sql}")
+        self.assertFalse(problems, f"[{scenario}] plans scan or sort:\n  " + '\n  '.join(problems))
+        return captured
+
+    def test_message_lists(self):
+        api = '/api/messages/'
+        middle = Message.objects.filter(user=USER).order_by('-created_at', '-id').values_list(
+            'created_at', 'id', named=True)[50]
+        cursor = encode_cursor(middle)
+        for user in (USER, ARCHIVED_USER):
+            tier = '' if user == USER else ' (archived)'
+            scenarios = [
+                ('list', {'user': user}),
+                ('list page 5', {'user': user, 'page': 5}),
+                ('keyset latest', {'user': user, 'before': ''}),
+                ('keyset older', {'user': user, 'before': cursor}),
+                ('keyset newer', {'user': user, 'after': cursor}),
+                ('delta', {'user': user, 'since': middle.id}),
+                ('direction', {'user': user, 'direction': 'received'}),
+                ('direction keyset', {'user': user, 'direction': 'sent', 'before': ''}),
+                ('search', {'user': user, 'search': 'pedido'}),
+                ('search ranked', {'user': user, 'search': 'pedido', 'ordering': 'rank'}),
+            ]
+            for name, params in scenarios:
+                with self.subTest(f"{name}{tier}"):
+                    self.assertIndexed(f"{name}{tier}", lambda: self.client.get(api, params))
+            with self.subTest(f"export{tier}"):
+                self.assertIndexed(f"export{tier}", lambda: self.client.get(f"{api}export/", {'user': user}))
+
+    def test_summary(self):
+        self.assertIndexed('summary', lambda: self.client.get(
+            '/api/messages/summary/', {'users': f"{USER},{ARCHIVED_USER}"}))
+
+    def test_send(self):
+        self.assertIndexed('send', lambda: self.client.post(
+            '/api/messages/', {'user': USER, 'text': 'nova'}, content_type='application/json'))
+
+    def test_send_retried(self):
+        send = lambda: self.client.post('/api/messages/', {'user': USER, 'text': 'nova'},  # noqa: E731
+                                        content_type='application/json', HTTP_IDEMPOTENCY_KEY='plan-send')
+        send()
+        self.assertIndexed('send retried', send)
+
+    def test_batch_send(self):
+        self.assertIndexed('batch send', lambda: self.client.post('/api/messages/batch/', {'user': USER, 'messages': [
+            {'text': 'fila 1', 'key': 'plan-1'}, {'text': 'fila 2', 'key': 'plan-2'}]},
+            content_type='application/json'))
+
+    def test_mark_viewed(self):
+        self.assertIndexed('mark_viewed', lambda: self.client.post(f"/api/messages/mark_viewed/?user={USER}"))
+
+    def test_accounts(self):
+        self.assertIndexed('account', lambda: self.client.get(f"/api/accounts/{USER}/"))
+        token = tokens.issue(Account.objects.get(pk=USER))
+        self.assertIndexed('token auth', lambda: self.client.get(
+            '/api/accounts/me/', HTTP_AUTHORIZATION=f"Bearer {token}"))
+        self.assertIndexed('login', lambda: self.client.post(
+            '/api/auth/login/', {'identifier': USER}, content_type='application/json'))
+
+    def test_reply_queue(self):
+        captured = self.assertIndexed('reply queue', replies.due_job_ids)
+        self.assertTrue(captured.captured_queries)
+        self.assertEqual(len(replies.due_job_ids()), 6)
+
+    def test_archive(self):
+        self.assertIndexed('archive', lambda: archive.archive_user(USER, timezone.now() - timedelta(days=1)))
+
+    def test_retention(self):
+        self.assertIndexed('retention', lambda: retention.compact([USER], keep_last=100))
+
+    def test_delete_history(self):
+        self.assertIndexed('delete_history', lambda: self.client.post(
+            '/api/messages/delete_history/', {'user': ARCHIVED_USER}, content_type='application/json'))
+
+    @skipUnless(apps.is_installed('django.contrib.admin'), 'the admin is not installed')
+    def test_admin_changelist(self):
+        self.client.force_login(self.staff)
+        changelist = '/admin/messages_app/message/'
+        older = encode_cursor(Message.objects.order_by('-created_at', '-id')[150])
+        today = timezone.localdate()
+        month = {'created_at__year': today.year, 'created_at__month': today.month}
+        scenarios = [
+            ('admin list', {}),
+            ('admin older page', {'cursor': older}),
+            ('admin account', {'user': USER}),
+            ('admin search', {'q': 'pedido 17'}),
+            ('admin month', month),
+            ('admin account day', {'user': USER, 'created_at__day': today.day, **month}),
+        ]
+        for name, params in scenarios:
+            with self.subTest(name):
+                self.assertIndexed(name, lambda: self.client.get(changelist, params))
@@ -0,0 +1,57 @@
+"""
+Full-text search results and their highlighted snippets.
+"""
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APITestCase
+
+from messages_app import search
+from messages_app.loadtest import NO_BACKPRESSURE
+from messages_app.models import Message
+
+USER = 'busca'
+
+
+class HighlightTests(SimpleTestCase):
+
+    def test_text_is_escaped_and_matches_marked(self):
+        snippet = f"<b>a</b> & \"{search.MATCH_START}pedido{search.MATCH_END}\" 'x'"
+        self.assertEqual(search.highlight(snippet),
+                         '&lt;b&gt;a&lt;/b&gt; &amp; &quot;<mark>pedido</mark>&quot; &#x27;x&#x27;')
+
+    def test_no_snippet(self):
+        self.assertIsNone(search.highlight(None))
+
+
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'needs the full-text index')
+@override_settings(MESSAGES_REPLY_MODE='external', **NO_BACKPRESSURE)
+class SearchSnippetTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Message.objects.bulk_create([
+            Message(user=USER, text='<script>alert("pedido")</script> & <img src=x onerror=1>', direction='sent'),
+            Message(user=USER, text='nada a ver', direction='sent'),
+        ])
+
+    def results(self, term):
+        response = self.client.get('/api/messages/', {'user': USER, 'search': term})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_snippet_is_escaped_html(self):
+        [row] = self.results('pedido')
+        snippet = row['snippet']
+        self.assertIn('<mark>pedido</mark>', snippet)
+        self.assertNotIn('<script', snippet)
+        self.assertNotIn('<img', snippet)
+        self.assertIn('&lt;script&gt;', snippet)
+        # the message text itself is returned as stored
+        self.assertTrue(row['text'].startswith('<script>'))
+
+    def test_match_inside_markup(self):
+        [row] = self.results('script')
+        self.assertIn('&lt;<mark>script</mark>&gt;', row['snippet'])
+        self.assertIn('&lt;/<mark>script</mark>&gt;', row['snippet'])
@@ -0,0 +1,120 @@
+"""
+Idempotent sends: Idempotency-Key replays, reused keys, the retry after a
+concurrent insert of the same key, and batch sends.
+"""
+from unittest import mock
+
+from django.db import IntegrityError
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from messages_app import sending
+from messages_app.loadtest import NO_BACKPRESSURE
+from messages_app.models import ConversationSummary, Message, ReplyJob
+
+
+@override_settings(MESSAGES_REPLY_MODE='external', **NO_BACKPRESSURE)
+class IdempotentSendTests(APITestCase):
+
+    def send(self, text, key=None, user='idem'):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key is not None else {}
+        return self.client.post('/api/messages/', {'user': user, 'text': text}, format='json', **headers)
+
+    def test_replay_returns_the_first_message(self):
+        first = self.send('oi', key='k1')
+        self.assertEqual(first.status_code, 201)
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+
+        again = self.send('oi', key='k1')
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+        self.assertEqual(again.json()['id'], first.json()['id'])
+        self.assertEqual(Message.objects.filter(user='idem').count(), 1)
+        self.assertEqual(ReplyJob.objects.count(), 1)
+        self.assertEqual(ConversationSummary.objects.get(user='idem').total_count, 1)
+
+    def test_keys_are_per_account(self):
+        self.send('oi', key='k1')
+        self.assertEqual(self.send('oi', key='k1', user='outro').status_code, 201)
+
+    def test_reused_key_with_another_body(self):
+        self.send('oi', key='k1')
+        response = self.send('outra coisa', key='k1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Message.objects.filter(user='idem').count(), 1)
+
+    def test_sends_without_key_are_not_deduplicated(self):
+        self.assertEqual(self.send('oi').status_code, 201)
+        self.assertEqual(self.send('oi').status_code, 201)
+        self.assertEqual(Message.objects.filter(user='idem').count(), 2)
+
+    def test_key_too_long(self):
+        self.assertEqual(self.send('oi', key='x' * (sending.MAX_KEY_LENGTH + 1)).status_code, 400)
+
+    def test_retry_after_concurrent_insert(self):
+        # another request committed the same key between our lookup and insert:
+        # the unique constraint fails the first attempt, the retry finds its row
+        real_send = sending._send
+        attempts = []
+
+        def raced(user_id, items, user_name):
+            attempts.append(user_id)
+            if len(attempts) == 1:
+                Message.objects.create(user=user_id, text=items[0]['text'], direction='sent',
+                                       client_key=items[0]['key'])
+                raise IntegrityError('UNIQUE constraint failed: messages_app_message.user, client_key')
+            return real_send(user_id, items, user_name)
+
+        with mock.patch.object(sending, '_send', side_effect=raced):
+            response = self.send('oi', key='k1')
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(Message.objects.filter(user='idem').count(), 1)
+
+
+@override_settings(MESSAGES_REPLY_MODE='external', **NO_BACKPRESSURE)
+class BatchSendTests(APITestCase):
+
+    def batch(self, messages, user='lote'):
+        return self.client.post('/api/messages/batch/', {'user': user, 'messages': messages}, format='json')
+
+    def test_batch_in_order(self):
+        items = [{'text': f"t{i}", 'key': f"b{i}"} for i in range(5)]
+        response = self.batch(items)
+        self.assertEqual(response.status_code, 201)
+        results = response.json()['results']
+        self.assertEqual([r['text'] for r in results], [f"t{i}" for i in range(5)])
+        self.assertEqual([r['id'] for r in results], sorted(r['id'] for r in results))
+        self.assertFalse(any(r['replayed'] for r in results))
+        summary = ConversationSummary.objects.get(user='lote')
+        self.assertEqual((summary.total_count, summary.unread_count, summary.last_message_id),
+                         (5, 5, results[-1]['id']))
+        self.assertEqual(ReplyJob.objects.count(), 5)
+
+    def test_batch_replays_known_keys(self):
+        first = self.batch([{'text': 'a', 'key': 'ka'}, {'text': 'b', 'key': 'kb'}]).json()['results']
+        response = self.batch([{'text': 'b', 'key': 'kb'}, {'text': 'c'},
+                               {'text': 'd', 'key': 'kd'}, {'text': 'd', 'key': 'kd'}])
+        self.assertEqual(response.status_code, 201)
+        results = response.json()['results']
+        self.assertEqual([r['replayed'] for r in results], [True, False, False, True])
+        self.assertEqual(results[0]['id'], first[1]['id'])
+        self.assertEqual(results[2]['id'], results[3]['id'])
+        self.assertEqual(Message.objects.filter(user='lote').count(), 4)
+
+        # nothing new at all: 200 instead of 201
+        self.assertEqual(self.batch([{'text': 'a', 'key': 'ka'}]).status_code, 200)
+
+    def test_batch_with_reused_key_writes_nothing(self):
+        self.batch([{'text': 'a', 'key': 'ka'}])
+        self.assertEqual(self.batch([{'text': 'novo'}, {'text': 'outro', 'key': 'ka'}]).status_code, 422)
+        self.assertEqual(Message.objects.filter(user='lote').count(), 1)
+
+    @override_settings(MESSAGES_BATCH_MAX_SIZE=3)
+    def test_invalid_batches(self):
+        self.assertEqual(self.batch([]).status_code, 400)
+        self.assertEqual(self.batch([{'text': 'a'}] * 4).status_code, 400)
+        response = self.client.post('/api/messages/batch/', {'messages': [{'text': 'a'}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Message.objects.exists())
@@ -0,0 +1,255 @@
+"""
+Backpressure for POST /api/messages/ and /api/messages/batch/.
+
+Every send is a write transaction on the single SQLite writer, so a client
+that floods the endpoint slows down everyone. Two layers:
+
+Token buckets (DRF throttles, 429 + Retry-After). The rate strings in
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] ('messages.account',
+'messages.ip') read as <burst>/<period>: up to <burst> sends at once, then
+<burst> per <period> sustained. MESSAGES_THROTTLE_BACKEND picks the store:
+    'sqlite' -> one small SQLite file (MESSAGES_THROTTLE_PATH, by default in
+                /dev/shm when present) shared by every gunicorn worker on the
+                host; separate from the application database, so it never
+                waits on the writer it protects
+    'local'  -> per-process dict (each worker enforces the full rate)
+    'off'    -> no token buckets (load tests)
+
+Load shedding (503 + Retry-After). Send transactions are timed and fed into
+a decaying average; when it is above MESSAGES_SHED_WRITE_LATENCY_MS, sends are
+refused with probability 1 - threshold/average. Refusing only part of them
+keeps fresh samples coming, and the average decays on its own (half-life
+MESSAGES_SHED_HALF_LIFE seconds) once the writer drains. 0 disables it.
+"""
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import SimpleRateThrottle
+
+from . import metrics
+
+
+def _setting(name, default):
+    return getattr(settings, f"MESSAGES_{name}", default)
+
+
+# token bucket stores --------------------------------------------------------------
+
+class LocalBuckets:
+    """Buckets of this process only."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, capacity, rate, now, cost=1):
+        """Take `cost` tokens; returns 0 when allowed, else seconds until they are available."""
+        with self._lock:
+            tokens, stamp = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - stamp) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (cost - tokens) / rate
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBuckets:
+    """Buckets in a SQLite file shared by the processes of one host."""
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL, stamp REAL)')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, capacity, rate, now, cost=1):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, stamp FROM bucket WHERE key = ?', (key,)).fetchone()
+            tokens, stamp = row if row else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - stamp) * rate)
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+            if not wait:
+                tokens -= cost
+            conn.execute('INSERT OR REPLACE INTO bucket (key, tokens, stamp) VALUES (?, ?, ?)', (key, tokens, now))
+            self._calls += 1
+            if self._calls % self.PRUNE_EVERY == 0:
+                # idle long enough to be full again: same as no row at all
+                conn.execute('DELETE FROM bucket WHERE stamp < ?', (now - 86400,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return wait
+
+    def clear(self):
+        self._connection().execute('DELETE FROM bucket')
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def default_path():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'chat-throttle.sqlite3')
+
+
+def get_store():
+    backend = _setting('THROTTLE_BACKEND', 'sqlite')
+    if backend == 'off':
+        return None
+    key = (backend, _setting('THROTTLE_PATH', None) or default_path())
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = SQLiteBuckets(key[1]) if backend == 'sqlite' else LocalBuckets()
+        return _stores[key]
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    SimpleRateThrottle's rate/scope/cache-key plumbing with a token bucket
+    instead of the request history list. A broken store lets requests
+    through: throttling must not take the endpoint down with it.
+
+    A request costs one token unless the view has throttle_cost(request)
+    (a batch send costs one per message, at most a full bucket).
+    """
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        store = get_store()
+        if store is None:
+            return True
+        capacity, duration = self.num_requests, self.duration
+        cost = min(capacity, view.throttle_cost(request)) if hasattr(view, 'throttle_cost') else 1
+        try:
+            self._wait = store.take(self.key, capacity, capacity / duration, time.time(), cost)
+        except sqlite3.Error:
+            metrics.registry.inc('throttle_errors_total', (('scope', self.scope),))
+            return True
+        if self._wait:
+            metrics.registry.inc('throttled_total', (('scope', self.scope),))
+            return False
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+class AccountSendThrottle(TokenBucketThrottle):
+    """Per account: the token's account, else the `user` the message is sent as."""
+    scope = 'messages.account'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = getattr(request.user, 'identifier', None) or request.user.pk
+        else:
+            ident = (request.data.get('user') or '').strip() if hasattr(request.data, 'get') else ''
+        if not ident:
+            return None
+        return f"{self.scope}:{ident}"
+
+
+class IPSendThrottle(TokenBucketThrottle):
+    scope = 'messages.ip'
+
+    def get_cache_key(self, request, view):
+        return f"{self.scope}:{self.get_ident(request)}"
+
+
+# load shedding ---------------------------------------------------------------------
+
+class Overloaded(APIException):
+    status_code = 503
+    default_detail = 'servidor ocupado, tente novamente em instantes'
+    default_code = 'overloaded'
+
+    def __init__(self, wait=1):
+        super().__init__()
+        # DRF's exception handler turns `wait` into Retry-After
+        self.wait = wait
+
+
+class WriteLatency:
+    """Exponentially weighted average of write time (ms) that decays while idle."""
+    ALPHA = 0.2
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._avg = 0.0
+        self._stamp = time.monotonic()
+
+    def _decayed(self, now):
+        half_life = _setting('SHED_HALF_LIFE', 1.0)
+        return self._avg * 0.5 ** ((now - self._stamp) / half_life)
+
+    def observe(self, ms):
+        with self._lock:
+            now = time.monotonic()
+            avg = self._decayed(now)
+            self._avg = avg + self.ALPHA * (ms - avg)
+            self._stamp = now
+
+    def value(self):
+        with self._lock:
+            return self._decayed(time.monotonic())
+
+    def reset(self):
+        with self._lock:
+            self._avg = 0.0
+            self._stamp = time.monotonic()
+
+
+write_latency = WriteLatency()
+
+
+@contextmanager
+def timed_write():
+    """Times the enclosed write transaction into write_latency."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        write_latency.observe(ms)
+        metrics.registry.observe('db_write_duration_ms', (), ms, metrics.DURATION_BUCKETS)
+
+
+def shed_writes():
+    """Raise Overloaded for a share of writes while the writer is slow."""
+    threshold = _setting('SHED_WRITE_LATENCY_MS', 0)
+    if not threshold:
+        return
+    current = write_latency.value()
+    if current <= threshold or random.random() >= 1 - threshold / current:
+        return
+    metrics.registry.inc('shed_total', ())
+    raise Overloaded(wait=max(1, math.ceil(_setting('SHED_HALF_LIFE', 1.0))))
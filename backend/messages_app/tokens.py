@@ -0,0 +1,150 @@
+"""
+Signed session tokens.
+
+POST /api/auth/login/ checks the password once (messages_app.passwords) and
+returns a token; afterwards requests send `Authorization: Bearer <token>`
+and TokenAuthentication resolves the account without touching the password
+again. A token is `identifier:fingerprint:timestamp:signature`, signed with
+SECRET_KEY (django.core.signing), so nothing is stored server side:
+
+- it expires after MESSAGES_TOKEN_MAX_AGE seconds;
+- the fingerprint is an HMAC of the account's password hash at login, so
+  changing (or setting) the password revokes every token issued before;
+- deleting the account revokes them too.
+
+Verified tokens are kept in a per-process LRU (MESSAGES_TOKEN_CACHE_SIZE)
+until they expire, so the signature is only checked on a miss. The LRU does
+not save a query: the account row is read from the database on every request
+(one primary key lookup), never from messages_app.account_cache, because the
+other workers must see a password change or a deletion at once.
+
+Authentication only says who is calling; messages_app.permissions decides
+which accounts that caller may write.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+from rest_framework import authentication, exceptions
+
+from . import metrics
+from .models import Account
+
+SALT = 'messages_app.tokens'
+
+
+def _setting(name, default):
+    return getattr(settings, f"MESSAGES_TOKEN_{name}", default)
+
+
+def max_age():
+    return _setting('MAX_AGE', 7 * 24 * 3600)
+
+
+def _signer():
+    return signing.TimestampSigner(salt=SALT)
+
+
+def fingerprint(password_hash):
+    return salted_hmac(SALT, password_hash or '').hexdigest()[:16]
+
+
+def issue(account):
+    """New token for `account`."""
+    return _signer().sign(f"{account.identifier}:{fingerprint(account.password_hash)}")
+
+
+class _VerifiedTokens:
+    """token -> (identifier, password_hash seen at verification, expiry), LRU bounded."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[2] <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return entry
+
+    def put(self, token, entry):
+        with self._lock:
+            self._entries[token] = entry
+            self._entries.move_to_end(token)
+            while len(self._entries) > max(1, _setting('CACHE_SIZE', 10000)):
+                self._entries.popitem(last=False)
+
+    def discard(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+verified = _VerifiedTokens()
+
+
+def _count(outcome):
+    metrics.registry.inc('auth_token_total', (('outcome', outcome),))
+
+
+def authenticate_token(token):
+    """The Account the token belongs to; raises AuthenticationFailed otherwise."""
+    entry = verified.get(token)
+    if entry is not None:
+        identifier, seen_hash, _ = entry
+        account = Account.objects.filter(pk=identifier).first()
+        if account is not None and account.password_hash == seen_hash:
+            _count('cached')
+            return account
+        verified.discard(token)
+        _count('revoked')
+        raise exceptions.AuthenticationFailed('token revoked')
+
+    try:
+        value = _signer().unsign(token, max_age=max_age())
+    except signing.SignatureExpired:
+        _count('expired')
+        raise exceptions.AuthenticationFailed('token expired')
+    except signing.BadSignature:
+        _count('invalid')
+        raise exceptions.AuthenticationFailed('invalid token')
+    identifier, _, fp = value.rpartition(':')
+    account = Account.objects.filter(pk=identifier).first()
+    if account is None or not constant_time_compare(fp, fingerprint(account.password_hash)):
+        _count('revoked')
+        raise exceptions.AuthenticationFailed('token revoked')
+    # value:timestamp:signature
+    issued = signing.b62_decode(token.rsplit(':', 2)[1])
+    verified.put(token, (identifier, account.password_hash, issued + max_age()))
+    _count('verified')
+    return account
+
+
+class TokenAuthentication(authentication.BaseAuthentication):
+    """`Authorization: Bearer <token>`; requests without it stay anonymous."""
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        parts = authentication.get_authorization_header(request).split()
+        if not parts or parts[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(parts) != 2:
+            raise exceptions.AuthenticationFailed('invalid token header')
+        try:
+            token = parts[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('invalid token header')
+        return authenticate_token(token), token
+
+    def authenticate_header(self, request):
+        return self.keyword
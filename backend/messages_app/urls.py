@@ -1,13 +1,37 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# async twins of the hot endpoints when served by asgi.py (MESSAGES_ASYNC_VIEWS);
+# the export's, because only an async iterator streams there
+if getattr(settings, 'MESSAGES_ASYNC_VIEWS', False):
+    MessageListCreateView, MarkViewedView, MessageExportView, LoginView = (
+        views.AsyncMessageListCreateView, views.AsyncMarkViewedView, views.AsyncMessageExportView,
+        views.AsyncLoginView)
+else:
+    MessageListCreateView, MarkViewedView, MessageExportView, LoginView = (
+        views.MessageListCreateView, views.MarkViewedView, views.MessageExportView, views.LoginView)
+
 urlpatterns = [
-    path('messages/', views.MessageListCreateView.as_view(), name='messages-list-create'),
-    path('messages/mark_viewed/', views.MarkViewedView.as_view(), name='messages-mark-viewed'),
+    path('messages/', MessageListCreateView.as_view(), name='messages-list-create'),
+    path('messages/mark_viewed/', MarkViewedView.as_view(), name='messages-mark-viewed'),
+    path('messages/batch/', views.MessageBatchView.as_view(), name='messages-batch'),
+    path('messages/summary/', views.ConversationSummaryView.as_view(), name='messages-summary'),
+    path('messages/bulk/', views.MessageBulkImportView.as_view(), name='messages-bulk-import'),
+    path('messages/export/', MessageExportView.as_view(), name='messages-export'),
+    path('messages/stream/', views.MessageStreamView.as_view(), name='messages-stream'),
     path('messages/delete_history/', views.DeleteHistoryView.as_view(), name='messages-delete-history'),
+    path('messages/delete_history/<int:pk>/', views.DeleteHistoryView.as_view(), name='messages-delete-history-detail'),
+
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('replies/metrics/', views.ReplyMetricsView.as_view(), name='replies-metrics'),
+
+    path('cache/accounts/', views.AccountCacheStatsView.as_view(), name='cache-accounts-stats'),
 
     path('accounts/', views.AccountCreateView.as_view(), name='accounts-create'),           
+    path('accounts/me/', views.AccountMeView.as_view(), name='accounts-me'),
     path('accounts/<str:identifier>/', views.AccountDetailView.as_view(), name='accounts-detail'),
 
-    path('auth/login/', views.LoginView.as_view(), name='auth-login'),
+    path('auth/login/', LoginView.as_view(), name='auth-login'),
+    path('auth/hash-pool/', views.PasswordHashPoolView.as_view(), name='auth-hash-pool'),
 ]
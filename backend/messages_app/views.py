@@ -1,95 +1,226 @@
 from rest_framework import generics, status
+from rest_framework.exceptions import NotAuthenticated, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.encoders import JSONEncoder
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.db import transaction
-from django.contrib.auth.hashers import make_password, check_password
-from .models import Message, Account
-from .serializers import MessageSerializer, AccountSerializer, AccountCreateSerializer, AccountUpdateSerializer
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from .models import ArchivedMessage, Account, ConversationSummary, HistoryDeletion
+from .serializers import MESSAGE_FIELDS, hoist_shared, message_rows, MessageSerializer, MessageSearchSerializer, ConversationSummarySerializer, HistoryDeletionSerializer, AccountSerializer, AccountCreateSerializer, AccountUpdateSerializer
+from .pagination import StandardPagination, KeysetPagination, DeltaPagination
+from . import account_cache, archive, bulk, events, metrics, passwords, permissions, replies, retention, search, sending, summaries, throttling, tokens
+import asyncio
+import hashlib
+import json
 import uuid
-from django.utils import timezone
-
-class StandardPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = 'page_size'
-
 
 class MessageListCreateView(generics.ListCreateAPIView):
     """
     GET /api/messages/?user=ID  -> paginated messages for that user
+    GET /api/messages/?user=ID&before=[cursor] | &after=cursor -> keyset pages (see KeysetPagination)
+    GET /api/messages/?user=ID&search=...&direction=sent|received|both[&ordering=rank]
+        -> filtered in the database; search uses the full-text index and adds rank/snippet
+    GET /api/messages/?user=ID&since=<id> -> only messages newer than id (see DeltaPagination)
+    Lists for one user carry ETag/Last-Modified taken from its ConversationSummary and
+    answer If-None-Match/If-Modified-Since with 304 before anything is serialized.
+    Non-search lists skip MessageSerializer: rows come from values_list() and are
+    formatted by message_rows() (same JSON, see FastJSONRenderer).
+    Accounts with archived messages read through both tiers (see messages_app.archive).
+    Any list above also takes
+      &fields=id,text,created_at -> only those fields per row (id is always included)
+      &shape=compact             -> values every row of the page has in common (user,
+                                    user_name, ...) move to a `shared` object next to
+                                    `results`; a row reads as {...shared, ...row}
     POST /api/messages/         -> create a message (user sends) and create an automated response
+                                   (Idempotency-Key header: retries don't duplicate it)
+    Sends are throttled per account and per IP (429) and shed while the database
+    writer is slow (503), both with Retry-After (see messages_app.throttling).
     """
     serializer_class = MessageSerializer
     pagination_class = StandardPagination
+    send_throttle_classes = [throttling.AccountSendThrottle, throttling.IPSendThrottle]
+
+    def get_throttles(self):
+        if self.request.method == 'POST':
+            return [throttle() for throttle in self.send_throttle_classes]
+        return super().get_throttles()
+
+    def check_throttles(self, request):
+        # shedding first: a refused send should not use up a token
+        if request.method == 'POST':
+            throttling.shed_writes()
+        super().check_throttles(request)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if DeltaPagination.requested(self.request):
+                self._paginator = DeltaPagination()
+            elif KeysetPagination.requested(self.request):
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_queryset(self):
         user = self.request.query_params.get('user')
-        qs = Message.objects.all()
+        if not user:
+            return archive.tiered(self.tier_queryset, ArchivedMessage.objects.exists())
+        if not hasattr(self, 'summary'):
+            self.summary = ConversationSummary.objects.filter(user=user).first()
+        # only accounts with something archived read the second tier
+        archived = self.summary is not None and self.summary.archived_count > 0
+        return archive.tiered(self.tier_queryset, archived, self.summary.archived_until if archived else None)
+
+    def tier_queryset(self, model):
+        user = self.request.query_params.get('user')
+        direction = self.request.query_params.get('direction')
+        term = (self.request.query_params.get('search') or '').strip()
+        qs = model.objects.all()
         if user:
             qs = qs.filter(user=user)
-        return qs.order_by('created_at')
+        if direction in ('sent', 'received'):
+            qs = qs.filter(direction=direction)
+        if term:
+            ranked = self.request.query_params.get('ordering') == 'rank'
+            qs = search.search(qs, term, ranked=ranked)
+            if ranked:
+                return qs
+        return qs.order_by('created_at', 'id')
+
+    def list(self, request, *args, **kwargs):
+        user = request.query_params.get('user')
+        if not user:
+            return self.render_list(request, *args, **kwargs)
+        self.summary = ConversationSummary.objects.filter(user=user).first()
+        etag, last_modified = self.validators(request)
+        response = self.not_modified(request, etag, last_modified)
+        if response is None:
+            response = self.render_list(request, *args, **kwargs)
+        return self.with_validators(response, etag, last_modified)
+
+    def validators(self, request):
+        """(etag, last_modified) of the list described by self.summary, or (None, None)."""
+        version, updated_at = summaries.version(self.summary)
+        if version is None:
+            return None, None
+        # the same data renders differently per page/filter, so the URL is part of the tag
+        etag = quote_etag(hashlib.md5(f"{version}|{request.get_full_path()}".encode()).hexdigest())
+        return etag, int(updated_at.timestamp())
+
+    def not_modified(self, request, etag, last_modified):
+        if etag is None:
+            return None
+        return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    def with_validators(self, response, etag, last_modified):
+        if etag is not None:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def render_list(self, request, *args, **kwargs):
+        if self.get_serializer_class() is not MessageSerializer:
+            return super().list(request, *args, **kwargs)
+        queryset = self.get_queryset().values_list(*MESSAGE_FIELDS, named=True)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(message_rows(page))
+        return Response(message_rows(queryset))
+
+    def requested_fields(self):
+        """Field names asked for with ?fields=, or None for every field."""
+        raw = self.request.query_params.get('fields')
+        if not raw:
+            return None
+        known = self.get_serializer_class().Meta.fields
+        fields = ['id'] + [name for name in dict.fromkeys(f.strip() for f in raw.split(',')) if name and name != 'id']
+        unknown = [name for name in fields if name not in known]
+        if unknown:
+            raise ValidationError({'fields': f"unknown field(s): {', '.join(unknown)}"})
+        return fields
+
+    def get_paginated_response(self, data):
+        fields = self.requested_fields()
+        if fields is not None:
+            data = [{name: row[name] for name in fields} for row in data]
+        shape = self.request.query_params.get('shape') or 'full'
+        if shape not in ('full', 'compact'):
+            raise ValidationError({'shape': "expected 'full' or 'compact'"})
+        if shape == 'full':
+            return super().get_paginated_response(data)
+        data, shared = hoist_shared(data)
+        response = super().get_paginated_response(data)
+        response.data.pop('results')
+        response.data['shared'] = shared
+        response.data['results'] = data
+        return response
+
+    def get_serializer_class(self):
+        if self.request.method == 'GET' and (self.request.query_params.get('search') or '').strip():
+            return MessageSearchSerializer
+        return self.serializer_class
 
     def create(self, request, *args, **kwargs):
         """
         Expected payload: { user: 'A'|'id', text: '...', user_name?: '...' }
-        We'll persist the user message (direction='sent') and then persist a system reply (direction='received').
-        The system reply text uses the current account name if available.
+        We'll persist the user message (direction='sent') and queue a ReplyJob; the system reply
+        (direction='received') is written later by the reply workers (see messages_app.replies)
+        and pushed on the event stream. The reply text uses the current account name if available.
+        With an Idempotency-Key header a retried send answers 200 with the message stored
+        the first time (Idempotent-Replayed: true) instead of creating another one.
         """
         data = request.data
         user_id = (data.get('user') or '').strip()
-        text = data.get('text', '') or ''
-        account = None
-        try:
-            account = Account.objects.get(pk=user_id)
-            display_name = account.name or (f"Usuário {user_id}")
-        except Account.DoesNotExist:
-            display_name = data.get('user_name') or (f"Usuário {user_id}")
-
         if not user_id:
             return Response({'detail':'user is required'}, status=status.HTTP_400_BAD_REQUEST)
+        permissions.check_writer(request, user_id)
+        key = sending.clean_key(request.headers.get('Idempotency-Key'), 'Idempotency-Key')
+        items = [{'text': data.get('text', '') or '', 'key': key}]
+        sent, = sending.send(user_id, items, data.get('user_name'))
+        if sent.replayed:
+            response = Response(sent.as_dict(), status=status.HTTP_200_OK)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+        return Response(sent.as_dict(), status=status.HTTP_201_CREATED)
+
+
+class MessageBatchView(APIView):
+    """
+    POST /api/messages/batch/
+    body: { "user": "A", "user_name"?: "...", "messages": [{ "text": "...", "key"?: "..." }, ...] }
+    -> 201 { results: [{ ...same fields as POST /api/messages/, key, replayed }] } (200 when
+    every item was a replay)
+    Sends an offline client's queue in order, all in one transaction (see messages_app.sending).
+    `key` works like the Idempotency-Key header of a single send, per item. Each message
+    costs one token of the send throttles.
+    """
+    throttle_classes = [throttling.AccountSendThrottle, throttling.IPSendThrottle]
 
-        with transaction.atomic():
-            now = timezone.now()
-            msg = Message.objects.create(
-                user=user_id,
-                user_name=display_name,
-                text=text,
-                response_text='',
-                direction='sent',
-                viewed=False,
-                created_at=now
-            )
-            templates = [
-                f"Obrigado, {display_name}. Em breve nossa equipe retornará.",
-                f"Recebemos sua mensagem, {display_name} — já encaminhamos para o time.",
-                f"Perfeito, {display_name}! Em instantes alguém irá falar com você.",
-                f"Sua solicitação foi registrada, {display_name}. Acompanhe por aqui.",
-                f"Obrigado! Um especialista entrará em contato em breve, {display_name}."
-            ]
-            idx = now.microsecond % len(templates)
-            response_text = templates[idx]
-
-            resp = Message.objects.create(
-                user=user_id,
-                user_name=display_name,
-                text=response_text,
-                response_text='',
-                direction='received',
-                viewed=False,
-                created_at=timezone.now()
-            )
-
-        out = {
-            'id': msg.id,
-            'user': msg.user,
-            'user_name': msg.user_name,
-            'text': msg.text,
-            'response_text': response_text,
-            'created_at': msg.created_at,
-            'response_id': resp.id
-        }
-        return Response(out, status=status.HTTP_201_CREATED)
+    def check_throttles(self, request):
+        throttling.shed_writes()
+        super().check_throttles(request)
+
+    def throttle_cost(self, request):
+        items = request.data.get('messages') if hasattr(request.data, 'get') else None
+        return len(items) if isinstance(items, list) and items else 1
+
+    def post(self, request, *args, **kwargs):
+        user_id = (request.data.get('user') or '').strip()
+        if not user_id:
+            return Response({'detail':'user is required'}, status=status.HTTP_400_BAD_REQUEST)
+        permissions.check_writer(request, user_id)
+        items = sending.batch_items(request.data.get('messages'))
+        sent = sending.send(user_id, items, request.data.get('user_name'))
+        results = [{**s.as_dict(), 'key': s.message.client_key, 'replayed': s.replayed} for s in sent]
+        code = status.HTTP_200_OK if all(s.replayed for s in sent) else status.HTTP_201_CREATED
+        return Response({'results': results}, status=code)
 
 
 class MarkViewedView(APIView):
@@ -101,22 +232,180 @@ class MarkViewedView(APIView):
         user = request.query_params.get('user') or request.data.get('user')
         if not user:
             return Response({'detail':'user param required'}, status=status.HTTP_400_BAD_REQUEST)
-        qs = Message.objects.filter(user=user, viewed=False)
-        changed = qs.update(viewed=True)
+        permissions.check_writer(request, user)
+        changed = summaries.mark_viewed(user)
         return Response({'changed': changed}, status=status.HTTP_200_OK)
 
 
 class DeleteHistoryView(APIView):
     """
     POST /api/messages/delete_history/
-    body: { "user": "A" }
+    body: { "user": "A", "background"?: true }
+    -> 200 { deleted_count, job } once done, or 202 with the job when background
+    GET /api/messages/delete_history/<id>/ -> progress of a deletion job
+    Messages are removed in short batches (see messages_app.retention), so a
+    long history never holds the write lock for the whole deletion.
     """
+    def get(self, request, pk):
+        job = get_object_or_404(HistoryDeletion, pk=pk)
+        return Response(HistoryDeletionSerializer(job).data)
+
     def post(self, request, *args, **kwargs):
         body_user = request.data.get('user') or request.query_params.get('user')
         if not body_user:
             return Response({'detail':'user required'}, status=status.HTTP_400_BAD_REQUEST)
-        deleted, _ = Message.objects.filter(user=body_user).delete()
-        return Response({'deleted_count': deleted}, status=status.HTTP_200_OK)
+        permissions.check_writer(request, body_user)
+        background = str(request.data.get('background') or request.query_params.get('background') or '').lower() in ('1', 'true', 'yes')
+        job = retention.start_history_deletion(body_user, background=background)
+        code = status.HTTP_202_ACCEPTED if background else status.HTTP_200_OK
+        return Response({'deleted_count': job.deleted_count, 'job': HistoryDeletionSerializer(job).data}, status=code)
+
+
+class ConversationSummaryView(APIView):
+    """
+    GET /api/messages/summary/?users=A,B,7f3a2c
+    -> unread/total counters and last message for each account, from one query
+    """
+    max_users = 200
+
+    def get(self, request, *args, **kwargs):
+        raw = request.query_params.get('users') or request.query_params.get('user') or ''
+        users = list(dict.fromkeys(u.strip() for u in raw.split(',') if u.strip()))
+        if not users:
+            return Response({'detail':'users param required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(users) > self.max_users:
+            return Response({'detail':f'at most {self.max_users} users'}, status=status.HTTP_400_BAD_REQUEST)
+        ser = ConversationSummarySerializer(summaries.for_users(users), many=True)
+        return Response({'results': ser.data})
+
+
+class MessageBulkImportView(APIView):
+    """
+    POST /api/messages/bulk/?chunk_size=1000
+    body: JSON Lines (application/x-ndjson), one message object per line,
+          or a JSON array for small batches.
+    Rows are inserted with bulk_create in chunks; no auto-replies are generated.
+    JSON Lines bodies need a Content-Length (411 without one).
+    """
+    def post(self, request, *args, **kwargs):
+        chunk_size = bulk.chunk_size_from(request.query_params.get('chunk_size'))
+        if (request.content_type or '').startswith('application/json'):
+            data = request.data
+            if not isinstance(data, list):
+                return Response({'detail':'expected a JSON array'}, status=status.HTTP_400_BAD_REQUEST)
+            rows = enumerate(data, start=1)
+        else:
+            # read the raw stream line by line so the body is never held in memory
+            stream = request.stream
+            if stream is None:
+                # without a Content-Length (chunked upload) Django hands over an empty body
+                if not request.META.get('CONTENT_LENGTH'):
+                    return Response({'detail':'Content-Length required'}, status=status.HTTP_411_LENGTH_REQUIRED)
+                return Response({'detail':'empty body'}, status=status.HTTP_400_BAD_REQUEST)
+            rows = enumerate(iter(stream.readline, b''), start=1)
+        result = bulk.import_rows(rows, chunk_size, allowed=permissions.writer_check(request))
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED)
+
+
+class MessageExportView(APIView):
+    """
+    GET /api/messages/export/?user=A&chunk_size=1000  -> JSON Lines stream of messages (all users if no user)
+    """
+    def get(self, request, *args, **kwargs):
+        user = request.query_params.get('user')
+        if user:
+            qs = archive.for_user(user)
+        else:
+            qs = archive.tiered(lambda model: model.objects.all(), ArchivedMessage.objects.exists())
+        chunk_size = bulk.chunk_size_from(request.query_params.get('chunk_size'))
+        response = StreamingHttpResponse(self.export_lines(qs, chunk_size), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="messages-{user or "all"}.jsonl"'
+        return response
+
+    def export_lines(self, queryset, chunk_size):
+        return bulk.iter_export_lines(queryset, chunk_size)
+
+
+class MessageStreamView(View):
+    """
+    GET /api/messages/stream/?user=A  -> text/event-stream (Server-Sent Events)
+    Pushes message.created, messages.viewed and history.deleted events for the user.
+    Async: each open stream costs a coroutine, not a worker thread, when served by asgi.py.
+    Only served with MESSAGES_ASYNC_VIEWS: under WSGI Django reads the whole
+    generator before sending a byte, so a stream would hold a worker thread
+    for MESSAGES_EVENTS_MAX_AGE and deliver nothing. 204 there, which tells
+    EventSource not to reconnect; clients keep up with ?since= instead.
+    """
+    async def get(self, request):
+        user = request.GET.get('user')
+        if not user:
+            return HttpResponseBadRequest('user param required')
+        if not getattr(settings, 'MESSAGES_ASYNC_VIEWS', False):
+            return HttpResponse(status=204)
+        heartbeat = getattr(settings, 'MESSAGES_EVENTS_HEARTBEAT', 15)
+        # streams are recycled so a vanished client can't pin a subscription
+        # forever; EventSource reconnects on its own after `retry`
+        max_age = getattr(settings, 'MESSAGES_EVENTS_MAX_AGE', 300)
+        sub = events.get_broker().subscribe(events.user_channel(user))
+
+        async def stream():
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + max_age
+            try:
+                yield 'retry: 3000\n\n'
+                while loop.time() < deadline:
+                    try:
+                        event = await sub.get(timeout=heartbeat)
+                    except asyncio.TimeoutError:
+                        yield ': ping\n\n'
+                        continue
+                    data = json.dumps(event, cls=JSONEncoder)
+                    yield f"event: {event['type']}\ndata: {data}\n\n"
+            finally:
+                sub.close()
+
+        response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class MetricsView(View):
+    """
+    GET /api/metrics/ -> Prometheus text format, merged across all worker processes
+    """
+    def get(self, request):
+        return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ReplyMetricsView(APIView):
+    """
+    GET /api/replies/metrics/ -> per-responder latency/outcome counters of this process and job counts by status
+    """
+    def get(self, request, *args, **kwargs):
+        return Response({'responders': replies.metrics.snapshot(), 'jobs': replies.job_counts()})
+
+
+class AccountCacheStatsView(APIView):
+    """
+    GET /api/cache/accounts/ -> hit/miss/invalidation counters of the account cache (this process)
+    """
+    def get(self, request, *args, **kwargs):
+        return Response(account_cache.stats.snapshot())
+
+
+class PasswordHashPoolView(APIView):
+    """
+    GET /api/auth/hash-pool/ -> queue depth, rejections and wait/hash latency of the password hashing pool (this process)
+    """
+    def get(self, request, *args, **kwargs):
+        return Response(passwords.stats.snapshot())
+
+
+def hash_pool_busy():
+    return Response({'detail': 'too many logins right now, try again'},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
+
 
 class AccountCreateView(APIView):
     """
@@ -130,9 +419,24 @@ class AccountCreateView(APIView):
         name = s.validated_data['name']
         password = s.validated_data.get('password') or ''
         ident = uuid.uuid4().hex[:8]
-        password_hash = make_password(password) if password else ''
+        try:
+            password_hash = passwords.hash_password(password)
+        except passwords.HashPoolBusy:
+            return hash_pool_busy()
         acct = Account.objects.create(identifier=ident, name=name, password_hash=password_hash)
-        return Response({'identifier': acct.identifier, 'name': acct.name, 'created_at': acct.created_at}, status=status.HTTP_201_CREATED)
+        account_cache.invalidate(ident)
+        return Response({'identifier': acct.identifier, 'name': acct.name, 'created_at': acct.created_at,
+                         'token': tokens.issue(acct), 'expires_in': tokens.max_age()}, status=status.HTTP_201_CREATED)
+
+
+class AccountMeView(APIView):
+    """
+    GET /api/accounts/me/ -> the account of the bearer token (401 without one)
+    """
+    def get(self, request):
+        if not request.user.is_authenticated:
+            raise NotAuthenticated()
+        return Response(AccountSerializer(request.user).data)
 
 
 class AccountDetailView(APIView):
@@ -143,12 +447,15 @@ class AccountDetailView(APIView):
     """
 
     def get(self, request, identifier):
-        acct = get_object_or_404(Account, identifier=identifier)
-        ser = AccountSerializer(acct)
+        profile = account_cache.get_profile(identifier)
+        if profile is None:
+            raise Http404
+        ser = AccountSerializer(profile)
         return Response(ser.data)
 
     def put(self, request, identifier):
         acct = get_object_or_404(Account, identifier=identifier)
+        permissions.check_writer(request, identifier)
         s = AccountUpdateSerializer(data=request.data)
         if not s.is_valid():
             return Response(s.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -158,15 +465,21 @@ class AccountDetailView(APIView):
         if name:
             acct.name = name
         if password is not None:
-            acct.password_hash = make_password(password) if password else ''
+            try:
+                acct.password_hash = passwords.hash_password(password)
+            except passwords.HashPoolBusy:
+                return hash_pool_busy()
         acct.save()
+        account_cache.invalidate(identifier)
         return Response({'identifier': acct.identifier, 'name': acct.name}, status=status.HTTP_200_OK)
 
     def delete(self, request, identifier):
         if identifier in ('A', 'B'):
             return Response({'detail':'Builtin accounts cannot be deleted'}, status=status.HTTP_403_FORBIDDEN)
         acct = get_object_or_404(Account, identifier=identifier)
+        permissions.check_writer(request, identifier)
         acct.delete()
+        account_cache.invalidate(identifier)
         return Response({'deleted': True}, status=status.HTTP_200_OK)
 
 class LoginView(APIView):
@@ -174,20 +487,161 @@ class LoginView(APIView):
     POST /api/auth/login/ body: { identifier: 'A'|'id', password?: '...' }
     For identifier A/B, password optional and will login by id only.
     For created accounts with password set, password must match.
-    Returns account basic info.
+    Returns account basic info and a session token for `Authorization: Bearer`
+    (messages_app.tokens); later requests don't need the password again.
     """
     def post(self, request, *args, **kwargs):
         identifier = (request.data.get('identifier') or '').strip()
         password = request.data.get('password')
         if not identifier:
             return Response({'detail':'identifier required'}, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            acct = Account.objects.get(pk=identifier)
-        except Account.DoesNotExist:
+        # straight from the DB: the password hash is never cached
+        acct = Account.objects.filter(pk=identifier).first()
+        error = self.check_account(acct, password)
+        if error is not None:
+            return error
+        if acct.password_hash:
+            try:
+                ok = passwords.verify(acct, password)
+            except passwords.HashPoolBusy:
+                return hash_pool_busy()
+            if not ok:
+                return Response({'detail':'senha incorreta'}, status=status.HTTP_403_FORBIDDEN)
+        return self.logged_in(acct)
+
+    def check_account(self, acct, password):
+        if acct is None:
             return Response({'detail':'account not found'}, status=status.HTTP_404_NOT_FOUND)
+        if acct.password_hash and not password:
+            return Response({'detail':'password required'}, status=status.HTTP_400_BAD_REQUEST)
+        return None
+
+    def logged_in(self, acct):
+        return Response({'identifier': acct.identifier, 'name': acct.name,
+                         'token': tokens.issue(acct), 'expires_in': tokens.max_age()}, status=status.HTTP_200_OK)
+
+
+# async (ASGI) variants ---------------------------------------------------------------
+# Served instead of the views above when MESSAGES_ASYNC_VIEWS is on (see urls.py),
+# i.e. under chat_project.asgi with an ASGI worker. Only the hot paths are native
+# async ORM; the rest reuses the sync code in a worker thread so behaviour stays
+# identical.
+
+class AsyncAPIView(APIView):
+    """
+    APIView with coroutine handlers. Parsing, authentication, throttling and
+    rendering are DRF's usual machinery. initial() runs in a thread when it
+    may block (credentials to check against the accounts table / sessions,
+    throttles using their store), inline otherwise.
+    """
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            if self.initial_blocks(request):
+                await sync_to_async(self.initial)(request, *args, **kwargs)
+            else:
+                self.initial(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    def initial_blocks(self, request):
+        meta = request.META
+        return bool(meta.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+                    or self.get_throttles())
+
+
+class AsyncMessageListCreateView(AsyncAPIView, MessageListCreateView):
+    """
+    Async MessageListCreateView. Delta (`since`) and keyset (`before`/`after`)
+    pages of accounts without archived messages, the polling hot path, are two
+    async ORM queries (summary + page). Page-number lists, search and archive
+    tiers run the sync list() in a thread; so does create(), whose message +
+    reply job + summary writes need transaction.atomic(), which the async ORM
+    does not offer.
+    """
+    async def get(self, request, *args, **kwargs):
+        user = request.query_params.get('user')
+        paged = DeltaPagination.requested(request) or KeysetPagination.requested(request)
+        if not user or not paged or self.get_serializer_class() is not MessageSerializer:
+            return await sync_to_async(self.list)(request, *args, **kwargs)
+        self.summary = await ConversationSummary.objects.filter(user=user).afirst()
+        if self.summary is not None and self.summary.archived_count > 0:
+            return await sync_to_async(self.list)(request, *args, **kwargs)
+        etag, last_modified = self.validators(request)
+        response = self.not_modified(request, etag, last_modified)
+        if response is None:
+            queryset = self.get_queryset().values_list(*MESSAGE_FIELDS, named=True)
+            page = await self.paginator.apaginate_queryset(queryset, request, self)
+            response = self.get_paginated_response(message_rows(page))
+        return self.with_validators(response, etag, last_modified)
+
+    async def post(self, request, *args, **kwargs):
+        return await sync_to_async(self.create)(request, *args, **kwargs)
+
+
+class AsyncMarkViewedView(AsyncAPIView, MarkViewedView):
+    """
+    Async MarkViewedView: the usual nothing-unread call is answered from the
+    summary row with one async query (it writes nothing, so it skips the owner
+    check, and tells no more than the summary endpoint); real updates run the
+    sync path, checks included, in a thread.
+    """
+    async def post(self, request, *args, **kwargs):
+        user = request.query_params.get('user') or request.data.get('user')
+        if user:
+            unread = await ConversationSummary.objects.filter(user=user).values_list('unread_count', flat=True).afirst()
+            if unread == 0:
+                return Response({'changed': 0}, status=status.HTTP_200_OK)
+        return await sync_to_async(MarkViewedView.post)(self, request, *args, **kwargs)
+
+
+class AsyncMessageExportView(AsyncAPIView, MessageExportView):
+    """
+    Async MessageExportView: the body is an async iterator of keyset chunks,
+    so the ASGI handler sends it as it is read. The sync view's generator
+    would be drained into memory first under ASGI.
+    """
+    async def get(self, request, *args, **kwargs):
+        # for_user() reads the summary row: not allowed on the event loop
+        return await sync_to_async(MessageExportView.get)(self, request, *args, **kwargs)
+
+    def export_lines(self, queryset, chunk_size):
+        return bulk.aiter_export_lines(queryset, chunk_size)
+
+
+class AsyncLoginView(AsyncAPIView, LoginView):
+    """
+    Async LoginView: account lookup through the async ORM and the password
+    check awaited on the hashing pool, so a login waiting for a hash holds no
+    thread.
+    """
+    async def post(self, request, *args, **kwargs):
+        identifier = (request.data.get('identifier') or '').strip()
+        password = request.data.get('password')
+        if not identifier:
+            return Response({'detail':'identifier required'}, status=status.HTTP_400_BAD_REQUEST)
+        acct = await Account.objects.filter(pk=identifier).afirst()
+        error = self.check_account(acct, password)
+        if error is not None:
+            return error
         if acct.password_hash:
-            if not password:
-                return Response({'detail':'password required'}, status=status.HTTP_400_BAD_REQUEST)
-            if not check_password(password, acct.password_hash):
+            try:
+                ok = await passwords.averify(acct, password)
+            except passwords.HashPoolBusy:
+                return hash_pool_busy()
+            if not ok:
                 return Response({'detail':'senha incorreta'}, status=status.HTTP_403_FORBIDDEN)
-        return Response({'identifier': acct.identifier, 'name': acct.name}, status=status.HTTP_200_OK)
+        return self.logged_in(acct)
@@ -3,36 +3,102 @@ import { AuthContext } from "../../context/AuthContext";
 import ChatWindow from "../ChatWindow/ChatWindow";
 import MessageInput from "../MessageInput/MessageInput";
 import {
-  getMessagesByUser,
+  getLatestMessages,
+  getMessagesSince,
+  waitForReply,
+  getHeldMessages,
+  holdMessages,
+  forgetMessages,
   postMessage,
   markMessagesViewed,
+  subscribeToMessages,
 } from "../../services/api";
 
+// messages shown when a conversation opens (the latest ones)
+const CHAT_PAGE_SIZE = 50;
+
+function mergeMessages(prev, incoming) {
+  const next = Array.isArray(prev) ? [...prev] : [];
+  incoming.forEach((m) => {
+    if (!next.some((x) => String(x.id) === String(m.id))) next.push(m);
+  });
+  return next;
+}
+
 export default function ChatPage() {
   const { user } = useContext(AuthContext);
   const [messages, setMessages] = useState([]);
   const [loading, setLoading] = useState(false);
   const [isTyping, setIsTyping] = useState(false);
   const chatWindowRef = useRef(null);
+  // account whose list is currently in `messages` (null while switching)
+  const loadedFor = useRef(null);
+  // AbortController of the poll waiting for the last send's reply
+  const replyWait = useRef(null);
+
+  function stopWaiting() {
+    if (replyWait.current) replyWait.current.abort();
+    replyWait.current = null;
+  }
 
   useEffect(() => {
     if (!user) return;
-    setLoading(true);
-    getMessagesByUser(user.id)
+    loadedFor.current = null;
+    const held = getHeldMessages(user.id);
+    // switching back to an account only fetches what arrived since
+    const load = held?.length
+      ? getMessagesSince(
+          user.id,
+          Math.max(...held.map((m) => Number(m.id) || 0))
+        ).then(({ results }) => mergeMessages(held, results))
+      : getLatestMessages(user.id, { page_size: CHAT_PAGE_SIZE });
+    if (held) setMessages(held);
+    else setLoading(true);
+    load
       .then((msgs) => {
-        setMessages(Array.isArray(msgs) ? msgs : msgs.results || []);
+        loadedFor.current = user.id;
+        setMessages(msgs);
         return markMessagesViewed(user.id);
       })
-      .then(() => getMessagesByUser(user.id))
-      .then((refreshed) =>
-        setMessages(
-          Array.isArray(refreshed) ? refreshed : refreshed.results || []
-        )
-      )
+      .then((res) => {
+        if (res && res.changed)
+          setMessages((prev) =>
+            prev.map((m) => (m.viewed ? m : { ...m, viewed: true }))
+          );
+      })
       .catch((e) => console.error("fetch messages", e))
       .finally(() => setLoading(false));
   }, [user]);
 
+  useEffect(() => {
+    if (user && loadedFor.current === user.id) holdMessages(user.id, messages);
+  }, [user, messages]);
+
+  useEffect(() => {
+    if (!user) return;
+    // replies are produced in the background; the stream delivers them
+    // early, the poll started by handleSend in any case
+    const unsubscribe = subscribeToMessages(user.id, (ev) => {
+      if (ev.type === "history.deleted") {
+        forgetMessages(user.id);
+        setMessages([]);
+        return;
+      }
+      if (ev.type !== "message.created" || !Array.isArray(ev.messages)) return;
+      setMessages((prev) => mergeMessages(prev, ev.messages));
+      if (ev.messages.some((m) => m.direction === "received")) {
+        stopWaiting();
+        setIsTyping(false);
+        setTimeout(scrollToBottom, 80);
+      }
+    });
+    return () => {
+      unsubscribe();
+      stopWaiting();
+      setIsTyping(false);
+    };
+  }, [user]);
+
   function scrollToBottom() {
     try {
       if (chatWindowRef.current) {
@@ -50,8 +116,6 @@ export default function ChatPage() {
         userName: user.name,
         text,
       });
-      await new Promise((r) => setTimeout(r, 480));
-      setIsTyping(false);
       const userMsg = {
         id: result.id,
         user: result.user,
@@ -61,29 +125,37 @@ export default function ChatPage() {
         viewed: result.viewed ?? false,
         user_name: result.user_name ?? result.userName ?? user.name,
       };
+      const incoming = [userMsg];
 
-      const respId = result.response_id || `${result.id}-r`;
-      const respMsg = {
-        id: respId,
-        user: result.user,
-        text:
-          result.response_text ||
-          `Obrigado, ${result.user_name || user.name}. Em breve nossa equipe retornará.`,
-        response_text: "",
-        direction: "received",
-        created_at: new Date().toISOString(),
-        viewed: false,
-        user_name: result.user_name ?? user.name,
-      };
+      if (result.response_id) {
+        setIsTyping(false);
+        incoming.push({
+          id: result.response_id,
+          user: result.user,
+          text: result.response_text,
+          response_text: "",
+          direction: "received",
+          created_at: new Date().toISOString(),
+          viewed: false,
+          user_name: result.user_name ?? user.name,
+        });
+      }
 
-      setMessages((prev) => {
-        const next = Array.isArray(prev) ? [...prev] : [];
-        const hasUser = next.some((m) => String(m.id) === String(userMsg.id));
-        const hasResp = next.some((m) => String(m.id) === String(respMsg.id));
-        if (!hasUser) next.push(userMsg);
-        if (!hasResp) next.push(respMsg);
-        return next;
-      });
+      setMessages((prev) => mergeMessages(prev, incoming));
+
+      if (!result.response_id) {
+        stopWaiting();
+        const wait = (replyWait.current = new AbortController());
+        waitForReply(user.id, result.id, {
+          signal: wait.signal,
+          onMessages: (msgs) => setMessages((prev) => mergeMessages(prev, msgs)),
+        }).finally(() => {
+          if (replyWait.current !== wait) return; // aborted: the stream or a switch took over
+          replyWait.current = null;
+          setIsTyping(false);
+          setTimeout(scrollToBottom, 80);
+        });
+      }
 
       markMessagesViewed(user.id).catch(() => {});
 
@@ -55,27 +55,6 @@ export default function HistoryPage() {
     return () => document.removeEventListener("click", onDoc);
   }, []);
 
-  function applyLocalFilters(items, { searchTerm, dir }) {
-    let out = Array.isArray(items) ? items.slice() : [];
-    if (dir && dir !== "both") {
-      out = out.filter((m) => {
-        if (!m.direction) return false;
-        return dir === "sent"
-          ? m.direction === "sent"
-          : m.direction === "received";
-      });
-    }
-    if (searchTerm && searchTerm.trim() !== "") {
-      const q = searchTerm.trim().toLowerCase();
-      out = out.filter((m) => {
-        const a = (m.text || "").toString().toLowerCase();
-        const b = (m.response_text || "").toString().toLowerCase();
-        return a.includes(q) || b.includes(q);
-      });
-    }
-    return out;
-  }
-
   async function fetchMessages(overrideDirection) {
     setLoading(true);
     setError(null);
@@ -94,8 +73,6 @@ export default function HistoryPage() {
           : [];
       if (!Array.isArray(arr)) arr = [];
 
-      arr = applyLocalFilters(arr, { searchTerm: search, dir });
-
       const sorted = arr
         .slice()
         .sort((a, b) => new Date(b.created_at) - new Date(a.created_at));
@@ -1,7 +1,7 @@
 import React, { createContext, useEffect, useState, useCallback } from "react";
 import {
-  loginAccount,
   createAccount as apiCreateAccount,
+  setAuthToken,
 } from "../services/api";
 
 export const AuthContext = createContext(null);
@@ -106,6 +106,23 @@ export function AuthProvider({ children }) {
     };
   }, []);
 
+  // a token the server rejected (expired or revoked) must not be restored by
+  // the next switchUser or login: forget it in the account that holds it
+  useEffect(() => {
+    function onTokenRejected(e) {
+      const token = e.detail?.token;
+      if (!token) return;
+      setAvailableUsers((prev) =>
+        prev.some((u) => u.token === token)
+          ? prev.map((u) => (u.token === token ? { ...u, token: undefined } : u))
+          : prev
+      );
+    }
+    window.addEventListener("auth:token-rejected", onTokenRejected);
+    return () =>
+      window.removeEventListener("auth:token-rejected", onTokenRejected);
+  }, []);
+
   const login = useCallback(
     async (userId, password) => {
       const base = import.meta.env.VITE_API_BASE || "http://localhost:8000";
@@ -114,6 +131,7 @@ export function AuthProvider({ children }) {
         const u = availableUsers.find((x) => x.id === userId);
         if (!u) throw new Error("Conta não encontrada localmente");
         const session = { id: u.id, name: u.name };
+        setAuthToken(u.token || null);
         setUser(session);
         return session;
       }
@@ -153,7 +171,9 @@ export function AuthProvider({ children }) {
         setAvailableUsers((prev) => {
           const exists = prev.find((p) => p.id === identifier);
           if (exists) {
-            return prev.map((p) => (p.id === identifier ? { ...p, name } : p));
+            return prev.map((p) =>
+              p.id === identifier ? { ...p, name, token: data.token } : p
+            );
           }
 
           const filtered = prev.filter((p) => p.id !== userId);
@@ -164,10 +184,12 @@ export function AuthProvider({ children }) {
               name,
               defaultName: name,
               hasPassword: !!password,
+              token: data.token,
             },
           ];
         });
 
+        setAuthToken(data.token || null);
         const session = { id: identifier, name, identifier };
         setUser(session);
         return session;
@@ -180,6 +202,7 @@ export function AuthProvider({ children }) {
   );
 
   const logout = useCallback(() => {
+    setAuthToken(null);
     setUser(null);
   }, []);
 
@@ -187,6 +210,7 @@ export function AuthProvider({ children }) {
     (userId) => {
       const u = availableUsers.find((x) => x.id === userId);
       if (!u) return;
+      setAuthToken(u.token || null);
       setUser({ id: u.id, name: u.name });
     },
     [availableUsers]
@@ -249,10 +273,12 @@ export function AuthProvider({ children }) {
             name: displayName,
             defaultName: displayName,
             hasPassword: !!password,
+            token: resp.token,
           },
         ];
       });
       if (autoLogin) {
+        setAuthToken(resp.token || null);
         setUser({ id, name: displayName });
       }
       window.dispatchEvent(new CustomEvent("accounts:updated"));
@@ -1,5 +1,13 @@
 const API_BASE = import.meta.env.VITE_API_BASE || "http://localhost:8000";
 
+// last body + ETag per URL for requests made with { revalidate: true };
+// the server answers 304 (empty body) while the data is unchanged
+const revalidated = new Map();
+
+// message lists already held by the UI per account, so a switch back only
+// needs the delta (see getMessagesSince)
+const heldMessages = new Map();
+
 async function safeFetch(path, opts = {}) {
   const url = `${API_BASE}${path}`;
   const options = {
@@ -7,9 +15,23 @@ async function safeFetch(path, opts = {}) {
     headers: Object.assign({ Accept: "application/json" }, opts.headers || {}),
     body: opts.body,
   };
+  const cached = opts.revalidate ? revalidated.get(path) : null;
+  if (cached) options.headers["If-None-Match"] = cached.etag;
 
   try {
     const res = await fetch(url, options);
+    if (res.status === 304 && cached) return cached.data;
+    // expired or revoked session token: drop it (the next login issues a new
+    // one) and send the request once more without it; the server rejects a
+    // bad token before doing anything, so repeating a write is safe
+    if (res.status === 401 && options.headers.Authorization) {
+      dropRejectedToken(options.headers.Authorization);
+      if (!opts.retried) {
+        const headers = Object.assign({}, opts.headers);
+        delete headers.Authorization;
+        return await safeFetch(path, { ...opts, headers, retried: true });
+      }
+    }
     const text = await res.text();
     let data = null;
     try {
@@ -23,12 +45,38 @@ async function safeFetch(path, opts = {}) {
       err.body = data;
       throw err;
     }
+    if (opts.revalidate) {
+      const etag = res.headers.get("ETag");
+      if (etag) revalidated.set(path, { etag, data });
+      else revalidated.delete(path);
+    }
     return data;
   } catch (err) {
     throw err;
   }
 }
 
+// session token returned by /api/auth/login/ (and account creation); sent as
+// a bearer token so the server never has to check the password again
+export function setAuthToken(token) {
+  try {
+    if (token) localStorage.setItem("token", token);
+    else localStorage.removeItem("token");
+  } catch (e) {
+    console.warn("setAuthToken: failed to store token", e);
+  }
+}
+
+// forgets a token the server answered 401 to, here and (through the
+// "auth:token-rejected" event) in the accounts AuthContext keeps
+function dropRejectedToken(header) {
+  const token = header.replace(/^Bearer /, "");
+  if (localStorage.getItem("token") === token) setAuthToken(null);
+  window.dispatchEvent(
+    new CustomEvent("auth:token-rejected", { detail: { token } })
+  );
+}
+
 export function getAuthHeaders() {
   const token =
     localStorage.getItem("token") ||
@@ -71,23 +119,171 @@ export async function getCurrentAccount() {
   );
 }
 
-export async function getMessagesByUser(userId, { page = 1, page_size } = {}) {
+// list pages are requested with shape=compact: values common to every row
+// come once in `shared` and are merged back here
+function expandRows(res) {
+  const shared = (res && res.shared) || {};
+  return (res.results || []).map((row) => ({ ...shared, ...row }));
+}
+
+export async function getMessagesByUser(
+  userId,
+  { page = 1, page_size, search, direction } = {}
+) {
   const qp = new URLSearchParams();
   if (userId) qp.set("user", userId);
   if (page) qp.set("page", page);
   if (page_size) qp.set("page_size", page_size);
+  if (search) qp.set("search", search);
+  if (direction && direction !== "both") qp.set("direction", direction);
+  qp.set("shape", "compact");
   const res = await safeFetch(`/api/messages/?${qp.toString()}`, {
     method: "GET",
+    revalidate: true,
   });
   if (res && typeof res === "object" && Array.isArray(res.results))
-    return res.results;
+    return expandRows(res);
   if (Array.isArray(res)) return res;
   return [];
 }
 
-export async function postMessage({ user, text, userName }) {
+// the most recent messages of an account (oldest -> newest), through the
+// keyset `before=` cursor: no COUNT(*) or OFFSET however long the history is
+export async function getLatestMessages(userId, { page_size } = {}) {
+  const qp = new URLSearchParams({ user: userId, before: "", shape: "compact" });
+  if (page_size) qp.set("page_size", page_size);
+  const res = await safeFetch(`/api/messages/?${qp.toString()}`, {
+    method: "GET",
+    revalidate: true,
+  });
+  return expandRows(res);
+}
+
+export async function getMessagesSince(userId, since) {
+  const results = [];
+  let latest = since;
+  for (;;) {
+    const qp = new URLSearchParams({ user: userId, since: latest, shape: "compact" });
+    const res = await safeFetch(`/api/messages/?${qp.toString()}`, {
+      method: "GET",
+      revalidate: true,
+    });
+    results.push(...expandRows(res));
+    latest = res.latest;
+    if (!res.has_more) break;
+  }
+  return { results, latest };
+}
+
+// replies are written in the background: after a send the UI polls the
+// `since` delta until one arrives. The event stream only makes it show up
+// sooner (its responses are buffered by threaded WSGI workers), so callers
+// abort the wait through `signal` when the stream delivers first.
+export async function waitForReply(
+  userId,
+  sinceId,
+  { onMessages, signal, timeoutMs = 60000 } = {}
+) {
+  const deadline = Date.now() + timeoutMs;
+  let latest = sinceId;
+  for (let delay = 500; Date.now() < deadline; delay = Math.min(delay * 2, 4000)) {
+    await new Promise((resolve) => setTimeout(resolve, delay));
+    if (signal?.aborted) return false;
+    try {
+      const res = await getMessagesSince(userId, latest);
+      if (res.latest != null) latest = res.latest;
+      if (res.results.length && onMessages) onMessages(res.results);
+      if (res.results.some((m) => m.direction === "received")) return true;
+    } catch (e) {
+      console.warn("waitForReply: poll failed", e);
+    }
+  }
+  return false;
+}
+
+export function getHeldMessages(userId) {
+  return heldMessages.get(userId) || null;
+}
+
+export function holdMessages(userId, messages) {
+  heldMessages.set(userId, messages);
+}
+
+export function forgetMessages(userId) {
+  heldMessages.delete(userId);
+  for (const path of revalidated.keys()) {
+    const qp = new URLSearchParams(path.split("?")[1] || "");
+    if (qp.get("user") === userId) revalidated.delete(path);
+  }
+}
+
+// servers without async views answer the stream with 204: EventSource then
+// stops for good and updates come from the `since` polls (waitForReply)
+export function subscribeToMessages(userId, onEvent) {
+  if (!userId || typeof EventSource === "undefined") return () => {};
+  const source = new EventSource(
+    `${API_BASE}/api/messages/stream/?user=${encodeURIComponent(userId)}`
+  );
+  const handler = (e) => {
+    try {
+      onEvent(JSON.parse(e.data));
+    } catch (err) {
+      console.warn("subscribeToMessages: bad event", err);
+    }
+  };
+  ["message.created", "messages.viewed", "history.deleted"].forEach((t) =>
+    source.addEventListener(t, handler)
+  );
+  return () => source.close();
+}
+
+export async function getConversationSummaries(userIds = []) {
+  const ids = userIds.filter(Boolean);
+  if (!ids.length) return [];
+  const res = await safeFetch(
+    `/api/messages/summary/?users=${ids.map(encodeURIComponent).join(",")}`,
+    { method: "GET" }
+  );
+  return res && Array.isArray(res.results) ? res.results : [];
+}
+
+function newIdempotencyKey() {
+  if (globalThis.crypto && crypto.randomUUID) return crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+// the Idempotency-Key makes the retry safe: if the first attempt reached the
+// server, the retry answers with that message instead of sending it twice
+export async function postMessage({ user, text, userName, key = newIdempotencyKey() }) {
   const body = JSON.stringify({ user, text, user_name: userName });
-  return await safeFetch("/api/messages/", {
+  const send = () =>
+    safeFetch("/api/messages/", {
+      method: "POST",
+      headers: Object.assign(
+        {
+          "Content-Type": "application/json; charset=utf-8",
+          "Idempotency-Key": key,
+        },
+        getAuthHeaders()
+      ),
+      body,
+    });
+  try {
+    return await send();
+  } catch (err) {
+    if (err.status) throw err; // the server answered; only network errors are retried
+    return await send();
+  }
+}
+
+// messages queued while offline ([{ text, key? }], oldest first), sent in one request
+export async function postMessageBatch({ user, messages, userName }) {
+  const body = JSON.stringify({
+    user,
+    user_name: userName,
+    messages: messages.map((m) => ({ text: m.text, key: m.key || newIdempotencyKey() })),
+  });
+  const res = await safeFetch("/api/messages/batch/", {
     method: "POST",
     headers: Object.assign(
       { "Content-Type": "application/json; charset=utf-8" },
@@ -95,6 +291,7 @@ export async function postMessage({ user, text, userName }) {
     ),
     body,
   });
+  return res && Array.isArray(res.results) ? res.results : [];
 }
 
 export async function markMessagesViewed(userId) {
@@ -110,6 +307,7 @@ export async function markMessagesViewed(userId) {
 
 export async function deleteHistory(userId) {
   if (!userId) throw new Error("userId required");
+  forgetMessages(userId);
   return await safeFetch("/api/messages/delete_history/", {
     method: "POST",
     headers: Object.assign(
@@ -147,22 +345,33 @@ export async function deleteAccount(identifier) {
 }
 
 export async function loginAccount(identifier, password) {
-  return await safeFetch("/api/auth/login/", {
+  const data = await safeFetch("/api/auth/login/", {
     method: "POST",
     headers: { "Content-Type": "application/json; charset=utf-8" },
     body: JSON.stringify({ identifier, password }),
   });
+  if (data?.token) setAuthToken(data.token);
+  return data;
 }
 
 export default {
   getMessagesByUser,
+  getMessagesSince,
+  waitForReply,
+  getHeldMessages,
+  holdMessages,
+  forgetMessages,
+  subscribeToMessages,
+  getConversationSummaries,
   postMessage,
+  postMessageBatch,
   markMessagesViewed,
   deleteHistory,
   createAccount,
   updateAccount,
   deleteAccount,
   loginAccount,
+  setAuthToken,
   getAuthHeaders,
   getCurrentAccount,
 };